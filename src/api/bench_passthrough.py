@@ -0,0 +1,92 @@
+"""
+Benchmark del camino sin stream del proxy: memoria asignada y latencia por
+solicitud con un upstream simulado (sin red ni GPU).
+
+Uso:
+    python -m src.api.bench_passthrough [solicitudes] [chunks]
+"""
+import sys
+import json
+import time
+import asyncio
+import tracemalloc
+
+import httpx
+
+from src.api import server
+
+CHUNK = " ".join(f"palabra{i % 997}" for i in range(400))
+
+
+def build_payload(chunks: int) -> bytes:
+    context = "\n\n".join(f"[Página {i}] {CHUNK}" for i in range(chunks))
+    return json.dumps({
+        "model": "unsloth/deepseek-r1-distill-qwen-7b",
+        "messages": [
+            {"role": "system", "content": "Eres un asistente basado en RAG."},
+            {"role": "user", "content": f"Contexto:\n{context}\n\nPregunta:\n¿Quién es el autor?"},
+        ],
+        "temperature": 0.1,
+        "max_tokens": 1024,
+    }).encode("utf-8")
+
+
+def fake_upstream(request: httpx.Request) -> httpx.Response:
+    body = json.dumps({
+        "id": "chatcmpl-bench",
+        "object": "chat.completion",
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": CHUNK * 2}}],
+        "usage": {"prompt_tokens": len(request.content) // 4, "completion_tokens": 800},
+    }).encode("utf-8")
+    return httpx.Response(200, content=body, headers={"Content-Type": "application/json"})
+
+
+async def run(requests: int, chunks: int):
+    await server.upstream.start()
+    # El cliente compartido apunta a un upstream simulado en memoria
+    await server.upstream.client.aclose()
+    server.upstream._client = httpx.AsyncClient(transport=httpx.MockTransport(fake_upstream))
+
+    body = build_payload(chunks)
+    headers = {
+        "Authorization": f"Bearer {server.PROXY_API_KEY}",
+        "Content-Type": "application/json",
+        "X-Cache-Bypass": "1",
+    }
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://proxy") as client:
+        async def call():
+            response = await client.post("/v1/chat/completions", content=body, headers=headers)
+            assert response.status_code == 200, response.text
+
+        for _ in range(20):
+            await call()
+
+        start = time.perf_counter()
+        for _ in range(requests):
+            await call()
+        latency = (time.perf_counter() - start) / requests
+
+        # Pico de memoria asignada durante cada solicitud (sobre lo ya asignado)
+        tracemalloc.start()
+        peaks = []
+        for _ in range(requests):
+            tracemalloc.reset_peak()
+            current = tracemalloc.get_traced_memory()[0]
+            await call()
+            peaks.append(tracemalloc.get_traced_memory()[1] - current)
+        tracemalloc.stop()
+
+    await server.upstream.close()
+
+    print(f"payload: {len(body) / 1024:.1f} KiB ({chunks} chunks), {requests} solicitudes")
+    print(f"latencia media: {latency * 1000:.2f} ms")
+    print(f"pico de memoria por solicitud: {sum(peaks) / len(peaks) / 1024:.1f} KiB")
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    asyncio.run(run(
+        requests=int(args[0]) if args else 200,
+        chunks=int(args[1]) if len(args) > 1 else 12,
+    ))
@@ -0,0 +1,174 @@
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Deque, Dict, List, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+class UpstreamHealth:
+    """Último estado conocido de un upstream y su historial de latencias."""
+
+    def __init__(self, url: str, window: int = 20):
+        self.url = url
+        self.status = "unknown"
+        self.checked_at: Optional[float] = None
+        self.error: Optional[str] = None
+        self.consecutive_failures = 0
+        self._latencies: Deque[float] = deque(maxlen=window)
+
+    def record(self, ok: bool, latency: float, error: Optional[str] = None):
+        self.status = "online" if ok else "offline"
+        self.checked_at = time.time()
+        self.error = error
+        if ok:
+            self.consecutive_failures = 0
+            self._latencies.append(latency)
+        else:
+            self.consecutive_failures += 1
+
+    def snapshot(self) -> Dict:
+        ordered = sorted(self._latencies)
+        return {
+            "status": self.status,
+            "checked_at": self.checked_at,
+            "consecutive_failures": self.consecutive_failures,
+            "error": self.error,
+            "latency_ms": {
+                "last": _ms(self._latencies[-1]) if self._latencies else None,
+                "avg": _ms(sum(ordered) / len(ordered)) if ordered else None,
+                "p95": _ms(ordered[min(int(0.95 * len(ordered)), len(ordered) - 1)]) if ordered else None,
+            },
+        }
+
+
+class HealthProber:
+    """
+    Sondea los upstreams en segundo plano a intervalo fijo.
+
+    - El sondeo periódico usa GET /v1/models (no genera tokens ni usa GPU)
+    - /health solo lee el estado en caché, así que responder es inmediato
+      aunque monitores y balanceadores lo consulten muy seguido
+    - `deep_check()` hace una completion real de 1 token, bajo demanda
+    - Marca cada upstream del pool como sano o no para que el balanceo lo evite
+    """
+
+    def __init__(self, client_getter, pool, interval: float = 15.0, timeout: float = 5.0):
+        self._client = client_getter
+        self.pool = pool
+        self.interval = interval
+        self.timeout = timeout
+        self.health = {u.url: UpstreamHealth(u.url) for u in pool.upstreams}
+        self.probes_total = 0
+        self._task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def from_env(cls, client_getter, pool) -> "HealthProber":
+        return cls(
+            client_getter,
+            pool,
+            interval=float(os.getenv("PROXY_HEALTH_INTERVAL", "15")),
+            timeout=float(os.getenv("PROXY_HEALTH_TIMEOUT", "5")),
+        )
+
+    # ------------------------------------------------------------------
+    # Ciclo de vida
+    # ------------------------------------------------------------------
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.probe_all()
+            except Exception as e:
+                logger.error(f"Error en el sondeo de salud: {e}")
+            await asyncio.sleep(self.interval)
+
+    # ------------------------------------------------------------------
+    # Sondeos
+    # ------------------------------------------------------------------
+    async def probe_all(self):
+        """Sondeo ligero de todos los upstreams en paralelo."""
+        await asyncio.gather(*(self._probe(u) for u in self.pool.upstreams))
+        self.probes_total += 1
+
+    async def _probe(self, upstream):
+        health = self.health[upstream.url]
+        start = time.monotonic()
+        try:
+            resp = await self._client().get(_models_url(upstream.url), timeout=self.timeout)
+            ok = resp.status_code == 200
+            health.record(ok, time.monotonic() - start, None if ok else f"HTTP {resp.status_code}")
+        except Exception as e:
+            health.record(False, time.monotonic() - start, str(e) or type(e).__name__)
+
+        if health.status == "online" and not upstream.healthy:
+            logger.info(f"✅ Upstream recuperado: {upstream.url}")
+        elif health.status == "offline" and upstream.healthy:
+            logger.warning(f"❌ Upstream caído: {upstream.url} ({health.error})")
+        upstream.healthy = health.status == "online"
+
+    async def deep_check(self) -> Dict[str, Dict]:
+        """Completion real de 1 token en cada upstream (usa GPU; solo bajo demanda)."""
+        results = await asyncio.gather(*(self._deep_probe(u.url) for u in self.pool.upstreams))
+        return dict(zip((u.url for u in self.pool.upstreams), results))
+
+    async def _deep_probe(self, url: str) -> Dict:
+        # LM Studio requiere un request válido, pero sin messages innecesarios
+        test_payload = {
+            "model": "unsloth/deepseek-r1-distill-qwen-7b",
+            "messages": [{"role": "user", "content": "ping"}],
+            "temperature": 0.1,
+            "max_tokens": 1
+        }
+
+        start = time.monotonic()
+        try:
+            resp = await self._client().post(url, json=test_payload, timeout=self.timeout)
+            if resp.status_code != 200:
+                logger.debug(f"LM Studio responded with {resp.status_code}: {resp.text[:100]}")
+            # Si LM Studio responde (200 o 400 con error del modelo, pero está up)
+            status = "online" if resp.status_code in [200, 400, 422] else "offline"
+            return {"status": status, "http_status": resp.status_code,
+                    "latency_ms": _ms(time.monotonic() - start)}
+        except Exception as e:
+            logger.debug(f"LM Studio connection error: {e}")
+            return {"status": "offline", "error": str(e) or type(e).__name__,
+                    "latency_ms": _ms(time.monotonic() - start)}
+
+    # ------------------------------------------------------------------
+    # Estado en caché
+    # ------------------------------------------------------------------
+    def statuses(self) -> List[str]:
+        return [h.status for h in self.health.values()]
+
+    def snapshot(self) -> Dict[str, Dict]:
+        return {url: h.snapshot() for url, h in self.health.items()}
+
+
+def _models_url(chat_url: str) -> str:
+    """.../v1/chat/completions → .../v1/models"""
+    base = chat_url.rstrip("/")
+    suffix = "/chat/completions"
+    if base.endswith(suffix):
+        base = base[: -len(suffix)]
+    return f"{base}/models"
+
+
+def _ms(seconds: float) -> float:
+    return round(seconds * 1000, 1)
@@ -0,0 +1,100 @@
+import json
+import re
+from typing import Any, Dict, Iterable
+
+# Caracteres estructurales; el contenido de las cadenas se salta con bytes.find
+_STRUCTURAL = re.compile(rb'["{}\[\]:,]')
+_SCALAR = re.compile(rb'[^,}\]\s]*')
+_WHITESPACE = re.compile(rb'\s*')
+
+
+def peek_fields(body: bytes, fields: Iterable[str]) -> Dict[str, Any]:
+    """
+    Lee solo algunos campos de primer nivel de un objeto JSON sin decodificarlo
+    completo: el contenido de las cadenas (prompts, chunks) se salta buscando
+    la comilla de cierre (memchr) y solo se decodifican los valores pedidos.
+
+    Devuelve {campo: valor} para los campos presentes. Lanza ValueError si
+    el cuerpo no es un objeto JSON.
+    """
+    wanted = {f.encode("utf-8"): f for f in fields}
+    result: Dict[str, Any] = {}
+
+    pos = _WHITESPACE.match(body, 0).end()
+    if body[pos:pos + 1] != b"{":
+        raise ValueError("El cuerpo no es un objeto JSON")
+
+    pos += 1
+    depth = 1
+    expect_key = True
+    while depth:
+        match = _STRUCTURAL.search(body, pos)
+        if match is None:
+            raise ValueError("JSON incompleto")
+        char = body[match.start():match.end()]
+        pos = match.end()
+
+        if char == b'"':
+            end = _string_end(body, pos)
+            if depth == 1 and expect_key:
+                key = body[pos:end - 1]
+                expect_key = False
+                colon = _WHITESPACE.match(body, end).end()
+                if key in wanted and body[colon:colon + 1] == b":":
+                    start = _WHITESPACE.match(body, colon + 1).end()
+                    value_end = _value_end(body, start)
+                    result[wanted[key]] = json.loads(body[start:value_end])
+                    if len(result) == len(wanted):
+                        return result
+                    end = value_end
+            pos = end
+        elif char in (b"{", b"["):
+            depth += 1
+        elif char in (b"}", b"]"):
+            depth -= 1
+        elif char == b"," and depth == 1:
+            expect_key = True
+
+    return result
+
+
+def _string_end(body: bytes, pos: int) -> int:
+    """Posición justo después de la comilla que cierra la cadena iniciada en `pos`."""
+    start = pos
+    while True:
+        quote = body.find(b'"', pos)
+        if quote < 0:
+            raise ValueError("Cadena JSON sin cerrar")
+        # La comilla está escapada si la precede un número impar de backslashes
+        backslash = quote
+        while backslash > start and body[backslash - 1] == 0x5C:
+            backslash -= 1
+        if (quote - backslash) % 2 == 0:
+            return quote + 1
+        pos = quote + 1
+
+
+def _value_end(body: bytes, start: int) -> int:
+    """Posición justo después del valor JSON que empieza en `start`."""
+    first = body[start:start + 1]
+    if first == b'"':
+        return _string_end(body, start + 1)
+    if first not in (b"{", b"["):
+        return _SCALAR.match(body, start).end()
+
+    depth = 0
+    pos = start
+    while True:
+        match = _STRUCTURAL.search(body, pos)
+        if match is None:
+            raise ValueError("JSON incompleto")
+        char = body[match.start():match.end()]
+        pos = match.end()
+        if char == b'"':
+            pos = _string_end(body, pos)
+        elif char in (b"{", b"["):
+            depth += 1
+        elif char in (b"}", b"]"):
+            depth -= 1
+            if depth == 0:
+                return pos
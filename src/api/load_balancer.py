@@ -0,0 +1,246 @@
+import os
+import asyncio
+from collections import deque
+from typing import Deque, Dict, List, Optional
+
+
+class QueueFullError(Exception):
+    """La cola de espera está llena: la solicitud se rechaza de inmediato (429)."""
+
+
+class AdmissionTimeout(Exception):
+    """La solicitud esperó en cola más de lo permitido sin obtener upstream (429)."""
+
+
+class LatencyTracker:
+    """Ventana deslizante de latencias exitosas para estimar percentiles (p95)."""
+
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self._samples: Deque[float] = deque(maxlen=window)
+        self.min_samples = min_samples
+
+    def observe(self, seconds: float):
+        self._samples.append(seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Percentil q (0-1); None mientras no haya muestras suficientes."""
+        if len(self._samples) < self.min_samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+class Upstream:
+    """Un servidor LLM (LM Studio u otro OpenAI-compatible) dentro del pool."""
+
+    def __init__(self, url: str, max_concurrency: int):
+        self.url = url
+        self.max_concurrency = max_concurrency
+        self.outstanding = 0
+        self.requests_total = 0
+        self.errors_total = 0
+        # Lo actualiza el sondeo de salud en segundo plano
+        self.healthy = True
+
+    @property
+    def has_capacity(self) -> bool:
+        return self.outstanding < self.max_concurrency
+
+    def stats(self) -> Dict:
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "outstanding": self.outstanding,
+            "max_concurrency": self.max_concurrency,
+            "requests_total": self.requests_total,
+            "errors_total": self.errors_total,
+        }
+
+
+class UpstreamPool:
+    """
+    Pool de upstreams LLM con balanceo y control de admisión.
+
+    - Balanceo por menor número de solicitudes en curso (least outstanding)
+    - Límite de concurrencia por upstream
+    - Los upstreams marcados como caídos se evitan mientras haya alguno sano
+    - Cola de espera acotada: si está llena se responde 429 de inmediato
+    - Planificación justa por API key: las solicitudes en espera se atienden
+      en round-robin entre keys, así un cliente con ráfagas no acapara la GPU
+
+    La capacidad total es la suma de `max_concurrency` de cada upstream, así
+    que escalar es agregar URLs a LMSTUDIO_URLS.
+    Todo corre en el event loop (sin hilos), por lo que no necesita locks.
+    """
+
+    def __init__(
+        self,
+        urls: List[str],
+        max_concurrency: int = 4,
+        max_queue: int = 64,
+        queue_timeout: float = 30.0,
+        hedge: bool = True,
+        hedge_percentile: float = 0.95,
+        hedge_min_samples: int = 20,
+    ):
+        if not urls:
+            raise ValueError("UpstreamPool necesita al menos una URL de upstream.")
+
+        self.upstreams = [Upstream(url, max_concurrency) for url in urls]
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+
+        # Cola justa: una cola por API key + turno round-robin entre keys
+        self._waiters: Dict[str, Deque[asyncio.Future]] = {}
+        self._turns: Deque[str] = deque()
+        self._waiting = 0
+
+        self.rejected_total = 0
+        self.timeouts_total = 0
+
+        # Hedging: si una solicitud supera el p95 se duplica en otro upstream
+        self.hedge = hedge and len(self.upstreams) > 1
+        self.hedge_percentile = hedge_percentile
+        self.latency = LatencyTracker(min_samples=hedge_min_samples)
+        self.hedges_total = 0
+        self.hedge_wins_total = 0
+
+    @classmethod
+    def from_env(cls, default_url: str) -> "UpstreamPool":
+        urls = [u.strip() for u in os.getenv("LMSTUDIO_URLS", "").split(",") if u.strip()]
+        return cls(
+            urls=urls or [default_url],
+            max_concurrency=int(os.getenv("PROXY_UPSTREAM_CONCURRENCY", "4")),
+            max_queue=int(os.getenv("PROXY_MAX_QUEUE", "64")),
+            queue_timeout=float(os.getenv("PROXY_QUEUE_TIMEOUT", "30")),
+            hedge=os.getenv("PROXY_HEDGE", "1").lower() in ("1", "true", "yes"),
+            hedge_percentile=float(os.getenv("PROXY_HEDGE_PERCENTILE", "0.95")),
+            hedge_min_samples=int(os.getenv("PROXY_HEDGE_MIN_SAMPLES", "20")),
+        )
+
+    # ------------------------------------------------------------------
+    # Admisión
+    # ------------------------------------------------------------------
+    async def acquire(self, key: str = "", timeout: Optional[float] = None) -> Upstream:
+        """
+        Obtiene un upstream con capacidad. Si no hay, espera en la cola de su
+        API key; lanza QueueFullError o AdmissionTimeout para responder 429.
+        `timeout` acota la espera (p. ej. al tiempo restante de la solicitud).
+        """
+        upstream = self._pick()
+        if upstream is not None and not self._waiting:
+            self._assign(upstream)
+            return upstream
+
+        if self._waiting >= self.max_queue:
+            self.rejected_total += 1
+            raise QueueFullError("Cola de espera llena")
+
+        future = asyncio.get_running_loop().create_future()
+        if key not in self._waiters:
+            self._waiters[key] = deque()
+            self._turns.append(key)
+        self._waiters[key].append(future)
+        self._waiting += 1
+
+        acquired = None
+        try:
+            wait = self.queue_timeout if timeout is None else min(timeout, self.queue_timeout)
+            acquired = await asyncio.wait_for(future, wait)
+            return acquired
+        except asyncio.TimeoutError:
+            self.timeouts_total += 1
+            raise AdmissionTimeout("Tiempo de espera en cola agotado")
+        finally:
+            if not future.done() or future.cancelled():
+                self._discard(key, future)
+            elif acquired is None:
+                # Recibió upstream justo al expirar o ser cancelada: devolverlo
+                self.release(future.result())
+
+    def try_acquire(self, exclude: Optional[Upstream] = None) -> Optional[Upstream]:
+        """
+        Upstream libre distinto de `exclude`, sin esperar (None si no hay).
+        Los duplicados de hedging nunca le quitan turno a la cola.
+        """
+        if self._waiting:
+            return None
+        upstream = self._pick(exclude)
+        if upstream is not None:
+            self._assign(upstream)
+        return upstream
+
+    def hedge_delay(self) -> Optional[float]:
+        """Espera antes de duplicar una solicitud (p95 observado) o None."""
+        if not self.hedge:
+            return None
+        return self.latency.percentile(self.hedge_percentile)
+
+    def release(self, upstream: Upstream, error: bool = False):
+        """Libera el slot del upstream y atiende a la siguiente solicitud en cola."""
+        upstream.outstanding -= 1
+        if error:
+            upstream.errors_total += 1
+        self._dispatch()
+
+    def _pick(self, exclude: Optional[Upstream] = None) -> Optional[Upstream]:
+        # Si el sondeo marcó todos como caídos se intenta igual con todos
+        usable = [u for u in self.upstreams if u.healthy] or self.upstreams
+        candidates = [u for u in usable if u.has_capacity and u is not exclude]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda u: (u.outstanding, u.requests_total))
+
+    def _assign(self, upstream: Upstream):
+        upstream.outstanding += 1
+        upstream.requests_total += 1
+
+    def _dispatch(self):
+        while self._turns:
+            upstream = self._pick()
+            if upstream is None:
+                return
+
+            key = self._turns.popleft()
+            queue = self._waiters[key]
+            future = queue.popleft()
+            self._waiting -= 1
+
+            # La key vuelve al final de la fila si aún tiene solicitudes
+            if queue:
+                self._turns.append(key)
+            else:
+                del self._waiters[key]
+
+            if future.done():
+                continue
+            self._assign(upstream)
+            future.set_result(upstream)
+
+    def _discard(self, key: str, future: asyncio.Future):
+        queue = self._waiters.get(key)
+        if queue is None or future not in queue:
+            return
+        queue.remove(future)
+        self._waiting -= 1
+        if not queue:
+            del self._waiters[key]
+            self._turns.remove(key)
+
+    # ------------------------------------------------------------------
+    # Métricas
+    # ------------------------------------------------------------------
+    def stats(self) -> Dict:
+        return {
+            "upstreams": [u.stats() for u in self.upstreams],
+            "capacity": sum(u.max_concurrency for u in self.upstreams),
+            "outstanding": sum(u.outstanding for u in self.upstreams),
+            "queued": self._waiting,
+            "queued_keys": len(self._waiters),
+            "max_queue": self.max_queue,
+            "rejected_total": self.rejected_total,
+            "timeouts_total": self.timeouts_total,
+            "hedge_delay": self.hedge_delay(),
+            "hedges_total": self.hedges_total,
+            "hedge_wins_total": self.hedge_wins_total,
+        }
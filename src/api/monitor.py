@@ -14,6 +14,8 @@ async def monitor():
                 # Proxy health
                 resp1 = await client.get("http://localhost:8001/health")
                 proxy_ok = resp1.status_code == 200
+                pool = resp1.json().get("pool", {}) if proxy_ok else {}
+                cache = resp1.json().get("cache", {}) if proxy_ok else {}
                 
                 # LM Studio health
                 resp2 = await client.get("http://127.0.0.1:1234/v1/health")
@@ -21,6 +23,14 @@ async def monitor():
                 
                 status = "✅" if (proxy_ok and lm_ok) else "❌"
                 logger.info(f"{status} [{datetime.now()}] Proxy:{proxy_ok} LM:{lm_ok}")
+                if pool:
+                    logger.info(f"   Pool: conexiones={pool.get('connections_open')} "
+                                f"(idle={pool.get('connections_idle')}) "
+                                f"en curso={pool.get('in_flight')} pico={pool.get('in_flight_peak')} "
+                                f"errores={pool.get('errors_total')}")
+                if cache.get("enabled"):
+                    logger.info(f"   Caché: aciertos={cache.get('hits')} coalescidas={cache.get('coalesced')} "
+                                f"fallos={cache.get('misses')} tasa={cache.get('hit_rate', 0):.0%}")
         except Exception as e:
             logger.error(f"❌ Error: {e}")
         
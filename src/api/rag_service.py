@@ -0,0 +1,300 @@
+from fastapi import FastAPI, Request, HTTPException
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from pydantic import BaseModel
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+import os
+import json
+import time
+import asyncio
+import logging
+
+from src.api.sessions import SessionStore
+from src.config import RAGConfig
+from src.deadline import DEADLINE_HEADER, Deadline, DeadlineExceeded
+from src.metrics import CONTENT_TYPE, REGISTRY, collect_stats
+from src.retrieval.index_versions import IndexVersions
+
+# =========================
+# Logging
+# =========================
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+# =========================
+# Configuración
+# =========================
+config = RAGConfig()
+
+app = FastAPI(
+    title="RAG Service",
+    description="API HTTP asíncrona del pipeline RAG (índice compartido, memoria por sesión)",
+    version="1.0.0"
+)
+
+
+class PipelineState:
+    """
+    Pipeline RAG compartido por todas las sesiones del proceso. El índice es
+    versionado (IndexVersions): se puede recargar sin reiniciar el servicio
+    y las sesiones conservan su historial a través de las recargas.
+    """
+
+    def __init__(self):
+        self.versions: Optional[IndexVersions] = None
+        self.executor: Optional[ThreadPoolExecutor] = None
+        # Cada sesión recibe su historial acotado (se crea ya con el pipeline cargado)
+        self.sessions = SessionStore(
+            ttl=config.session_ttl,
+            max_sessions=config.max_sessions,
+            memory_factory=lambda: self.rag.new_memory()
+        )
+
+    @property
+    def current(self):
+        return self.versions.current if self.versions is not None else None
+
+    @property
+    def rag(self):
+        return self.current.rag if self.current is not None else None
+
+    @property
+    def indexer(self):
+        return self.current.indexer if self.current is not None else None
+
+
+state = PipelineState()
+
+
+def load_pipeline():
+    """
+    Carga corpus, índice y modelo. Se puede llamar antes de crear los workers
+    (run_rag_service.py) para que todos compartan el índice ya cargado.
+    """
+    if state.rag is not None:
+        return
+    from src.main import index_versions
+
+    state.versions = index_versions(
+        config,
+        config.rag_service_architecture,
+        config.rag_service_model
+    )
+    current = state.versions.load()
+    logger.info(f"📚 Pipeline listo: {current.architecture.upper()} + {current.model.upper()}")
+
+
+# =========================
+# Middleware de Auth
+# =========================
+@app.middleware("http")
+async def verify_api_key(request: Request, call_next):
+    # Sin RAG_SERVICE_API_KEY el servicio es abierto; /health y /metrics siempre lo son
+    if not config.rag_service_api_key or request.url.path in ("/health", "/metrics"):
+        return await call_next(request)
+
+    auth = request.headers.get("Authorization", "")
+    if auth != f"Bearer {config.rag_service_api_key}":
+        logger.warning(f"API key inválida o ausente desde {request.client.host}")
+        return JSONResponse(status_code=401, content={"detail": "Invalid API key"})
+
+    return await call_next(request)
+
+
+# =========================
+# Modelos
+# =========================
+class QueryRequest(BaseModel):
+    query: str
+    session_id: Optional[str] = None
+    stream: bool = False
+
+
+# =========================
+# Health / métricas
+# =========================
+@app.get("/health")
+async def health_check():
+    current = state.current
+    return {
+        "status": "ready" if current is not None else "loading",
+        "pid": os.getpid(),
+        "architecture": current.architecture if current else None,
+        "model": current.model if current else None,
+        "index_version": current.number if current else None,
+        "corpus_version": current.corpus_version if current else None,
+        "threads": config.rag_service_threads,
+        "sessions": state.sessions.stats()
+    }
+
+
+@app.get("/metrics")
+async def metrics():
+    return Response(content=REGISTRY.render(), media_type=CONTENT_TYPE)
+
+
+REGISTRY.register_collector(lambda: collect_stats(
+    "rag_service_sessions", state.sessions.stats(),
+    counters=("created_total", "expired_total"), gauges=("active",),
+    help="Sesiones del servicio RAG"
+))
+
+
+def _graph_retrieval_samples():
+    # Solo Graph-RAG tiene orquestador (FAISS + grafo)
+    orchestrator = getattr(state.rag, "orchestrator", None)
+    if orchestrator is None:
+        return []
+    return collect_stats(
+        "rag_graph_retrieval", orchestrator.stats(),
+        counters=(), gauges=("open", "failures"),
+        help="Circuit breaker del grafo"
+    )
+
+
+REGISTRY.register_collector(_graph_retrieval_samples)
+REGISTRY.register_collector(lambda: collect_stats(
+    "rag_index", state.versions.stats(),
+    counters=(), gauges=("version", "readers", "building", "hot_reload", "retired_pending", "retired_readers"),
+    help="Versiones del índice"
+) if state.versions is not None else [])
+
+# =========================
+# Consultas
+# =========================
+@app.post("/v1/query")
+async def query(body: QueryRequest, request: Request):
+    """
+    Responde una consulta dentro de una sesión (se crea si no se indica).
+    Usa el camino async del RAG (agenerate_response): la espera al LLM no
+    ocupa un hilo, así que el event loop sostiene muchas consultas en vuelo;
+    la recuperación y el empaquetado (CPU) corren en el pool de hilos.
+    Con `stream: true` responde SSE con un evento por token.
+    """
+    if state.rag is None:
+        raise HTTPException(status_code=503, detail="Pipeline loading")
+    if not body.query.strip():
+        raise HTTPException(status_code=400, detail="Empty query")
+
+    deadline = Deadline.from_header(
+        request.headers.get(DEADLINE_HEADER),
+        default=config.request_timeout
+    )
+    session = state.sessions.get(body.session_id)
+
+    if body.stream:
+        return StreamingResponse(
+            _stream_answer(session, body.query, deadline),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+
+    start = time.perf_counter()
+    try:
+        # Las consultas de una misma sesión se atienden en orden
+        # La consulta se atiende completa con la versión del índice vigente al empezar
+        async with session.lock:
+            with state.versions.acquire() as version:
+                answer = await version.rag.agenerate_response(body.query, deadline=deadline, memory=session.memory)
+            session.queries += 1
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error en la consulta: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    return {
+        "session_id": session.session_id,
+        "answer": answer,
+        "latency_ms": round((time.perf_counter() - start) * 1000, 1)
+    }
+
+
+async def _stream_answer(session, query: str, deadline: Deadline):
+    """Itera el generador async del RAG y emite eventos SSE."""
+    async with session.lock:
+        with state.versions.acquire() as version:
+            tokens = version.rag.agenerate_response_stream(query, deadline=deadline, memory=session.memory)
+            try:
+                yield _sse({"session_id": session.session_id})
+                async for token in tokens:
+                    yield _sse({"token": token})
+                session.queries += 1
+            except Exception as e:
+                logger.error(f"Error en la consulta (stream): {e}")
+                yield _sse({"error": str(e)})
+            finally:
+                # Si el cliente se desconecta, cerrar el generador corta el stream del LLM
+                await tokens.aclose()
+    yield "data: [DONE]\n\n"
+
+
+def _sse(data: dict) -> str:
+    return f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.post("/v1/index/reload", status_code=202)
+async def reload_index():
+    """
+    Construye una versión nueva del índice en segundo plano y la publica en
+    caliente; las consultas en curso terminan con la versión anterior.
+    Con varios workers, cada proceso tiene su propio índice: para recargarlos
+    todos conviene INDEX_WATCH_INTERVAL.
+    """
+    if state.versions is None:
+        raise HTTPException(status_code=503, detail="Pipeline loading")
+    reason = state.versions.reload_unsupported()
+    if reason is not None:
+        raise HTTPException(status_code=409, detail=reason)
+    if not state.versions.reload():
+        raise HTTPException(status_code=409, detail="Index reload already in progress")
+    return {"status": "building", "current_version": state.current.number}
+
+
+@app.get("/v1/index")
+async def index_status():
+    if state.versions is None:
+        raise HTTPException(status_code=503, detail="Pipeline loading")
+    return state.versions.stats()
+
+
+@app.delete("/v1/sessions/{session_id}")
+async def delete_session(session_id: str):
+    if not state.sessions.delete(session_id):
+        raise HTTPException(status_code=404, detail="Session not found")
+    return {"deleted": session_id}
+
+
+# =========================
+# Startup
+# =========================
+@app.on_event("startup")
+async def startup():
+    # El pool de hilos se crea en cada proceso (después del fork de los workers).
+    # Es el executor por defecto del loop (asyncio.to_thread): ahí corre el
+    # trabajo de CPU de cada consulta (ranking FAISS / grafo, empaquetado del
+    # contexto) y la carga del pipeline; el event loop solo espera E/S.
+    loop = asyncio.get_running_loop()
+    state.executor = ThreadPoolExecutor(
+        max_workers=config.rag_service_threads,
+        thread_name_prefix="rag"
+    )
+    loop.set_default_executor(state.executor)
+    if state.rag is None:
+        await loop.run_in_executor(state.executor, load_pipeline)
+    # Hilo de vigilancia por proceso (los hilos no sobreviven al fork de los workers)
+    state.versions.watch(config.corpus_path, config.index_watch_interval)
+    logger.info(f"🚀 Servicio RAG (pid {os.getpid()}) con {config.rag_service_threads} hilos")
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    current = state.current
+    if current is not None and current.architecture == "graph" and config.graph_backend != "embedded":
+        from src.indexing.neo4j_connection import Neo4jDriverManager
+        await Neo4jDriverManager.aclose_all()
+    # Pools HTTP de los backends LLM, en el mismo loop que abrió las conexiones async
+    from src.generation.llm_clients import LLMClient
+    await LLMClient.aclose_all()
+    if state.executor is not None:
+        state.executor.shutdown(wait=False)
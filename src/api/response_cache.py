@@ -0,0 +1,162 @@
+import os
+import json
+import time
+import hashlib
+import asyncio
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+# Header por solicitud para saltarse la caché (también se respeta
+# `Cache-Control: no-cache` / `no-store`)
+CACHE_BYPASS_HEADER = "X-Cache-Bypass"
+# Header de respuesta: HIT, MISS, COALESCED o BYPASS
+CACHE_STATUS_HEADER = "X-Cache"
+
+
+class CachedResponse:
+    """Respuesta de LM Studio ya leída (bytes sin decodificar), lista para reenviar o reutilizar."""
+
+    __slots__ = ("status_code", "content", "media_type")
+
+    def __init__(self, status_code: int, content: bytes, media_type: str = "application/json"):
+        self.status_code = status_code
+        self.content = content
+        self.media_type = media_type
+
+
+class ResponseCache:
+    """
+    Caché de respuestas del proxy para payloads idénticos.
+
+    - Clave: hash SHA-256 del payload canónico (el cuerpo se reenvía tal cual;
+      solo se decodifica aquí, en el camino cacheable)
+    - Solo respuestas 200, con TTL y tamaño máximo (se expulsa la menos usada)
+    - Coalescencia: solicitudes idénticas en curso comparten una sola llamada
+      al upstream; las demás esperan su resultado
+    - Métricas de aciertos, fallos, coalescencias y bypass
+
+    Todo corre en el event loop (sin hilos), por lo que no necesita locks.
+    """
+
+    def __init__(self, ttl: float = 300.0, max_entries: int = 512, enabled: bool = True):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.enabled = enabled and ttl > 0 and max_entries > 0
+
+        self._entries: "OrderedDict[str, Tuple[float, CachedResponse]]" = OrderedDict()
+        self._in_flight: Dict[str, asyncio.Future] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.bypassed = 0
+        self.expired = 0
+
+    @classmethod
+    def from_env(cls) -> "ResponseCache":
+        return cls(
+            ttl=float(os.getenv("PROXY_CACHE_TTL", "300")),
+            max_entries=int(os.getenv("PROXY_CACHE_MAX_ENTRIES", "512")),
+            enabled=os.getenv("PROXY_CACHE", "1").lower() in ("1", "true", "yes"),
+        )
+
+    # ------------------------------------------------------------------
+    # Clave y bypass
+    # ------------------------------------------------------------------
+    @staticmethod
+    def key(body: bytes) -> str:
+        """
+        Hash del payload canónico: el orden de claves y el formato no importan,
+        así que clientes que serializan distinto comparten entrada y coalescencia.
+        Cuesta decodificar el JSON, pero solo en solicitudes cacheables (sin
+        stream ni bypass); upstream sigue recibiendo los bytes originales.
+        Lanza ValueError si el cuerpo no es JSON válido.
+        """
+        payload = json.loads(body)
+        canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def bypass_requested(headers) -> bool:
+        if headers.get(CACHE_BYPASS_HEADER, "").lower() in ("1", "true", "yes"):
+            return True
+        cache_control = headers.get("Cache-Control", "").lower()
+        return "no-cache" in cache_control or "no-store" in cache_control
+
+    # ------------------------------------------------------------------
+    # Consulta
+    # ------------------------------------------------------------------
+    async def get_or_fetch(
+        self,
+        key: str,
+        fetch: Callable[[], Awaitable[CachedResponse]]
+    ) -> Tuple[CachedResponse, str]:
+        """
+        Devuelve (respuesta, estado) donde estado es HIT, COALESCED o MISS.
+        En MISS se llama a `fetch()` una sola vez aunque lleguen varias
+        solicitudes idénticas mientras tanto.
+        """
+        cached = self._get(key)
+        if cached is not None:
+            self.hits += 1
+            return cached, "HIT"
+
+        task = self._in_flight.get(key)
+        if task is not None:
+            self.coalesced += 1
+            # shield: si este cliente se va, la llamada compartida sigue
+            return await asyncio.shield(task), "COALESCED"
+
+        self.misses += 1
+        task = asyncio.ensure_future(fetch())
+        self._in_flight[key] = task
+        task.add_done_callback(lambda t: self._on_done(key, t))
+        return await asyncio.shield(task), "MISS"
+
+    def bypass(self):
+        self.bypassed += 1
+
+    def _get(self, key: str) -> Optional[CachedResponse]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        stored_at, response = entry
+        if time.monotonic() - stored_at > self.ttl:
+            del self._entries[key]
+            self.expired += 1
+            return None
+        self._entries.move_to_end(key)
+        return response
+
+    def _on_done(self, key: str, task: asyncio.Future):
+        self._in_flight.pop(key, None)
+        if task.cancelled() or task.exception() is not None:
+            return
+        response = task.result()
+        if response.status_code == 200:
+            self._entries[key] = (time.monotonic(), response)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+    # ------------------------------------------------------------------
+    # Métricas
+    # ------------------------------------------------------------------
+    def stats(self) -> Dict:
+        lookups = self.hits + self.coalesced + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "in_flight": len(self._in_flight),
+            "hits": self.hits,
+            "coalesced": self.coalesced,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "expired": self.expired,
+            "hit_rate": (self.hits + self.coalesced) / lookups if lookups else 0.0,
+        }
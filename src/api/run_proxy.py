@@ -1,5 +1,5 @@
 import uvicorn
-from src.api.server import app
+from src.api.server import app, pool
 from src.config import RAGConfig
 import logging
 
@@ -13,7 +13,8 @@ if __name__ == "__main__":
     logger.info("Iniciando Proxy RAG Distribuido")
     logger.info("=" * 60)
     logger.info(f"Puerto        : {config.proxy_port}")
-    logger.info(f"LM Studio URL : {config.lmstudio_url}")
+    for u in pool.upstreams:
+        logger.info(f"LM Studio URL : {u.url}")
     logger.info(f"API Key       : {config.proxy_api_key[:10]}***")
     logger.info("=" * 60)
     
@@ -0,0 +1,85 @@
+import os
+import signal
+import socket
+import logging
+
+import uvicorn
+
+from src.api import rag_service
+from src.api.rag_service import app, config, load_pipeline
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def serve(sock: socket.socket):
+    server = uvicorn.Server(uvicorn.Config(app, log_level="info"))
+    server.run(sockets=[sock])
+
+
+def run_workers(workers: int, port: int):
+    """
+    Carga el índice una vez en el proceso padre y luego crea `workers`
+    procesos con fork: todos comparten en copy-on-write el corpus, los
+    embeddings y el modelo ya cargados, y aceptan conexiones del mismo socket.
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(("0.0.0.0", port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+
+    load_pipeline()
+
+    children = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            serve(sock)
+            os._exit(0)
+        children.append(pid)
+    logger.info(f"Workers: {children}")
+
+    def stop(signum, frame):
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    for pid in children:
+        try:
+            os.waitpid(pid, 0)
+        except ChildProcessError:
+            pass
+
+    if rag_service.state.indexer is not None:
+        rag_service.state.indexer.close()
+
+
+if __name__ == "__main__":
+    workers = max(config.rag_service_workers, 1)
+
+    logger.info("=" * 60)
+    logger.info("Iniciando Servicio RAG")
+    logger.info("=" * 60)
+    logger.info(f"Puerto        : {config.rag_service_port}")
+    logger.info(f"Arquitectura  : {config.rag_service_architecture.upper()} + {config.rag_service_model.upper()}")
+    logger.info(f"Corpus        : {config.corpus_path}")
+    logger.info(f"Workers       : {workers} x {config.rag_service_threads} hilos")
+    logger.info("=" * 60)
+
+    if workers > 1 and hasattr(os, "fork"):
+        run_workers(workers, config.rag_service_port)
+    else:
+        load_pipeline()
+        uvicorn.run(
+            app,
+            host="0.0.0.0",
+            port=config.rag_service_port,
+            log_level="info"
+        )
@@ -1,11 +1,21 @@
 from fastapi import FastAPI, Request, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import Response, StreamingResponse
 import httpx
 import os
+import time
+import asyncio
 import logging
 from dotenv import load_dotenv
 
+from src.api.health import HealthProber
+from src.api.json_peek import peek_fields
+from src.api.load_balancer import AdmissionTimeout, QueueFullError, UpstreamPool
+from src.api.response_cache import CACHE_STATUS_HEADER, CachedResponse, ResponseCache
+from src.api.upstream import UpstreamClient
+from src.deadline import DEADLINE_HEADER, Deadline, DeadlineExceeded
+from src.metrics import CONTENT_TYPE, REGISTRY, collect_stats
+
 load_dotenv()
 
 # =========================
@@ -19,8 +29,34 @@ logging.basicConfig(level=logging.INFO)
 # =========================
 LMSTUDIO_URL = os.getenv("LMSTUDIO_URL", "http://127.0.0.1:1234/v1/chat/completions")
 PROXY_API_KEY = os.getenv("PROXY_API_KEY", "ESIA3")
+JSON_HEADERS = {"Content-Type": "application/json"}
 PROXY_PORT = int(os.getenv("PROXY_PORT", "8001"))
 
+# Keys adicionales (separadas por coma); cada key tiene su propia cola justa
+PROXY_API_KEYS = {PROXY_API_KEY} | {
+    k.strip() for k in os.getenv("PROXY_API_KEYS", "").split(",") if k.strip()
+}
+
+# Cliente upstream compartido (pool keep-alive); se abre en startup
+upstream = UpstreamClient.from_env()
+
+# Servidores LLM (LMSTUDIO_URLS) con balanceo y control de admisión
+pool = UpstreamPool.from_env(default_url=LMSTUDIO_URL)
+
+# Caché de respuestas idénticas + coalescencia de solicitudes en curso
+cache = ResponseCache.from_env()
+
+# Sondeo de salud en segundo plano; /health solo lee su estado en caché
+prober = HealthProber.from_env(lambda: upstream.client, pool)
+
+# Métricas Prometheus (GET /metrics)
+PROXY_REQUESTS = REGISTRY.counter("proxy_requests_total", "Solicitudes a /v1/chat/completions por status, stream y caché")
+PROXY_REQUEST_SECONDS = REGISTRY.histogram("proxy_request_seconds", "Latencia del proxy hasta enviar la respuesta (en stream: hasta los headers)")
+PROXY_QUEUE_WAIT_SECONDS = REGISTRY.histogram("proxy_queue_wait_seconds", "Espera en la cola de admisión")
+PROXY_UPSTREAM_SECONDS = REGISTRY.histogram("proxy_upstream_seconds", "Duración de la llamada al upstream (en stream: hasta el último chunk)")
+PROXY_TTFT_SECONDS = REGISTRY.histogram("proxy_ttft_seconds", "Tiempo al primer chunk en respuestas en stream")
+PROXY_TOKENS = REGISTRY.counter("proxy_tokens_total", "Tokens procesados (usage del upstream; en stream se estima un token por evento SSE)")
+
 if not PROXY_API_KEY or PROXY_API_KEY == "ESIA3":
     logger.warning("⚠️  PROXY_API_KEY usando valor por defecto. Establece en .env para producción.")
 
@@ -46,8 +82,8 @@ app.add_middleware(
 # =========================
 @app.middleware("http")
 async def verify_api_key(request: Request, call_next):
-    # Permitir /health sin autenticación
-    if request.url.path == "/health":
+    # Permitir /health y /metrics sin autenticación
+    if request.url.path in ("/health", "/metrics"):
         return await call_next(request)
     
     auth = request.headers.get("Authorization")
@@ -57,10 +93,11 @@ async def verify_api_key(request: Request, call_next):
         raise HTTPException(status_code=401, detail="Missing API key")
 
     token = auth.split(" ")[1]
-    if token != PROXY_API_KEY:
+    if token not in PROXY_API_KEYS:
         logger.warning(f"API key inválida desde {request.client.host}")
         raise HTTPException(status_code=403, detail="Invalid API key")
 
+    request.state.api_key = token
     return await call_next(request)
 
 # =========================
@@ -68,48 +105,81 @@ async def verify_api_key(request: Request, call_next):
 # =========================
 @app.get("/health")
 async def health_check():
-    """Verifica que el proxy y LM Studio están disponibles (sin auth)"""
-    try:
-        async with httpx.AsyncClient(timeout=5) as client:
-            # LM Studio requiere un request válido, pero sin messages innecesarios
-            # Intentar con payload mínimo
-            test_payload = {
-                "model": "unsloth/deepseek-r1-distill-qwen-7b",
-                "messages": [{"role": "user", "content": "ping"}],
-                "temperature": 0.1,
-                "max_tokens": 1
-            }
-            
-            try:
-                resp = await client.post(
-                    LMSTUDIO_URL,
-                    json=test_payload,
-                    timeout=5
-                )
-                # Si LM Studio responde (200 o 400 con error del modelo, pero está up)
-                lm_ok = resp.status_code in [200, 400, 422]
-                lm_status = "online" if lm_ok else "offline"
-                
-                if resp.status_code != 200:
-                    logger.debug(f"LM Studio responded with {resp.status_code}: {resp.text[:100]}")
-            except Exception as inner_e:
-                logger.debug(f"LM Studio connection error: {inner_e}")
-                lm_ok = False
-                lm_status = "offline"
-        
-        return {
-            "status": "healthy" if lm_ok else "degraded",
-            "proxy": "online",
-            "lmstudio": lm_status
-        }
-    except Exception as e:
-        logger.error(f"Health check error: {e}")
-        return {
-            "status": "degraded",
-            "proxy": "online",
-            "lmstudio": "offline",
-            "error": str(e)
-        }
+    """
+    Estado del proxy y de los LM Studio del pool (sin auth).
+    Lee el resultado del último sondeo en segundo plano: no toca la GPU.
+    """
+    statuses = prober.statuses()
+    all_ok = all(status == "online" for status in statuses)
+    any_ok = any(status == "online" for status in statuses)
+
+    return {
+        "status": "healthy" if all_ok else "degraded",
+        "proxy": "online",
+        "lmstudio": "online" if any_ok else "offline",
+        "upstreams": prober.snapshot(),
+        "probe_interval": prober.interval,
+        "pool": upstream.stats(),
+        "balancer": pool.stats(),
+        "cache": cache.stats()
+    }
+
+
+@app.get("/health/deep")
+async def health_deep():
+    """Completion real de 1 token en cada upstream (requiere API key; usa GPU)."""
+    results = await prober.deep_check()
+    all_ok = all(r["status"] == "online" for r in results.values())
+    return {
+        "status": "healthy" if all_ok else "degraded",
+        "upstreams": results
+    }
+
+# =========================
+# Métricas
+# =========================
+@app.get("/metrics")
+async def metrics():
+    """Métricas en formato de texto Prometheus (sin auth)."""
+    return Response(content=REGISTRY.render(), media_type=CONTENT_TYPE)
+
+
+def _collect_proxy_metrics():
+    # Se evalúa en cada scrape: lee los contadores que ya llevan pool, balanceo y caché
+    samples = collect_stats(
+        "proxy_upstream_pool", upstream.stats(),
+        counters=("requests_total", "errors_total"),
+        gauges=("in_flight", "in_flight_peak", "connections_open", "connections_idle"),
+        help="Pool de conexiones HTTP al upstream"
+    )
+    balancer = pool.stats()
+    samples += collect_stats(
+        "proxy_balancer", balancer,
+        counters=("rejected_total", "timeouts_total", "hedges_total", "hedge_wins_total"),
+        gauges=("capacity", "outstanding", "queued", "queued_keys"),
+        help="Balanceo y cola de admisión"
+    )
+    statuses = dict(zip((u.url for u in pool.upstreams), prober.statuses()))
+    for u in balancer["upstreams"]:
+        labels = {"upstream": u["url"]}
+        samples += collect_stats(
+            "proxy_upstream", u,
+            counters=("requests_total", "errors_total"),
+            gauges=("outstanding", "max_concurrency"),
+            help="Solicitudes por upstream", labels=labels
+        )
+        samples.append(("proxy_upstream_up", "gauge", "Último sondeo de salud (1 = online)",
+                        labels, 1.0 if statuses.get(u["url"]) == "online" else 0.0))
+    samples += collect_stats(
+        "proxy_cache", cache.stats(),
+        counters=("hits", "coalesced", "misses", "bypassed", "expired"),
+        gauges=("entries", "in_flight", "hit_rate"),
+        help="Caché de respuestas del proxy"
+    )
+    return samples
+
+
+REGISTRY.register_collector(_collect_proxy_metrics)
 
 # =========================
 # Endpoint OpenAI-compatible
@@ -118,29 +188,62 @@ async def health_check():
 async def chat_completions(request: Request):
     """
     Endpoint compatible con OpenAI API.
-    Reenvía solicitudes a LM Studio con reintentos.
+    Reenvía a LM Studio los bytes de la solicitud y de la respuesta tal cual:
+    solo se leen `model` y `stream` del cuerpo, sin decodificar el prompt.
+    Con `stream: true` los chunks SSE se reenvían tal cual llegan.
+    El header X-Request-Timeout-Ms (si viene) acota cola, upstream y hedging.
+    Sin stream, los payloads idénticos se sirven de caché (X-Cache-Bypass: 1
+    para forzar una generación nueva).
     """
+    start = time.monotonic()
+    status, stream, cache_status = 500, False, "none"
     try:
-        payload = await request.json()
-        
-        logger.info(f"Solicitud: modelo={payload.get('model')}, "
-                   f"messages={len(payload.get('messages', []))}")
-
-        async with httpx.AsyncClient(timeout=300) as client:
-            response = await client.post(
-                LMSTUDIO_URL,
-                json=payload,
-                timeout=300
-            )
-        
-        logger.info(f"Respuesta: status={response.status_code}")
-        
-        return JSONResponse(
+        response = await _handle_completion(request)
+        status = response.status_code
+        stream = isinstance(response, StreamingResponse)
+        cache_status = response.headers.get(CACHE_STATUS_HEADER, "none")
+        return response
+    except HTTPException as e:
+        status = e.status_code
+        raise
+    finally:
+        PROXY_REQUESTS.inc(status=status, stream=str(stream).lower(), cache=cache_status.lower())
+        PROXY_REQUEST_SECONDS.observe(time.monotonic() - start, stream=str(stream).lower())
+
+
+async def _handle_completion(request: Request):
+    try:
+        body = await request.body()
+        try:
+            fields = peek_fields(body, ("model", "stream"))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid JSON body: {e}")
+
+        logger.info(f"Solicitud: modelo={fields.get('model')}, "
+                   f"bytes={len(body)}, "
+                   f"stream={bool(fields.get('stream'))}")
+
+        deadline = Deadline.from_header(
+            request.headers.get(DEADLINE_HEADER),
+            default=upstream.timeout.read
+        )
+
+        if fields.get("stream"):
+            target = await _admit(request, deadline)
+            return await _stream_completion(body, target, deadline)
+
+        response, cache_status = await _cached_completion(request, body, deadline)
+
+        return Response(
+            content=response.content,
             status_code=response.status_code,
-            content=response.json()
+            media_type=response.media_type,
+            headers={CACHE_STATUS_HEADER: cache_status} if cache_status else None
         )
-        
-    except httpx.TimeoutException:
+
+    except HTTPException:
+        raise
+    except (httpx.TimeoutException, DeadlineExceeded):
         logger.error("Timeout conectando a LM Studio")
         raise HTTPException(status_code=504, detail="LM Studio timeout")
     except httpx.ConnectError:
@@ -150,10 +253,223 @@ async def chat_completions(request: Request):
         logger.error(f"Error en chat_completions: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+async def _cached_completion(request: Request, body: bytes, deadline: Deadline):
+    """
+    Resuelve una solicitud sin stream pasando por la caché de respuestas.
+    Los aciertos no ocupan slot de upstream ni lugar en la cola.
+    """
+    async def fetch() -> CachedResponse:
+        target = await _admit(request, deadline)
+        response = await _post_hedged(body, target, deadline)
+        logger.info(f"Respuesta: status={response.status_code}")
+        content = response.content
+        if response.status_code == 200:
+            _record_usage(content)
+        return CachedResponse(
+            response.status_code,
+            content,
+            response.headers.get("content-type", "application/json")
+        )
+
+    if not cache.enabled:
+        return await fetch(), None
+
+    if ResponseCache.bypass_requested(request.headers):
+        cache.bypass()
+        return await fetch(), "BYPASS"
+
+    try:
+        key = ResponseCache.key(body)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid JSON body: {e}")
+
+    response, cache_status = await cache.get_or_fetch(key, fetch)
+    if cache_status != "MISS":
+        logger.info(f"Respuesta desde caché ({cache_status}): status={response.status_code}")
+    return response, cache_status
+
+
+def _record_usage(content: bytes):
+    # `usage` va al final de la respuesta; se lee sin decodificar el texto generado
+    try:
+        usage = peek_fields(content, ("usage",)).get("usage")
+    except ValueError:
+        return
+    if not isinstance(usage, dict):
+        return
+    PROXY_TOKENS.inc(usage.get("prompt_tokens") or 0, kind="prompt")
+    PROXY_TOKENS.inc(usage.get("completion_tokens") or 0, kind="completion")
+    # Prefijo del prompt reutilizado por LM Studio (si lo reporta)
+    details = usage.get("prompt_tokens_details")
+    if isinstance(details, dict):
+        PROXY_TOKENS.inc(details.get("cached_tokens") or 0, kind="cached_prompt")
+
+
+async def _admit(request: Request, deadline: Deadline):
+    """
+    Reserva un upstream del pool (cola justa por API key).
+    Si la cola está llena o la espera expira, responde 429 de inmediato.
+    """
+    start = time.monotonic()
+    try:
+        return await pool.acquire(
+            key=getattr(request.state, "api_key", ""),
+            timeout=deadline.remaining()
+        )
+    except (QueueFullError, AdmissionTimeout) as e:
+        logger.warning(f"Solicitud rechazada (429): {e}")
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "1"})
+    finally:
+        PROXY_QUEUE_WAIT_SECONDS.observe(time.monotonic() - start)
+
+
+async def _post(target, body: bytes, deadline: Deadline) -> httpx.Response:
+    """POST a un upstream; libera su slot al terminar, fallar o ser cancelado."""
+    upstream.begin()
+    start = time.monotonic()
+    try:
+        response = await upstream.client.post(
+            target.url,
+            content=body,
+            headers=JSON_HEADERS,
+            timeout=upstream.timeout_for(deadline.remaining())
+        )
+    except BaseException as e:
+        # La cancelación del perdedor de un hedge no cuenta como error
+        error = not isinstance(e, asyncio.CancelledError)
+        upstream.end(error=error)
+        pool.release(target, error=error)
+        if error:
+            PROXY_UPSTREAM_SECONDS.observe(time.monotonic() - start, upstream=target.url, stream="false")
+        raise
+    upstream.end()
+    pool.release(target)
+
+    elapsed = time.monotonic() - start
+    PROXY_UPSTREAM_SECONDS.observe(elapsed, upstream=target.url, stream="false")
+    if response.status_code == 200:
+        pool.latency.observe(elapsed)
+    return response
+
+
+async def _post_hedged(body: bytes, target, deadline: Deadline) -> httpx.Response:
+    """
+    Envía la solicitud y, si tarda más que el p95 observado, manda un
+    duplicado a otro upstream libre. Gana la primera respuesta; la otra
+    se cancela (cierra su conexión y LM Studio deja de generar).
+    """
+    primary = asyncio.create_task(_post(target, body, deadline))
+    pending = {primary}
+
+    delay = pool.hedge_delay()
+    if delay is not None and delay < deadline.remaining():
+        done, _ = await asyncio.wait(pending, timeout=delay)
+        if not done:
+            backup = pool.try_acquire(exclude=target)
+            if backup is not None:
+                pool.hedges_total += 1
+                logger.info(f"Hedge: {target.url} supera p{int(pool.hedge_percentile * 100)} "
+                            f"({delay:.2f}s); duplicando en {backup.url}")
+                pending.add(asyncio.create_task(_post(backup, body, deadline)))
+
+    error = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(
+                pending,
+                timeout=deadline.remaining(),
+                return_when=asyncio.FIRST_COMPLETED
+            )
+            if not done:
+                raise DeadlineExceeded("Tiempo agotado esperando al upstream")
+
+            for task in done:
+                if task.exception() is None:
+                    if task is not primary:
+                        pool.hedge_wins_total += 1
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def _stream_completion(body: bytes, target, deadline: Deadline) -> StreamingResponse:
+    """
+    Reenvía la respuesta SSE de LM Studio sin bufferizar ni decodificar:
+    cada bloque de bytes se entrega al cliente en cuanto llega, así que la
+    memoria por solicitud es constante y el primer token sale de inmediato.
+    """
+    client = upstream.client
+    upstream.begin()
+    start = time.monotonic()
+    try:
+        upstream_request = client.build_request(
+            "POST",
+            target.url,
+            content=body,
+            headers=JSON_HEADERS,
+            timeout=upstream.timeout_for(deadline.remaining())
+        )
+        response = await client.send(upstream_request, stream=True)
+    except Exception:
+        upstream.end(error=True)
+        pool.release(target, error=True)
+        raise
+
+    logger.info(f"Respuesta (stream): status={response.status_code} upstream={target.url}")
+
+    async def relay():
+        # El finally corre también si el cliente se desconecta a mitad del stream
+        first = True
+        try:
+            async for chunk in response.aiter_raw():
+                if first:
+                    PROXY_TTFT_SECONDS.observe(time.monotonic() - start, upstream=target.url)
+                    first = False
+                # Estimación: LM Studio emite un evento SSE por token
+                events = chunk.count(b"data:") - chunk.count(b"[DONE]")
+                if events > 0:
+                    PROXY_TOKENS.inc(events, kind="completion")
+                yield chunk
+        finally:
+            # Devuelve la conexión al pool keep-alive
+            await response.aclose()
+            upstream.end()
+            pool.release(target)
+            PROXY_UPSTREAM_SECONDS.observe(time.monotonic() - start, upstream=target.url, stream="true")
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    if "content-encoding" in response.headers:
+        headers["Content-Encoding"] = response.headers["content-encoding"]
+
+    return StreamingResponse(
+        relay(),
+        status_code=response.status_code,
+        media_type=response.headers.get("content-type", "text/event-stream"),
+        headers=headers
+    )
+
 # =========================
 # Startup
 # =========================
 @app.on_event("startup")
 async def startup():
+    await upstream.start()
+    prober.start()
     logger.info(f"🚀 Proxy iniciado en puerto {PROXY_PORT}")
-    logger.info(f"📡 LM Studio: {LMSTUDIO_URL}")
+    for u in pool.upstreams:
+        logger.info(f"📡 LM Studio: {u.url} (concurrencia máx. {u.max_concurrency})")
+    logger.info(f"🚦 Cola de espera: máx. {pool.max_queue}, timeout {pool.queue_timeout}s")
+    logger.info(f"🔌 Pool upstream: max={upstream.limits.max_connections}, "
+                f"keep-alive={upstream.limits.max_keepalive_connections}, http2={upstream.http2}")
+    logger.info(f"🩺 Sondeo de salud cada {prober.interval}s")
+    if cache.enabled:
+        logger.info(f"🗃️  Caché de respuestas: {cache.max_entries} entradas, TTL {cache.ttl}s")
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    await prober.stop()
+    await upstream.close()
@@ -0,0 +1,78 @@
+import time
+import uuid
+import asyncio
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+
+class Session:
+    """Conversación de un usuario: historial propio y un lock para atender sus consultas en orden."""
+
+    def __init__(self, session_id: str, memory=None):
+        self.session_id = session_id
+        # ConversationMemory del RAG (acotada); lista simple si no se indica
+        self.memory = memory if memory is not None else []
+        self.lock = asyncio.Lock()
+        self.last_used = time.monotonic()
+        self.queries = 0
+
+
+class SessionStore:
+    """
+    Sesiones en memoria del servicio RAG.
+
+    - Cada sesión tiene su propio historial (la instancia RAG es compartida)
+    - Expiran tras `ttl` segundos sin uso
+    - Tope de sesiones: al superarlo se descarta la menos usada (LRU)
+    - `memory_factory` crea el historial de cada sesión nueva
+
+    Se usa solo desde el event loop, por lo que no necesita locks.
+    """
+
+    def __init__(self, ttl: float = 3600.0, max_sessions: int = 1000,
+                 memory_factory: Optional[Callable[[], object]] = None):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.memory_factory = memory_factory
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self.created_total = 0
+        self.expired_total = 0
+
+    def get(self, session_id: Optional[str] = None) -> Session:
+        """Devuelve la sesión indicada o crea una nueva (id aleatorio si no viene)."""
+        self._expire()
+        session = self._sessions.get(session_id) if session_id else None
+        if session is None:
+            memory = self.memory_factory() if self.memory_factory else None
+            session = Session(session_id or uuid.uuid4().hex, memory)
+            self._sessions[session.session_id] = session
+            self.created_total += 1
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self.expired_total += 1
+
+        session.last_used = time.monotonic()
+        self._sessions.move_to_end(session.session_id)
+        return session
+
+    def delete(self, session_id: str) -> bool:
+        return self._sessions.pop(session_id, None) is not None
+
+    def _expire(self):
+        now = time.monotonic()
+        # Orden LRU: las primeras son las más antiguas
+        while self._sessions:
+            session = next(iter(self._sessions.values()))
+            if now - session.last_used <= self.ttl or session.lock.locked():
+                break
+            self._sessions.popitem(last=False)
+            self.expired_total += 1
+
+    def stats(self) -> Dict:
+        return {
+            "active": len(self._sessions),
+            "max_sessions": self.max_sessions,
+            "ttl": self.ttl,
+            "created_total": self.created_total,
+            "expired_total": self.expired_total,
+        }
@@ -0,0 +1,135 @@
+import os
+import logging
+from typing import Dict, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+class UpstreamClient:
+    """
+    Cliente HTTP hacia LM Studio compartido durante toda la vida de la app.
+
+    - Un solo pool de conexiones keep-alive (límites configurables)
+    - HTTP/2 opcional (requiere el paquete `h2`; aplica a upstreams https)
+    - Timeouts separados de conexión, lectura, escritura y espera de pool
+    - Estadísticas del pool para monitoreo
+    """
+
+    def __init__(
+        self,
+        max_connections: int = 100,
+        max_keepalive: int = 20,
+        keepalive_expiry: float = 30.0,
+        http2: bool = False,
+        connect_timeout: float = 5.0,
+        read_timeout: float = 300.0,
+        write_timeout: float = 30.0,
+        pool_timeout: float = 10.0,
+    ):
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.timeout = httpx.Timeout(
+            connect=connect_timeout,
+            read=read_timeout,
+            write=write_timeout,
+            pool=pool_timeout,
+        )
+        self.http2 = http2 and _h2_available()
+        self._client: Optional[httpx.AsyncClient] = None
+
+        # Contadores de uso
+        self.requests_total = 0
+        self.errors_total = 0
+        self.in_flight = 0
+        self.in_flight_peak = 0
+
+    @classmethod
+    def from_env(cls) -> "UpstreamClient":
+        return cls(
+            max_connections=int(os.getenv("PROXY_MAX_CONNECTIONS", "100")),
+            max_keepalive=int(os.getenv("PROXY_MAX_KEEPALIVE", "20")),
+            keepalive_expiry=float(os.getenv("PROXY_KEEPALIVE_EXPIRY", "30")),
+            http2=os.getenv("PROXY_HTTP2", "0").lower() in ("1", "true", "yes"),
+            connect_timeout=float(os.getenv("PROXY_CONNECT_TIMEOUT", "5")),
+            read_timeout=float(os.getenv("PROXY_READ_TIMEOUT", "300")),
+            write_timeout=float(os.getenv("PROXY_WRITE_TIMEOUT", "30")),
+            pool_timeout=float(os.getenv("PROXY_POOL_TIMEOUT", "10")),
+        )
+
+    async def start(self):
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                limits=self.limits,
+                timeout=self.timeout,
+                http2=self.http2,
+            )
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def timeout_for(self, seconds: float) -> httpx.Timeout:
+        """Timeouts del pool con lectura acotada al tiempo restante de la solicitud."""
+        return httpx.Timeout(
+            connect=min(self.timeout.connect, seconds),
+            read=min(self.timeout.read, seconds),
+            write=min(self.timeout.write, seconds),
+            pool=min(self.timeout.pool, seconds),
+        )
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            raise RuntimeError("UpstreamClient no iniciado (falta start()).")
+        return self._client
+
+    # ------------------------------------------------------------------
+    # Contabilidad de solicitudes
+    # ------------------------------------------------------------------
+    def begin(self):
+        """Marca el inicio de una solicitud al upstream."""
+        self.requests_total += 1
+        self.in_flight += 1
+        self.in_flight_peak = max(self.in_flight_peak, self.in_flight)
+
+    def end(self, error: bool = False):
+        """Marca el fin de una solicitud (incluye el fin de un stream)."""
+        self.in_flight -= 1
+        if error:
+            self.errors_total += 1
+
+    def stats(self) -> Dict:
+        """Estadísticas del pool y de las solicitudes en curso."""
+        connections = self._pool_connections()
+        return {
+            "http2": self.http2,
+            "max_connections": self.limits.max_connections,
+            "max_keepalive": self.limits.max_keepalive_connections,
+            "connections_open": len(connections),
+            "connections_idle": sum(1 for c in connections if c.is_idle()),
+            "requests_total": self.requests_total,
+            "errors_total": self.errors_total,
+            "in_flight": self.in_flight,
+            "in_flight_peak": self.in_flight_peak,
+        }
+
+    def _pool_connections(self):
+        # httpx no expone el pool públicamente; se lee del transporte de httpcore
+        transport = getattr(self._client, "_transport", None)
+        pool = getattr(transport, "_pool", None)
+        return list(getattr(pool, "connections", []) or [])
+
+
+def _h2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        logger.warning("PROXY_HTTP2 activado pero falta el paquete 'h2' (pip install httpx[http2]); se usa HTTP/1.1.")
+        return False
@@ -12,12 +12,22 @@ class RAGConfig:
     neo4j_uri: str = os.getenv("NEO4J_URI", "bolt://localhost:7687")
     neo4j_user: str = os.getenv("NEO4J_USER", "neo4j")
     neo4j_password: str = os.getenv("NEO4J_PASSWORD", "neo4jpassword")
+    neo4j_database: str = os.getenv("NEO4J_DATABASE", "")
+
+    # Pool de conexiones Neo4j (compartido por indexador y retriever)
+    neo4j_max_pool_size: int = int(os.getenv("NEO4J_MAX_POOL_SIZE", "50"))
+    neo4j_acquisition_timeout: float = float(os.getenv("NEO4J_ACQUISITION_TIMEOUT", "30"))
+    neo4j_max_retry_time: float = float(os.getenv("NEO4J_MAX_RETRY_TIME", "15"))
 
     openai_api_key: str = os.getenv("OPENAI_API_KEY")
 
     # Modelos
     embedding_model: str = "sentence-transformers/multi-qa-mpnet-base-dot-v1"
     device: str = "cpu"
+    query_embedding_cache_size: int = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "1024"))
+    # Micro-batching de consultas concurrentes (tamaño 1 = desactivado)
+    embedding_batch_size: int = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+    embedding_batch_wait_ms: float = float(os.getenv("EMBEDDING_BATCH_WAIT_MS", "5"))
 
     # Text Splitter
     chunk_size: int = 512
@@ -25,20 +35,67 @@ class RAGConfig:
 
     # RAG
     num_retrieved_docs: int = 12
+    # Contexto del prompt: presupuesto de tokens (0 = sin tope) y umbral de casi-duplicados
+    context_token_budget: int = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1024"))
+    context_dedup_threshold: float = float(os.getenv("CONTEXT_DEDUP_THRESHOLD", "0.8"))
+    # Historial por conversación: presupuesto de tokens, ventana de turnos y resumen de los antiguos
+    memory_token_budget: int = int(os.getenv("MEMORY_TOKEN_BUDGET", "1024"))
+    memory_window_turns: int = int(os.getenv("MEMORY_WINDOW_TURNS", "6"))
+    memory_summarize: bool = os.getenv("MEMORY_SUMMARIZE", "1").lower() in ("1", "true", "yes")
     temperature: float = 0.1
+    request_timeout: float = float(os.getenv("RAG_REQUEST_TIMEOUT", "120"))
+
+    # Caché semántica de respuestas (0 entradas = desactivada)
+    answer_cache_size: int = int(os.getenv("ANSWER_CACHE_SIZE", "256"))
+    answer_cache_threshold: float = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.92"))
+    answer_cache_ttl: float = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
     model_mode: Literal["GPT", "LOCAL"] = "GPT"
 
+    # Puerto para exponer /metrics desde el CLI (0 = desactivado)
+    metrics_port: int = int(os.getenv("RAG_METRICS_PORT", "0"))
+
     # Grafo
+    graph_backend: Literal["neo4j", "embedded"] = os.getenv("GRAPH_BACKEND", "neo4j")
     edge_similarity_threshold: float = 0.75
     edge_top_k: int = 5
+    graph_delete_batch_size: int = int(os.getenv("GRAPH_DELETE_BATCH_SIZE", "1000"))
+    # Cada cuántos segundos se revisa si otro proceso cambió los :Document de Neo4j (0 = nunca)
+    metadata_refresh_interval: float = float(os.getenv("METADATA_REFRESH_INTERVAL", "60"))
+    # Recuperación híbrida (FAISS + grafo): presupuesto del grafo por consulta y circuit breaker
+    graph_latency_budget_ms: float = float(os.getenv("GRAPH_LATENCY_BUDGET_MS", "800"))
+    graph_breaker_failures: int = int(os.getenv("GRAPH_BREAKER_FAILURES", "3"))
+    graph_breaker_cooldown: float = float(os.getenv("GRAPH_BREAKER_COOLDOWN", "30"))
 
     # LLM REMOTO (Cliente) - Apunta al PROXY, no directamente a LM Studio
     llm_base_url: str = os.getenv("LLM_BASE_URL", "http://localhost:8001/v1")
     llm_api_key: str = os.getenv("LLM_API_KEY", "ESIA3")
     llm_model_name: str = os.getenv("LLM_MODEL_NAME", "unsloth/deepseek-r1-distill-qwen-7b")
 
+    # LLM local (LM Studio) para LocalRAG
+    local_llm_url: str = os.getenv("LOCAL_LLM_URL", "http://localhost:1234/v1")
+    local_llm_api_key: str = os.getenv("LOCAL_LLM_API_KEY", "lm-studio")
+
+    # Clientes LLM compartidos por backend (src/generation/llm_clients.py)
+    llm_max_concurrency: int = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+    llm_max_retries: int = int(os.getenv("LLM_MAX_RETRIES", "2"))
+    llm_pool_connections: int = int(os.getenv("LLM_POOL_CONNECTIONS", "32"))
+    llm_keepalive_expiry: float = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "30"))
+
     # === PROXY SERVER ===
     proxy_port: int = int(os.getenv("PROXY_PORT", "8001"))
     proxy_api_key: str = os.getenv("PROXY_API_KEY", "ESIA3")
     lmstudio_url: str = os.getenv("LMSTUDIO_URL", "http://127.0.0.1:1234/v1/chat/completions")
 
+    # === SERVICIO RAG (src/api/rag_service.py) ===
+    corpus_path: str = os.getenv("RAG_CORPUS_PATH", "./data/raw/Article_1.pdf")
+    rag_service_port: int = int(os.getenv("RAG_SERVICE_PORT", "8002"))
+    rag_service_api_key: str = os.getenv("RAG_SERVICE_API_KEY", "")
+    rag_service_architecture: str = os.getenv("RAG_SERVICE_ARCH", "naive")
+    rag_service_model: str = os.getenv("RAG_SERVICE_MODEL", "gpt")
+    rag_service_threads: int = int(os.getenv("RAG_SERVICE_THREADS", "8"))
+    rag_service_workers: int = int(os.getenv("RAG_SERVICE_WORKERS", "1"))
+    session_ttl: float = float(os.getenv("RAG_SESSION_TTL", "3600"))
+    max_sessions: int = int(os.getenv("RAG_MAX_SESSIONS", "1000"))
+    # Recarga en caliente: revisar el archivo del corpus cada N segundos (0 = desactivado)
+    index_watch_interval: float = float(os.getenv("INDEX_WATCH_INTERVAL", "0"))
+
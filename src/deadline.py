@@ -0,0 +1,57 @@
+import time
+from typing import Optional
+
+# Header con el que se propaga el presupuesto restante (ms) entre procesos:
+# CLI/API → cliente LLM → proxy → LM Studio
+DEADLINE_HEADER = "X-Request-Timeout-Ms"
+
+
+class DeadlineExceeded(TimeoutError):
+    """Se agotó el presupuesto de tiempo de la solicitud."""
+
+
+class Deadline:
+    """
+    Fecha límite absoluta (reloj monotónico) de una solicitud de extremo a
+    extremo. Cada etapa (recuperación, Neo4j, LLM, proxy) usa `timeout()`
+    para no esperar más de lo que le queda a la solicitud completa.
+    """
+
+    def __init__(self, expires_at: float):
+        self.expires_at = expires_at
+
+    @classmethod
+    def after(cls, seconds: float) -> "Deadline":
+        return cls(time.monotonic() + seconds)
+
+    @classmethod
+    def from_header(cls, value: Optional[str], default: float) -> "Deadline":
+        """Construye la fecha límite desde DEADLINE_HEADER (ms) o usa `default` (s)."""
+        try:
+            seconds = float(value) / 1000.0
+        except (TypeError, ValueError):
+            seconds = default
+        return cls.after(min(seconds, default))
+
+    def remaining(self) -> float:
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0.0
+
+    def check(self, stage: str = ""):
+        """Lanza DeadlineExceeded si ya no queda tiempo."""
+        if self.expired:
+            raise DeadlineExceeded(f"Tiempo agotado{f' en {stage}' if stage else ''}")
+
+    def timeout(self, cap: Optional[float] = None) -> float:
+        """Tiempo restante, acotado opcionalmente por `cap` (segundos)."""
+        remaining = self.remaining()
+        return remaining if cap is None else min(remaining, cap)
+
+    def header_value(self) -> str:
+        return str(int(self.remaining() * 1000))
+
+    def headers(self) -> dict:
+        return {DEADLINE_HEADER: self.header_value()}
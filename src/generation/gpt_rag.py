@@ -1,6 +1,5 @@
-from langchain_openai import ChatOpenAI
-from langchain_core.prompts import PromptTemplate
-
+from src.generation.llm_clients import LLMClient
+from src.generation.prompt_layout import PromptLayout
 from src.retrieval.rag_model import RAGModel
 
 
@@ -14,24 +13,16 @@ class GPTRAG(RAGModel):
 
     def __init__(self, config, documents):
         super().__init__(config, documents)
-        self.documents = documents
-        self.llm = ChatOpenAI(
-            model="gpt-4o-mini",
-            temperature=config.temperature,
-            max_tokens = 1024
-        )
+        # Cliente compartido del proceso (pool, límite de concurrencia, reintentos)
+        self.llm = LLMClient.get_instance(config, "openai")
 
-        # Memoria simple (igual que Graph)
-        self.memory = []
+        # Memoria acotada con resumen de turnos antiguos (igual que Graph)
+        self.memory = self.new_memory()
 
-        self.prompt = PromptTemplate(
-            input_variables=["context", "question"],
-            template=(
+        # Instrucciones fijas en el mensaje system: prefijo reutilizable entre consultas
+        self.layout = PromptLayout(
+            system=(
                 "Eres un asistente basado en Retrieval Augmented Generation.\n\n"
-                "Contexto disponible:\n"
-                "{context}\n\n"
-                "Pregunta:\n"
-                "{question}\n\n"
                 "Instrucciones:\n"
                 "- Responde únicamente con información del texto.\n"
                 "- Si no está en el texto, responde:\n"
@@ -41,23 +32,12 @@ class GPTRAG(RAGModel):
             )
         )
 
-    def generate_response(self, query: str) -> str:
+    def _compose(self, query: str, retrieved_docs, memory):
         q = query.lower()
 
-        # Intento 1️⃣: Recuperación basada en embeddings
-        retrieved_docs = self.retrieve_context(query)
-        retrieved_docs = self.retrieve_context(query)
-
-        # Priorizar secciones con contenido relevante
-        retrieved_docs_sorted = sorted(
-            retrieved_docs,
-            key=lambda d: (
-                d.metadata.get("section") not in ["Resumen", "Resultados", "Conclusiones"],
-                -len(d.page_content)  # más texto primero
-            )
-        )
-
-        retrieved_docs = retrieved_docs_sorted[:self.config.num_retrieved_docs]
+        # Intento 1️⃣: Contexto recuperado por embeddings (RAGModel._build_messages)
+        # Unir vecinos, quitar casi-duplicados y llenar el presupuesto de tokens por relevancia
+        retrieved_docs = self.context_packer.pack(retrieved_docs)
 
 
         if retrieved_docs:
@@ -66,27 +46,9 @@ class GPTRAG(RAGModel):
                 page = doc.metadata.get("page_number", "¿?")
                 context += f"[Página {page}] {doc.page_content}\n\n"
 
-            formatted_prompt = self.prompt.format(
-                context=context,
-                question=query
-            )
+            messages = self.layout.build(context, query, memory)
 
-            messages = []
-            for m in self.memory:
-                messages.append({
-                    "role": m["role"],
-                    "content": m["content"]
-                })
-
-            messages.append({"role": "user", "content": formatted_prompt})
-
-            response = self.llm.invoke(messages).content
-
-            # Guardar historial
-            self.memory.append({"role": "user", "content": query})
-            self.memory.append({"role": "assistant", "content": response})
-
-            return response
+            return messages, None
 
         # Segundo intento: Fallback usando metadatos
         metadata_keywords = {
@@ -101,10 +63,17 @@ class GPTRAG(RAGModel):
 
         for keyword, field in metadata_keywords.items():
             if keyword in q:
-                values = [d.metadata.get(field) for d in self.documents if d.metadata.get(field)]
+                values = self.metadata_index.values(field)
                 if values:
-                    unique_values = set(str(v) for v in values)
-                    return ", ".join(unique_values)
+                    return None, ", ".join(str(v) for v in values)
 
         # Fallo completo
-        return "No encontrado en el documento."
+        return None, "No encontrado en el documento."
+
+    def _llm_params(self, deadline):
+        return dict(
+            model="gpt-4o-mini",
+            deadline=deadline,
+            temperature=self.config.temperature,
+            max_tokens=1024
+        )
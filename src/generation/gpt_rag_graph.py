@@ -1,50 +1,45 @@
-from langchain_openai import ChatOpenAI
-from langchain_core.prompts import PromptTemplate
-
+from src.generation.llm_clients import LLMClient
+from src.generation.prompt_layout import PromptLayout
 from src.retrieval.rag_model import RAGModel
-from src.retrieval.neo4j_graph_retriever import Neo4jGraphRetriever
-from src.indexing.document_processor import DocumentProcessor
+from src.retrieval.retrieval_orchestrator import RetrievalOrchestrator
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
 
 
 class GPTRAG(RAGModel):
     """
     Versión GPT-RAG para Graph-RAG.
 
-    - Usa Neo4jGraphRetriever para:
+    - Usa el retriever de grafo (Neo4j o embebido, según config.graph_backend) para:
       * recuperar chunks por similitud
       * extraer metadatos (autor, año, doi, etc.)
     - Aplica reglas estrictas: solo responde con lo que está en el contexto.
     """
 
-    def __init__(self, config, documents):
-        # Inicializa como en Naive (RAGModel crea embeddings y FAISS),
-        # aunque aquí NO usamos FAISS; no pasa nada si queda sin usar.
+    def __init__(self, config, documents, graph_retriever=None):
+        # Inicializa como en Naive (RAGModel crea embeddings y FAISS);
+        # FAISS es la parte densa de la recuperación híbrida.
         super().__init__(config, documents)
 
-        self.llm = ChatOpenAI(
-            model="gpt-4o-mini",
-            temperature=config.temperature,
-            max_tokens = 1024
-        )
+        # Cliente compartido del proceso (pool, límite de concurrencia, reintentos)
+        self.llm = LLMClient.get_instance(config, "openai")
 
-        # Memoria simple basada en lista
-        self.memory = []
+        # Memoria acotada: ventana de turnos + resumen de los antiguos
+        self.memory = self.new_memory()
 
-        # Retriever basado en Neo4j (índice vectorial + grafo)
+        # Retriever basado en grafo (índice vectorial + grafo)
         # Reutilizamos el mismo embedder que RAGModel ya usa.
-        self.graph_retriever = Neo4jGraphRetriever(
-            config=config,
-            embedder=self.embedder
-        )
+        self.graph_retriever = graph_retriever or self._build_graph_retriever()
 
-        self.prompt = PromptTemplate(
-            input_variables=["context", "question"],
-            template=(
+        # FAISS y grafo en paralelo; el grafo se omite si es lento o falla
+        self.orchestrator = RetrievalOrchestrator(config, dense=self.retriever, graph=self.graph_retriever)
+
+        # Instrucciones fijas en el mensaje system: prefijo reutilizable entre consultas
+        self.layout = PromptLayout(
+            system=(
                 "Eres un asistente experto en Graph RAG.\n\n"
-                "Contexto recuperado del documento (fragmentos reales):\n"
-                "{context}\n\n"
-                "Pregunta del usuario:\n"
-                "{question}\n\n"
                 "Reglas estrictas:\n"
                 "- Solo puedes responder utilizando la información del contexto.\n"
                 "- Si la respuesta NO está en el contexto, responde EXACTAMENTE:\n"
@@ -56,13 +51,69 @@ class GPTRAG(RAGModel):
                 "- No inventes nada que no esté explícito en el texto.\n"
                 "- No incluyas opiniones ni resúmenes innecesarios.\n"
                 "- Responde en español.\n"
-            )
+            ),
+            context_label="Contexto recuperado del documento (fragmentos reales)",
+            question_label="Pregunta del usuario"
         )
 
-    def generate_response(self, query: str) -> str:
-        q = query.lower()
+    def release(self):
+        super().release()
+        self.orchestrator.close()
+        self.graph_retriever = None
+        self.orchestrator = None
+
+    def _build_graph_retriever(self):
+        if self.config.graph_backend == "embedded":
+            from src.retrieval.embedded_graph_retriever import EmbeddedGraphRetriever
+            return EmbeddedGraphRetriever(config=self.config, embedder=self.embedder)
 
+        from src.retrieval.neo4j_graph_retriever import Neo4jGraphRetriever
+        return Neo4jGraphRetriever(config=self.config, embedder=self.embedder)
+
+    def _build_messages(self, query: str, deadline, memory):
         # ---  Consultas a metadatos (sin embeddings) ---
+        field = self._metadata_field(query)
+        if field is not None:
+            return None, self._metadata_answer(field)
+
+        # --- Recuperación híbrida: FAISS + grafo ---
+        try:
+            retrieved_docs = self.orchestrator.retrieve(
+                query,
+                k=self.config.num_retrieved_docs,
+                deadline=deadline
+            )
+        except Exception as e:
+            # Si fallan ambas fuentes, sé estricto:
+            logger.warning(f"Fallo en la recuperación: {e}")
+            return None, "No encontrado en el documento."
+
+        return self._compose(query, retrieved_docs, memory)
+
+    async def _abuild_messages(self, query: str, deadline, memory):
+        field = self._metadata_field(query)
+        if field is not None:
+            # Los metadatos se leen de Neo4j una sola vez; después es una tabla en memoria
+            return None, await asyncio.to_thread(self._metadata_answer, field)
+
+        try:
+            retrieved_docs = await self.orchestrator.aretrieve(
+                query,
+                k=self.config.num_retrieved_docs,
+                deadline=deadline
+            )
+        except Exception as e:
+            logger.warning(f"Fallo en la recuperación: {e}")
+            return None, "No encontrado en el documento."
+
+        # Empaquetado del contexto (CPU) en el executor: el event loop solo espera E/S
+        return await asyncio.to_thread(self._compose, query, retrieved_docs, memory)
+
+    @staticmethod
+    def _metadata_field(query: str):
+        """Campo de metadata que pide la consulta (autor, año, doi...), o None."""
+        q = query.lower()
+
         meta_fields = {
             "autor": "author_real",
             "autores": "author_real",
@@ -85,27 +136,24 @@ class GPTRAG(RAGModel):
 
         for keyword, field in meta_fields.items():
             if keyword in q:
-                try:
-                    values = self.graph_retriever.retrieve_metadata(field)
-                except Exception:
-                    values = None
+                return field
+        return None
 
-                if values:
-                    return ", ".join(str(v) for v in values)
-                return f"No encontrado en metadatos ({field})."
-
-        # --- Recuperación normal basada en embeddings + grafo ---
+    def _metadata_answer(self, field: str) -> str:
         try:
-            retrieved_docs = self.graph_retriever.retrieve(
-                query,
-                k=self.config.num_retrieved_docs
-            )
+            values = self.graph_retriever.retrieve_metadata(field)
         except Exception:
-            # Si algo falla en Neo4j, sé estricto:
-            return "No encontrado en el documento."
+            values = None
+
+        if values:
+            return ", ".join(str(v) for v in values)
+        return f"No encontrado en metadatos ({field})."
 
+    def _compose(self, query: str, retrieved_docs, memory):
+        # Unir vecinos, quitar casi-duplicados y llenar el presupuesto de tokens por relevancia
+        retrieved_docs = self.context_packer.pack(retrieved_docs)
         if not retrieved_docs:
-            return "No encontrado en el documento."
+            return None, "No encontrado en el documento."
 
         # Agregar contexto con metadata útil
         context = ""
@@ -114,27 +162,14 @@ class GPTRAG(RAGModel):
             context += f"[Página {page}]\n{doc.page_content}\n\n"
 
         # Construcción del prompt final
-        formatted_prompt = self.prompt.format(
-            context=context,
-            question=query
-        )
-
-        # Historial (opcional)
-        messages = []
-        for m in self.memory:
-            role = "user" if m["role"] == "user" else "assistant"
-            messages.append({
-                "role": role,
-                "content": m["content"]
-            })
+        messages = self.layout.build(context, query, memory)
 
-        messages.append({"role": "user", "content": formatted_prompt})
+        return messages, None
 
-        # Llamada al LLM
-        response = self.llm.invoke(messages).content
-
-        # Guardar historial
-        self.memory.append({"role": "user", "content": query})
-        self.memory.append({"role": "assistant", "content": response})
-
-        return response
+    def _llm_params(self, deadline):
+        return dict(
+            model="gpt-4o-mini",
+            deadline=deadline,
+            temperature=self.config.temperature,
+            max_tokens=1024
+        )
@@ -0,0 +1,426 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+import httpx
+from openai import AsyncOpenAI, OpenAI
+
+from src.config import RAGConfig
+from src.deadline import Deadline, DeadlineExceeded
+from src.metrics import REGISTRY, collect_stats
+
+logger = logging.getLogger(__name__)
+
+LLM_REQUEST_SECONDS = REGISTRY.histogram(
+    "llm_client_request_seconds",
+    "Latencia de las llamadas al LLM por backend (incluye reintentos)"
+)
+LLM_SLOT_WAIT_SECONDS = REGISTRY.histogram(
+    "llm_client_slot_wait_seconds",
+    "Espera por un cupo de concurrencia del backend LLM",
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0)
+)
+
+# Backends OpenAI-compatibles que usan los generadores
+BACKENDS = ("openai", "local", "remote")
+
+
+def cached_prompt_tokens(usage) -> int:
+    """
+    Tokens del prompt que el backend reutilizó de su caché de prefijos
+    (`usage.prompt_tokens_details.cached_tokens`; 0 si no lo reporta).
+    """
+    details = getattr(usage, "prompt_tokens_details", None)
+    if isinstance(details, dict):
+        return details.get("cached_tokens") or 0
+    return getattr(details, "cached_tokens", None) or 0
+
+
+class LLMClient:
+    """
+    Cliente LLM compartido por todo el proceso, uno por backend:
+
+    - openai : API de OpenAI (GPTRAG, Graph GPTRAG)
+    - local  : LM Studio en config.local_llm_url (LocalRAG)
+    - remote : proxy OpenAI-compatible en config.llm_base_url (RemoteRAG, RemoteGPT)
+
+    Cada backend tiene un solo pool keep-alive (síncrono y async), un límite
+    de llamadas simultáneas (`llm_max_concurrency`), reintentos del SDK con
+    backoff (`llm_max_retries`) y contadores de uso (llamadas, reintentos,
+    errores, tokens y tokens de prompt servidos desde la caché del backend). Los generadores obtienen el cliente con
+    `LLMClient.get_instance(config, backend)` en lugar de crear el suyo.
+    """
+
+    _instances: Dict[str, "LLMClient"] = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, config: RAGConfig, backend: str):
+        if backend not in BACKENDS:
+            raise ValueError(f"Backend LLM desconocido: {backend}")
+        self.config = config
+        self.backend = backend
+        self.base_url, self.api_key = self._endpoint(config, backend)
+        # El deadline se propaga a nuestros servidores (proxy / LM Studio), no a OpenAI
+        self.propagate_deadline = backend != "openai"
+        self.max_concurrency = config.llm_max_concurrency
+
+        self._metrics_lock = threading.Lock()
+        self._in_flight = 0
+        self._in_flight_peak = 0
+        self._waiting = 0
+        self._requests_total = 0
+        self._attempts_total = 0
+        self._failures_total = 0
+        self._prompt_tokens_total = 0
+        self._cached_prompt_tokens_total = 0
+        self._completion_tokens_total = 0
+
+        self._create_clients()
+
+    @staticmethod
+    def _endpoint(config: RAGConfig, backend: str) -> Tuple[Optional[str], Optional[str]]:
+        if backend == "openai":
+            # base_url None: el SDK usa la API de OpenAI (o OPENAI_BASE_URL)
+            return None, config.openai_api_key
+        if backend == "local":
+            return config.local_llm_url, config.local_llm_api_key
+        return config.llm_base_url, config.llm_api_key
+
+    def _create_clients(self):
+        config = self.config
+        limits = httpx.Limits(
+            max_connections=max(config.llm_max_concurrency, config.llm_pool_connections),
+            max_keepalive_connections=config.llm_pool_connections,
+            keepalive_expiry=config.llm_keepalive_expiry,
+        )
+        # Los hooks cuentan cada intento HTTP: intentos - llamadas = reintentos del SDK
+        self.client = OpenAI(
+            base_url=self.base_url,
+            api_key=self.api_key,
+            max_retries=config.llm_max_retries,
+            http_client=httpx.Client(limits=limits, event_hooks={"request": [self._count_attempt]}),
+        )
+        self.async_client = AsyncOpenAI(
+            base_url=self.base_url,
+            api_key=self.api_key,
+            max_retries=config.llm_max_retries,
+            http_client=httpx.AsyncClient(limits=limits, event_hooks={"request": [self._acount_attempt]}),
+        )
+
+        # Event loop dueño de las conexiones async (se fija en la primera llamada async)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._closing: Optional[asyncio.Task] = None
+
+        limit = self.max_concurrency
+        self._slots = threading.BoundedSemaphore(limit) if limit > 0 else None
+        self._aslots = asyncio.Semaphore(limit) if limit > 0 else None
+
+    # ------------------------------------------------------------------
+    # Instancia compartida
+    # ------------------------------------------------------------------
+    @classmethod
+    def get_instance(cls, config: RAGConfig, backend: str) -> "LLMClient":
+        """Devuelve (o crea) el cliente compartido del backend."""
+        with cls._instances_lock:
+            client = cls._instances.get(backend)
+            if client is None:
+                client = cls(config, backend)
+                cls._instances[backend] = client
+            return client
+
+    @classmethod
+    def close_all(cls):
+        with cls._instances_lock:
+            clients = list(cls._instances.values())
+            cls._instances.clear()
+        for client in clients:
+            client.close()
+
+    @classmethod
+    async def aclose_all(cls):
+        """Cierra todos los backends; se llama al detener el event loop que los usa."""
+        with cls._instances_lock:
+            clients = list(cls._instances.values())
+            cls._instances.clear()
+        for client in clients:
+            await client.aclose()
+
+    # ------------------------------------------------------------------
+    # Llamadas
+    # ------------------------------------------------------------------
+    def complete(self, messages: List[Dict], model: str, deadline: Optional[Deadline] = None,
+                 **params) -> str:
+        """Chat completion bloqueante; `params` se pasan al SDK (temperature, max_tokens...)."""
+        with self._slot(deadline):
+            start = time.perf_counter()
+            try:
+                response = self.client.chat.completions.create(
+                    model=model, messages=messages, **self._request_options(deadline), **params
+                )
+            except Exception:
+                self._count_failure()
+                raise
+            finally:
+                LLM_REQUEST_SECONDS.observe(time.perf_counter() - start, backend=self.backend)
+
+        self._count_usage(response.usage)
+        return response.choices[0].message.content
+
+    def stream(self, messages: List[Dict], model: str, deadline: Optional[Deadline] = None,
+               **params) -> Iterator[str]:
+        """Chat completion en streaming; el cupo se retiene hasta agotar o cerrar el generador."""
+        with self._slot(deadline):
+            start = time.perf_counter()
+            try:
+                stream = self.client.chat.completions.create(
+                    model=model, messages=messages, stream=True,
+                    **self._stream_options(), **self._request_options(deadline), **params
+                )
+                with stream:
+                    for chunk in stream:
+                        if chunk.usage is not None:
+                            self._count_usage(chunk.usage)
+                        if chunk.choices and chunk.choices[0].delta.content:
+                            yield chunk.choices[0].delta.content
+            except Exception:
+                self._count_failure()
+                raise
+            finally:
+                LLM_REQUEST_SECONDS.observe(time.perf_counter() - start, backend=self.backend)
+
+    async def acomplete(self, messages: List[Dict], model: str, deadline: Optional[Deadline] = None,
+                        **params) -> str:
+        """Versión async de complete (mismo event loop en todas las llamadas)."""
+        async with self._aslot(deadline):
+            start = time.perf_counter()
+            try:
+                response = await self.async_client.chat.completions.create(
+                    model=model, messages=messages, **self._request_options(deadline), **params
+                )
+            except Exception:
+                self._count_failure()
+                raise
+            finally:
+                LLM_REQUEST_SECONDS.observe(time.perf_counter() - start, backend=self.backend)
+
+        self._count_usage(response.usage)
+        return response.choices[0].message.content
+
+    async def astream(self, messages: List[Dict], model: str, deadline: Optional[Deadline] = None,
+                      **params) -> AsyncIterator[str]:
+        """Versión async de stream."""
+        async with self._aslot(deadline):
+            start = time.perf_counter()
+            try:
+                stream = await self.async_client.chat.completions.create(
+                    model=model, messages=messages, stream=True,
+                    **self._stream_options(), **self._request_options(deadline), **params
+                )
+                async with stream:
+                    async for chunk in stream:
+                        if chunk.usage is not None:
+                            self._count_usage(chunk.usage)
+                        if chunk.choices and chunk.choices[0].delta.content:
+                            yield chunk.choices[0].delta.content
+            except Exception:
+                self._count_failure()
+                raise
+            finally:
+                LLM_REQUEST_SECONDS.observe(time.perf_counter() - start, backend=self.backend)
+
+    def _request_options(self, deadline: Optional[Deadline]) -> Dict[str, Any]:
+        if deadline is None:
+            return {}
+        options: Dict[str, Any] = {"timeout": deadline.timeout()}
+        if self.propagate_deadline:
+            options["extra_headers"] = deadline.headers()
+        return options
+
+    def _stream_options(self) -> Dict[str, Any]:
+        # Solo OpenAI garantiza el chunk final con `usage`; LM Studio y el proxy no
+        return {"stream_options": {"include_usage": True}} if self.backend == "openai" else {}
+
+    # ------------------------------------------------------------------
+    # Límite de concurrencia
+    # ------------------------------------------------------------------
+    @contextmanager
+    def _slot(self, deadline: Optional[Deadline]):
+        if self._slots is None:
+            self._enter()
+            try:
+                yield
+            finally:
+                self._leave()
+            return
+
+        with self._metrics_lock:
+            self._waiting += 1
+        start = time.perf_counter()
+        try:
+            acquired = self._slots.acquire(timeout=deadline.timeout() if deadline is not None else None)
+        finally:
+            with self._metrics_lock:
+                self._waiting -= 1
+        LLM_SLOT_WAIT_SECONDS.observe(time.perf_counter() - start, backend=self.backend)
+        if not acquired:
+            raise DeadlineExceeded(f"Tiempo agotado esperando cupo del LLM ({self.backend})")
+
+        self._enter()
+        try:
+            yield
+        finally:
+            self._leave()
+            self._slots.release()
+
+    @asynccontextmanager
+    async def _aslot(self, deadline: Optional[Deadline]):
+        if self._aslots is None:
+            self._enter()
+            try:
+                yield
+            finally:
+                self._leave()
+            return
+
+        with self._metrics_lock:
+            self._waiting += 1
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(
+                self._aslots.acquire(),
+                timeout=deadline.timeout() if deadline is not None else None
+            )
+        except asyncio.TimeoutError:
+            raise DeadlineExceeded(f"Tiempo agotado esperando cupo del LLM ({self.backend})")
+        finally:
+            with self._metrics_lock:
+                self._waiting -= 1
+        LLM_SLOT_WAIT_SECONDS.observe(time.perf_counter() - start, backend=self.backend)
+
+        self._enter()
+        try:
+            yield
+        finally:
+            self._leave()
+            self._aslots.release()
+
+    # ------------------------------------------------------------------
+    # Métricas
+    # ------------------------------------------------------------------
+    def _enter(self):
+        with self._metrics_lock:
+            self._requests_total += 1
+            self._in_flight += 1
+            self._in_flight_peak = max(self._in_flight_peak, self._in_flight)
+
+    def _leave(self):
+        with self._metrics_lock:
+            self._in_flight -= 1
+
+    def _count_attempt(self, request: httpx.Request):
+        with self._metrics_lock:
+            self._attempts_total += 1
+
+    async def _acount_attempt(self, request: httpx.Request):
+        self._loop = asyncio.get_running_loop()
+        self._count_attempt(request)
+
+    def _count_failure(self):
+        with self._metrics_lock:
+            self._failures_total += 1
+
+    def _count_usage(self, usage):
+        if usage is None:
+            return
+        cached = cached_prompt_tokens(usage)
+        with self._metrics_lock:
+            self._prompt_tokens_total += usage.prompt_tokens or 0
+            self._cached_prompt_tokens_total += cached
+            self._completion_tokens_total += usage.completion_tokens or 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._metrics_lock:
+            return {
+                "max_concurrency": self.max_concurrency,
+                "in_flight": self._in_flight,
+                "in_flight_peak": self._in_flight_peak,
+                "waiting": self._waiting,
+                "requests_total": self._requests_total,
+                "retries_total": max(self._attempts_total - self._requests_total, 0),
+                "failures_total": self._failures_total,
+                "prompt_tokens_total": self._prompt_tokens_total,
+                "cached_prompt_tokens_total": self._cached_prompt_tokens_total,
+                "completion_tokens_total": self._completion_tokens_total,
+                "cached_prompt_ratio": (
+                    self._cached_prompt_tokens_total / self._prompt_tokens_total
+                    if self._prompt_tokens_total else 0.0
+                ),
+            }
+
+    @classmethod
+    def collect_metrics(cls):
+        """Uso de todos los backends abiertos, para el registro Prometheus."""
+        with cls._instances_lock:
+            clients = list(cls._instances.values())
+        samples = []
+        for client in clients:
+            samples.extend(collect_stats(
+                "llm_client", client.stats(),
+                counters=("requests_total", "retries_total", "failures_total",
+                          "prompt_tokens_total", "cached_prompt_tokens_total", "completion_tokens_total"),
+                gauges=("in_flight", "in_flight_peak", "waiting", "max_concurrency", "cached_prompt_ratio"),
+                help="Cliente LLM compartido",
+                labels={"backend": client.backend}
+            ))
+        return samples
+
+    @classmethod
+    def _after_fork(cls):
+        """
+        En un proceso hijo (workers del servicio RAG) las conexiones heredadas
+        pertenecen al padre: cada backend abre pools nuevos.
+        """
+        cls._instances_lock = threading.Lock()
+        for client in cls._instances.values():
+            client._metrics_lock = threading.Lock()
+            client._create_clients()
+
+    def close(self):
+        """
+        Cierra los dos pools. El async se cierra en el event loop dueño de sus
+        conexiones: si sigue corriendo en otro hilo se agenda ahí (y se espera),
+        si corre en este hilo se agenda como tarea; si no hay loop vivo se
+        cierra en uno propio.
+        """
+        self.client.close()
+        owner, self._loop = self._loop, None
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        target = owner if owner is not None and owner.is_running() else running
+
+        try:
+            if target is None:
+                asyncio.run(self.async_client.close())
+            elif target is running:
+                self._closing = target.create_task(self.async_client.close())
+            else:
+                asyncio.run_coroutine_threadsafe(self.async_client.close(), target).result(timeout=5)
+        except Exception as e:
+            logger.warning(f"No se pudo cerrar el cliente async de {self.backend}: {e}")
+
+    async def aclose(self):
+        """Cierra los dos pools desde el event loop que usa el cliente async."""
+        self._loop = None
+        self.client.close()
+        await self.async_client.close()
+
+
+REGISTRY.register_collector(LLMClient.collect_metrics)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=LLMClient._after_fork)
@@ -1,5 +1,5 @@
-from openai import OpenAI
-from langchain_core.prompts import PromptTemplate
+from src.generation.llm_clients import LLMClient
+from src.generation.prompt_layout import PromptLayout
 from src.retrieval.rag_model import RAGModel
 from src.config import RAGConfig
 
@@ -13,20 +13,13 @@ class LocalRAG(RAGModel):
 
     def __init__(self, config: RAGConfig, documents):
         super().__init__(config, documents)
-        self.documents = documents
-        self.llm = OpenAI(
-            base_url = "http://localhost:1234/v1",
-            api_key = "lm-studio"
-        )
-        self.memory = []
-        self.prompt = PromptTemplate(
-            input_variables=["context", "question"],
-            template=(
+        # LM Studio en config.local_llm_url, con el cliente compartido del proceso
+        self.llm = LLMClient.get_instance(config, "local")
+        self.memory = self.new_memory()
+        # Instrucciones fijas en el mensaje system: prefijo reutilizable entre consultas
+        self.layout = PromptLayout(
+            system=(
                 "Eres un asistente llamado RAGY.\n\n"
-                "Contexto disponible:\n"
-                "{context}\n\n"
-                "Pregunta:\n"
-                "{question}\n\n"
                 "Instrucciones:\n"
                 "- Trata de responder con información del texto.\n"
                 "- Incluye referencias a la página cuando sea posible.\n"
@@ -34,21 +27,11 @@ class LocalRAG(RAGModel):
             )
         )
 
-    def generate_response(self, query: str) -> str:
+    def _compose(self, query: str, retrieved_docs, memory):
         q = query.lower()
 
-        retrieved_docs = self.retrieve_context(query)
-
-        # Priorizar secciones con contenido relevante
-        retrieved_docs_sorted = sorted(
-            retrieved_docs,
-            key=lambda d: (
-                d.metadata.get("section") not in ["Resumen", "Resultados", "Conclusiones"],
-                -len(d.page_content)
-            )
-        )
-
-        retrieved_docs = retrieved_docs_sorted[:self.config.num_retrieved_docs]
+        # Unir vecinos, quitar casi-duplicados y llenar el presupuesto de tokens por relevancia
+        retrieved_docs = self.context_packer.pack(retrieved_docs)
 
         if retrieved_docs:
             context = ""
@@ -56,28 +39,9 @@ class LocalRAG(RAGModel):
                 page = doc.metadata.get("page_number", "¿?")
                 context += f"[Página {page}] {doc.page_content}\n\n"
 
-            formatted_prompt = self.prompt.format(
-                context=context,
-                question=query
-            )
+            messages = self.layout.build(context, query, memory)
 
-            messages = []
-            for m in self.memory:
-                messages.append({"role": m["role"], "content": m["content"]})
-            messages.append({"role": "user", "content": formatted_prompt})
-
-            response = self.llm.chat.completions.create(
-                model = 'unsloth/deepseek-r1-distill-qwen-7b',
-                messages = messages,
-                temperature = self.config.temperature
-            )
-
-            content = response.choices[0].message.content
-
-            self.memory.append({"role": "user", "content": query})
-            self.memory.append({"role": "assistant", "content": content})
-
-            return content
+            return messages, None
 
         metadata_keywords = {
             "autor": "author_real",
@@ -91,9 +55,15 @@ class LocalRAG(RAGModel):
 
         for keyword, field in metadata_keywords.items():
             if keyword in q:
-                values = [d.metadata.get(field) for d in self.documents if d.metadata.get(field)]
+                values = self.metadata_index.values(field)
                 if values:
-                    unique_values = set(str(v) for v in values)
-                    return ", ".join(unique_values)
+                    return None, ", ".join(str(v) for v in values)
+
+        return None, "No encontrado en el documento."
 
-        return "No encontrado en el documento."
+    def _llm_params(self, deadline):
+        return dict(
+            model = 'unsloth/deepseek-r1-distill-qwen-7b',
+            deadline = deadline,
+            temperature = self.config.temperature
+        )
@@ -0,0 +1,40 @@
+from typing import Dict, List
+
+
+class PromptLayout:
+    """
+    Orden de los mensajes pensado para reutilizar el prefijo del prompt
+    (caché de prompts de OpenAI, KV-cache de LM Studio):
+
+    1. Mensaje system fijo con las instrucciones (idéntico byte a byte en
+       todas las consultas de un generador)
+    2. Turnos recientes de la conversación (solo crecen dentro de una sesión)
+    3. Mensaje user volátil: resumen de turnos antiguos, contexto recuperado
+       y al final la pregunta
+
+    Todo lo que cambia por consulta queda después de lo que no cambia.
+    """
+
+    def __init__(self, system: str, context_label: str = "Contexto disponible",
+                 question_label: str = "Pregunta"):
+        self.system = system
+        self.context_label = context_label
+        self.question_label = question_label
+
+    def build(self, context: str, question: str, history: List[Dict]) -> List[Dict]:
+        messages = [{"role": "system", "content": self.system}]
+
+        # El resumen de la memoria cambia cada vez que avanza la ventana: va con lo volátil
+        summaries = []
+        for m in history:
+            if m["role"] == "system":
+                summaries.append(m["content"])
+            else:
+                messages.append({"role": m["role"], "content": m["content"]})
+
+        parts = summaries + [
+            f"{self.context_label}:\n{context}",
+            f"{self.question_label}:\n{question}",
+        ]
+        messages.append({"role": "user", "content": "\n\n".join(parts)})
+        return messages
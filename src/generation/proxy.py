@@ -1,5 +1,5 @@
-from openai import OpenAI
 from src.config import RAGConfig
+from src.generation.llm_clients import LLMClient
 import logging
 
 logger = logging.getLogger(__name__)
@@ -11,10 +11,8 @@ class RemoteGPT:
 
     def __init__(self, config: RAGConfig):
         self.config = config
-        self.client = OpenAI(
-            base_url=config.llm_base_url,
-            api_key=config.llm_api_key
-        )
+        # Mismo cliente (pool y límite de concurrencia) que RemoteRAG
+        self.client = LLMClient.get_instance(config, "remote")
         self.model = config.llm_model_name
 
     def chat(self, messages, temperature: float = None) -> str:
@@ -26,12 +24,11 @@ class RemoteGPT:
         temp = temperature if temperature is not None else self.config.temperature
         
         try:
-            response = self.client.chat.completions.create(
+            return self.client.complete(
+                messages,
                 model=self.model,
-                messages=messages,
                 temperature=temp
             )
-            return response.choices[0].message.content
         except Exception as e:
             logger.error(f"Error en RemoteGPT.chat(): {e}")
             raise
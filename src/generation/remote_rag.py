@@ -1,5 +1,5 @@
-from openai import OpenAI
-from langchain_core.prompts import PromptTemplate
+from src.generation.llm_clients import LLMClient
+from src.generation.prompt_layout import PromptLayout
 from src.retrieval.rag_model import RAGModel
 from src.config import RAGConfig
 import logging
@@ -16,22 +16,15 @@ class RemoteRAG(RAGModel):
 
     def __init__(self, config: RAGConfig, documents):
         super().__init__(config, documents)
-        self.documents = documents
 
-        self.llm = OpenAI(
-            base_url=config.llm_base_url,
-            api_key=config.llm_api_key
-        )
+        # Proxy en config.llm_base_url, con el cliente compartido del proceso
+        self.llm = LLMClient.get_instance(config, "remote")
 
-        self.memory = []
-        self.prompt = PromptTemplate(
-            input_variables=["context", "question"],
-            template=(
+        self.memory = self.new_memory()
+        # Instrucciones fijas en el mensaje system: prefijo reutilizable entre consultas
+        self.layout = PromptLayout(
+            system=(
                 "Eres un asistente llamado RAGY.\n\n"
-                "Contexto disponible:\n"
-                "{context}\n\n"
-                "Pregunta:\n"
-                "{question}\n\n"
                 "Instrucciones:\n"
                 "- Trata de responder con información del texto.\n"
                 "- Incluye referencias a la página cuando sea posible.\n"
@@ -39,20 +32,11 @@ class RemoteRAG(RAGModel):
             )
         )
 
-    def generate_response(self, query: str) -> str:
+    def _compose(self, query: str, retrieved_docs, memory):
         q = query.lower()
 
-        retrieved_docs = self.retrieve_context(query)
-
-        retrieved_docs_sorted = sorted(
-            retrieved_docs,
-            key=lambda d: (
-                d.metadata.get("section") not in ["Resumen", "Resultados", "Conclusiones"],
-                -len(d.page_content)
-            )
-        )
-
-        retrieved_docs = retrieved_docs_sorted[:self.config.num_retrieved_docs]
+        # Unir vecinos, quitar casi-duplicados y llenar el presupuesto de tokens por relevancia
+        retrieved_docs = self.context_packer.pack(retrieved_docs)
 
         if retrieved_docs:
             context = ""
@@ -60,31 +44,9 @@ class RemoteRAG(RAGModel):
                 page = doc.metadata.get("page_number", "¿?")
                 context += f"[Página {page}] {doc.page_content}\n\n"
 
-            formatted_prompt = self.prompt.format(
-                context=context,
-                question=query
-            )
-
-            messages = self.memory + [
-                {"role": "user", "content": formatted_prompt}
-            ]
-
-            try:
-                response = self.llm.chat.completions.create(
-                    model=self.config.llm_model_name,
-                    messages=messages,
-                    temperature=self.config.temperature
-                )
-            except Exception as e:
-                logger.error(f"Error llamando LLM remoto: {e}")
-                raise
-
-            content = response.choices[0].message.content
+            messages = self.layout.build(context, query, memory)
 
-            self.memory.append({"role": "user", "content": query})
-            self.memory.append({"role": "assistant", "content": content})
-
-            return content
+            return messages, None
 
         # fallback metadata
         metadata_keywords = {
@@ -99,8 +61,44 @@ class RemoteRAG(RAGModel):
 
         for keyword, field in metadata_keywords.items():
             if keyword in q:
-                values = [d.metadata.get(field) for d in self.documents if d.metadata.get(field)]
+                values = self.metadata_index.values(field)
                 if values:
-                    return ", ".join(set(str(v) for v in values))
-
-        return "No encontrado en el documento."
\ No newline at end of file
+                    return None, ", ".join(str(v) for v in values)
+
+        return None, "No encontrado en el documento."
+
+    def _complete(self, messages, deadline) -> str:
+        try:
+            return super()._complete(messages, deadline)
+        except Exception as e:
+            logger.error(f"Error llamando LLM remoto: {e}")
+            raise
+
+    def _stream(self, messages, deadline):
+        try:
+            yield from super()._stream(messages, deadline)
+        except Exception as e:
+            logger.error(f"Error llamando LLM remoto: {e}")
+            raise
+
+    async def _acomplete(self, messages, deadline) -> str:
+        try:
+            return await super()._acomplete(messages, deadline)
+        except Exception as e:
+            logger.error(f"Error llamando LLM remoto: {e}")
+            raise
+
+    async def _astream(self, messages, deadline):
+        try:
+            async for token in super()._astream(messages, deadline):
+                yield token
+        except Exception as e:
+            logger.error(f"Error llamando LLM remoto: {e}")
+            raise
+
+    def _llm_params(self, deadline):
+        return dict(
+            model=self.config.llm_model_name,
+            deadline=deadline,
+            temperature=self.config.temperature
+        )
@@ -0,0 +1,65 @@
+from typing import List, Optional, Tuple, Union
+
+import numpy as np
+from langchain_core.documents import Document
+
+
+class ChunkEmbeddings:
+    """
+    Resultado de la ingesta: chunks + sus embeddings, calculados una sola vez.
+
+    Lo consumen tal cual el indexador de grafo (Neo4j o embebido) y el
+    retriever local (FAISS), en lugar de que cada uno vuelva a embeber los
+    mismos textos. Incluye el embedder con que se calcularon los vectores:
+    las consultas deben embeberse con el mismo modelo.
+    """
+
+    def __init__(self, documents: List[Document], vectors: np.ndarray, embedder):
+        if len(documents) != len(vectors):
+            raise ValueError(f"{len(documents)} chunks pero {len(vectors)} embeddings")
+        self.documents = documents
+        self.vectors = vectors
+        self.embedder = embedder
+        # Fila de cada chunk (por identidad: dos chunks pueden tener el mismo texto)
+        self._rows = {id(doc): row for row, doc in enumerate(documents)}
+
+    @classmethod
+    def embed(cls, embedder, documents: List[Document],
+              previous: Optional["ChunkEmbeddings"] = None) -> "ChunkEmbeddings":
+        """
+        Embebe todos los chunks en un solo lote. Con `previous` (versión
+        anterior del índice, mismo embedder) solo se embeben los textos nuevos.
+        """
+        documents = list(documents or [])
+        if not documents:
+            return cls(documents, np.zeros((0, 0), dtype=np.float32), embedder)
+
+        known = {}
+        if previous is not None and len(previous):
+            known = {doc.page_content: row for row, doc in enumerate(previous.documents)}
+        missing = list(dict.fromkeys(d.page_content for d in documents if d.page_content not in known))
+
+        fresh = {}
+        if missing:
+            fresh = dict(zip(missing, np.array(embedder.embed_documents(missing), dtype=np.float32)))
+        vectors = np.stack([
+            fresh[d.page_content] if d.page_content in fresh else previous.vectors[known[d.page_content]]
+            for d in documents
+        ])
+        return cls(documents, vectors, embedder)
+
+    def vectors_for(self, documents: List[Document]) -> np.ndarray:
+        """Embeddings de un subconjunto de los chunks (p. ej. los pendientes de indexar)."""
+        return self.vectors[[self._rows[id(doc)] for doc in documents]]
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+
+def unpack_chunks(
+    source: Union[ChunkEmbeddings, List[Document], None]
+) -> Tuple[List[Document], Optional[ChunkEmbeddings]]:
+    """Acepta el artefacto de la ingesta o una lista de chunks sin embeddings."""
+    if isinstance(source, ChunkEmbeddings):
+        return source.documents, source
+    return list(source or []), None
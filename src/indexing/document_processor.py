@@ -1,4 +1,5 @@
-from typing import List, Optional, Dict
+from typing import Iterable, List, Optional, Dict, Tuple
+import hashlib
 import os
 import re
 
@@ -10,6 +11,9 @@ from langchain_community.document_loaders import PyMuPDFLoader
 
 from pypdf import PdfReader
 from src.config import RAGConfig
+from src.indexing.chunk_embeddings import ChunkEmbeddings
+from src.retrieval.embedding_batcher import MicroBatchingEmbedder
+from src.retrieval.embedding_cache import CachedEmbeddings, QueryEmbeddingCache
 
 # -------- Regex para extraer información estructurada --------
 DOI_REGEX = r"10\.\d{4,9}\/[-._;()\/:A-Za-z0-9]+"
@@ -17,6 +21,56 @@ ISSN_REGEX = r"\d{4}-\d{3}[\dX]"
 EMAIL_REGEX = r"[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}"
 ORCID_REGEX = r"https?:\/\/orcid\.org\/[\d\-]{15,}"
 
+def file_content_hash(file_path: str) -> str:
+    """SHA-256 del contenido del archivo (identifica una versión del documento)."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def document_fingerprint(config: RAGConfig, chunk_docs: List[Document]) -> str:
+    """
+    Huella de un documento indexado: contenido + parámetros que cambian los
+    chunks o sus embeddings. Si cambia, el documento debe re-indexarse.
+    """
+    content_hash = chunk_docs[0].metadata.get("content_hash") if chunk_docs else None
+    if not content_hash:
+        # Chunks que no vienen de load_documents: usar su propio texto
+        content_hash = hashlib.sha256(
+            "\n".join(d.page_content for d in chunk_docs).encode("utf-8")
+        ).hexdigest()
+
+    key = f"{content_hash}:{config.embedding_model}:{config.chunk_size}:{config.chunk_overlap}"
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def group_by_document(chunk_docs: List[Document]) -> Dict[str, List[Document]]:
+    """Agrupa los chunks por doc_id conservando el orden original."""
+    groups: Dict[str, List[Document]] = {}
+    for doc in chunk_docs:
+        groups.setdefault(doc.metadata.get("doc_id", ""), []).append(doc)
+    return groups
+
+
+def corpus_version(config: RAGConfig, chunk_docs: List[Document]) -> str:
+    """
+    Versión del corpus completo: huella combinada de todos sus documentos.
+    Cambia al agregar, quitar o re-indexar cualquier documento.
+    """
+    return combine_fingerprints(
+        (doc_id, document_fingerprint(config, docs))
+        for doc_id, docs in group_by_document(chunk_docs).items()
+    )
+
+
+def combine_fingerprints(fingerprints: Iterable[Tuple[str, str]]) -> str:
+    """Versión del corpus a partir de pares (doc_id, huella), p. ej. los nodos :Document de Neo4j."""
+    lines = sorted(f"{doc_id}:{fingerprint}" for doc_id, fingerprint in fingerprints)
+    return hashlib.sha256("\n".join(lines).encode("utf-8")).hexdigest()
+
+
 class DocumentProcessor:
     """Handle document loading, metadata extraction and processing."""
 
@@ -24,7 +78,9 @@ class DocumentProcessor:
         self.config = config
         self.text_splitter = RecursiveCharacterTextSplitter(
             chunk_size=self.config.chunk_size,
-            chunk_overlap=self.config.chunk_overlap
+            chunk_overlap=self.config.chunk_overlap,
+            # Posición del chunk en la página: permite unir vecinos traslapados al armar el contexto
+            add_start_index=True
         )
 
     def load_documents(self, file_path: str) -> List[Document]:
@@ -45,6 +101,7 @@ class DocumentProcessor:
 
         # 2) Metadata básica del PDF + inferida
         pdf_metadata = self._extract_pdf_metadata(file_path)
+        pdf_metadata["content_hash"] = file_content_hash(file_path)
 
         # 3) Abstract en primeras páginas
         full_text_first_pages = "\n\n".join(
@@ -108,13 +165,41 @@ class DocumentProcessor:
         return chunked_docs
 
 
-    def get_embeddings(self) -> HuggingFaceEmbeddings:
-        """Initialize and return the embedding model."""
-        return HuggingFaceEmbeddings(
+    def get_embeddings(self) -> CachedEmbeddings:
+        """
+        Initialize and return the embedding model, behind the process-wide
+        query-embedding cache shared by every retriever. Cache misses from
+        concurrent queries are micro-batched into a single forward pass.
+        """
+        embedder = HuggingFaceEmbeddings(
             model_name=self.config.embedding_model,
             model_kwargs={'device': self.config.device},
             encode_kwargs={'normalize_embeddings': False}
         )
+        if self.config.embedding_batch_size > 1:
+            embedder = MicroBatchingEmbedder(
+                embedder,
+                max_batch_size=self.config.embedding_batch_size,
+                max_wait_ms=self.config.embedding_batch_wait_ms
+            )
+        return CachedEmbeddings(
+            embedder,
+            cache=QueryEmbeddingCache.get_shared(self.config.query_embedding_cache_size),
+            namespace=self.config.embedding_model
+        )
+
+    def embed_chunks(self, chunk_docs: List[Document],
+                     previous: Optional[ChunkEmbeddings] = None) -> ChunkEmbeddings:
+        """
+        Embebe los chunks una sola vez. El artefacto lo consumen el indexador
+        de grafo y el retriever local; también lleva el embedder, así el
+        modelo se carga una sola vez por proceso.
+        Al recargar el corpus, `previous` aporta el embedder ya cargado y los
+        embeddings de los chunks que no cambiaron.
+        """
+        embedder = previous.embedder if previous is not None else self.get_embeddings()
+        print(f" Calculando embeddings de {len(chunk_docs)} chunks...")
+        return ChunkEmbeddings.embed(embedder, chunk_docs, previous)
     
     def _extract_pdf_metadata(self, file_path: str) -> Dict:
         reader = PdfReader(file_path)
@@ -127,7 +212,7 @@ class DocumentProcessor:
         doi = doi_match.group(0) if doi_match else None
 
         # ORCID autores
-        orcids = list(set(re.findall(r"https?:\/\/orcid\.org\/[\d\-]{15,}", full_first_page)))
+        orcids = sorted(set(re.findall(r"https?:\/\/orcid\.org\/[\d\-]{15,}", full_first_page)))
 
         # Emails
         emails = re.findall(EMAIL_REGEX, full_first_page)
@@ -0,0 +1,340 @@
+import os
+import threading
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+
+from src.config import RAGConfig
+from src.indexing.chunk_embeddings import unpack_chunks
+from src.indexing.document_processor import document_fingerprint, group_by_document
+from src.indexing.metadata_index import DocumentMetadataIndex
+from src.indexing.similarity_edges import similarity_edges
+
+
+class EmbeddedGraphStore:
+    """
+    Grafo en memoria del proceso que sustituye a Neo4j en un solo nodo.
+
+    - Chunks (texto + metadata) en listas paralelas
+    - Embeddings en una matriz numpy (n, d) ya normalizada para coseno
+    - Aristas :SIMILAR_TO como adyacencia CSR (indptr, indices, weights)
+
+    Las lecturas trabajan sobre un snapshot inmutable, así que las búsquedas
+    concurrentes no necesitan bloquear mientras se indexa.
+    """
+
+    _instances: Dict[str, "EmbeddedGraphStore"] = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._chunk_ids: List[str] = []
+        self._texts: List[str] = []
+        self._metadata: List[Dict] = []
+        self._vectors: List[np.ndarray] = []
+        self._positions: Dict[str, int] = {}
+        self._edges: Dict[Tuple[int, int], float] = {}
+        self._documents: Dict[str, Dict] = {}
+        self._metadata_index = DocumentMetadataIndex()
+        self._snapshot = _GraphSnapshot.empty()
+
+    @classmethod
+    def get_instance(cls, name: str = "default") -> "EmbeddedGraphStore":
+        """Devuelve el grafo embebido compartido por indexador y retriever."""
+        with cls._instances_lock:
+            store = cls._instances.get(name)
+            if store is None:
+                store = cls()
+                cls._instances[name] = store
+            return store
+
+    @classmethod
+    def discard(cls, store: "EmbeddedGraphStore"):
+        """Quita un grafo del registro y libera su contenido (versión de índice retirada)."""
+        with cls._instances_lock:
+            for name in [n for n, s in cls._instances.items() if s is store]:
+                del cls._instances[name]
+        store.clear()
+
+    # ------------------------------------------------------------------
+    # Escritura
+    # ------------------------------------------------------------------
+    def upsert_chunks(self, chunks: List[Dict], embeddings) -> List[int]:
+        """
+        Inserta o actualiza chunks (equivalente a MERGE por chunk_id).
+        Devuelve la posición de cada chunk en el grafo.
+        """
+        vecs = _normalize(np.array(embeddings, dtype="float32"))
+
+        with self._lock:
+            positions = []
+            for chunk, vec in zip(chunks, vecs):
+                metadata = dict(chunk)
+                chunk_id = metadata.pop("chunk_id")
+                text = metadata.pop("text", "")
+                metadata.pop("embedding", None)
+
+                pos = self._positions.get(chunk_id)
+                if pos is None:
+                    pos = len(self._chunk_ids)
+                    self._positions[chunk_id] = pos
+                    self._chunk_ids.append(chunk_id)
+                    self._texts.append(text)
+                    self._metadata.append(metadata)
+                    self._vectors.append(vec)
+                else:
+                    self._texts[pos] = text
+                    self._metadata[pos] = metadata
+                    self._vectors[pos] = vec
+                positions.append(pos)
+
+            self._rebuild()
+            return positions
+
+    def add_edges(self, edges: List[Tuple[int, int, float]]):
+        """Agrega aristas no dirigidas (i, j, weight) entre posiciones del grafo."""
+        with self._lock:
+            for i, j, weight in edges:
+                if i == j:
+                    continue
+                self._edges[(min(i, j), max(i, j))] = float(weight)
+            self._rebuild()
+
+    def register_document(self, doc_id: str, fingerprint: str, chunk_count: int, metadata: Dict):
+        with self._lock:
+            self._documents[doc_id] = {"fingerprint": fingerprint, "chunk_count": chunk_count}
+            self._metadata_index.add(doc_id, metadata)
+
+    def metadata_values(self, field: str) -> List:
+        """Valores distintos de un campo de metadata (tabla por documento)."""
+        with self._lock:
+            return self._metadata_index.values(field)
+
+    def documents(self) -> Dict[str, Dict]:
+        with self._lock:
+            return {doc_id: dict(info) for doc_id, info in self._documents.items()}
+
+    def delete_document(self, doc_id: str):
+        """Elimina los chunks de un documento y sus aristas."""
+        with self._lock:
+            keep = [
+                pos for pos, metadata in enumerate(self._metadata)
+                if metadata.get("doc_id") != doc_id
+            ]
+            remap = {old: new for new, old in enumerate(keep)}
+
+            self._chunk_ids = [self._chunk_ids[p] for p in keep]
+            self._texts = [self._texts[p] for p in keep]
+            self._metadata = [self._metadata[p] for p in keep]
+            self._vectors = [self._vectors[p] for p in keep]
+            self._positions = {cid: pos for pos, cid in enumerate(self._chunk_ids)}
+            self._edges = {
+                (remap[i], remap[j]): w
+                for (i, j), w in self._edges.items()
+                if i in remap and j in remap
+            }
+            self._documents.pop(doc_id, None)
+            self._metadata_index.remove(doc_id)
+            self._rebuild()
+
+    def clear(self):
+        with self._lock:
+            self._chunk_ids.clear()
+            self._texts.clear()
+            self._metadata.clear()
+            self._vectors.clear()
+            self._positions.clear()
+            self._edges.clear()
+            self._documents.clear()
+            self._metadata_index = DocumentMetadataIndex()
+            self._snapshot = _GraphSnapshot.empty()
+
+    def _rebuild(self):
+        """Reconstruye la matriz de embeddings y la adyacencia CSR."""
+        n = len(self._chunk_ids)
+        embeddings = np.vstack(self._vectors) if self._vectors else np.zeros((0, 0), dtype="float32")
+
+        # Cada arista no dirigida se guarda en ambas direcciones
+        rows, cols, weights = [], [], []
+        for (i, j), w in self._edges.items():
+            rows += [i, j]
+            cols += [j, i]
+            weights += [w, w]
+
+        rows = np.array(rows, dtype=np.int64)
+        cols = np.array(cols, dtype=np.int64)
+        weights = np.array(weights, dtype="float32")
+
+        order = np.lexsort((cols, rows))
+        indices = cols[order]
+        data = weights[order]
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=n), out=indptr[1:])
+
+        self._snapshot = _GraphSnapshot(
+            chunk_ids=list(self._chunk_ids),
+            texts=list(self._texts),
+            metadata=[dict(m) for m in self._metadata],
+            embeddings=embeddings,
+            indptr=indptr,
+            indices=indices,
+            weights=data,
+        )
+
+    # ------------------------------------------------------------------
+    # Lectura
+    # ------------------------------------------------------------------
+    def snapshot(self) -> "_GraphSnapshot":
+        return self._snapshot
+
+    def __len__(self) -> int:
+        return len(self._snapshot.chunk_ids)
+
+
+class _GraphSnapshot:
+    """Vista inmutable del grafo usada por las búsquedas."""
+
+    def __init__(self, chunk_ids, texts, metadata, embeddings, indptr, indices, weights):
+        self.chunk_ids = chunk_ids
+        self.texts = texts
+        self.metadata = metadata
+        self.embeddings = embeddings
+        self.indptr = indptr
+        self.indices = indices
+        self.weights = weights
+
+    @classmethod
+    def empty(cls) -> "_GraphSnapshot":
+        return cls(
+            chunk_ids=[],
+            texts=[],
+            metadata=[],
+            embeddings=np.zeros((0, 0), dtype="float32"),
+            indptr=np.zeros(1, dtype=np.int64),
+            indices=np.zeros(0, dtype=np.int64),
+            weights=np.zeros(0, dtype="float32"),
+        )
+
+    def vector_search(self, qvec, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-k por similitud coseno. Devuelve (posiciones, scores)."""
+        if not self.chunk_ids:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype="float32")
+
+        q = _normalize(np.array(qvec, dtype="float32").reshape(1, -1))[0]
+        scores = self.embeddings @ q
+
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return top, scores[top]
+
+    def neighbors(self, pos: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Vecinos :SIMILAR_TO de un chunk. Devuelve (posiciones, pesos)."""
+        start, end = self.indptr[pos], self.indptr[pos + 1]
+        return self.indices[start:end], self.weights[start:end]
+
+
+def _normalize(vecs: np.ndarray) -> np.ndarray:
+    if vecs.size == 0:
+        return vecs
+    norms = np.linalg.norm(vecs, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vecs / norms
+
+
+class EmbeddedGraphIndexer:
+    """
+    Indexador con la misma interfaz que Neo4jGraphIndexer pero sobre
+    EmbeddedGraphStore: no requiere servidor ni red.
+    - Crea nodos (chunks) con embeddings
+    - Crea aristas (:SIMILAR_TO) basado en la similitud de los embeddings.
+    """
+
+    # Cada versión del índice usa su propio EmbeddedGraphStore (ver IndexVersions)
+    supports_hot_swap = True
+
+    def __init__(self, config: RAGConfig, embedder, store: Optional[EmbeddedGraphStore] = None):
+        self.config = config
+        self.embedder = embedder
+        self.store = store if store is not None else EmbeddedGraphStore.get_instance()
+
+    def index_documents(self, chunk_docs):
+        """
+        Procesa e indexa una lista de chunks (o el ChunkEmbeddings de la ingesta).
+        Igual que en Neo4j, los documentos con la misma huella se omiten.
+        """
+        chunk_docs, chunks = unpack_chunks(chunk_docs)
+        if not chunk_docs:
+            print(" No hay chunks para indexar.")
+            return
+
+        indexed = self.store.documents()
+        pending = {}
+        for doc_id, docs in group_by_document(chunk_docs).items():
+            fingerprint = document_fingerprint(self.config, docs)
+            if indexed.get(doc_id, {}).get("fingerprint") == fingerprint:
+                print(f" Documento ya indexado, se omite: {doc_id}")
+                continue
+            if doc_id in indexed:
+                self.store.delete_document(doc_id)
+            pending[doc_id] = (fingerprint, docs)
+
+        if not pending:
+            print(" Todos los documentos ya están indexados; se reutiliza el grafo embebido.")
+            return
+
+        chunk_docs = [doc for _, docs in pending.values() for doc in docs]
+        print(f" Indexando {len(chunk_docs)} chunks en el grafo embebido...")
+
+        if chunks is not None:
+            embeddings = chunks.vectors_for(chunk_docs)
+        else:
+            texts = [d.page_content for d in chunk_docs]
+            embeddings = self.embedder.embed_documents(texts) # batch embedding
+
+        chunks_to_add = []
+        for _, docs in pending.values():
+            for i, doc in enumerate(docs):
+                # Mismo ID que en Neo4j (Source + Página + Índice del chunk)
+                chunk_id = f"{os.path.basename(doc.metadata.get('doc_id',''))}::p{doc.metadata.get('page_number',0)}::c{i}"
+
+                chunks_to_add.append({
+                    "chunk_id": chunk_id,
+                    "text": doc.page_content,
+                    **doc.metadata
+                })
+
+        positions = self.store.upsert_chunks(chunks_to_add, embeddings)
+
+        edges = similarity_edges(
+            embeddings,
+            self.config.edge_similarity_threshold,
+            self.config.edge_top_k
+        )
+        self.store.add_edges([(positions[i], positions[j], score) for i, j, score in edges])
+
+        for doc_id, (fingerprint, docs) in pending.items():
+            self.store.register_document(doc_id, fingerprint, len(docs), docs[0].metadata)
+
+        print(f" Indexación en grafo embebido completada. Nodos: {len(chunks_to_add)}.")
+
+    def delete_document(self, doc_id: str):
+        self.store.delete_document(doc_id)
+        print(f"Documento eliminado del grafo: {doc_id}")
+
+    def list_documents(self) -> List[Dict]:
+        return [
+            {"doc_id": doc_id, "chunk_count": info["chunk_count"]}
+            for doc_id, info in sorted(self.store.documents().items())
+        ]
+
+    def clear_graph(self):
+        """Remove all chunks and similarity relationships."""
+        self.store.clear()
+        print("Embedded graph cleaned.")
+
+    def release(self):
+        """Libera el grafo de una versión de índice ya reemplazada (ver IndexVersions)."""
+        EmbeddedGraphStore.discard(self.store)
+
+    def close(self):
+        pass
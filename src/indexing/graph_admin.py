@@ -0,0 +1,48 @@
+import sys
+
+from src.config import RAGConfig
+from src.indexing.document_processor import DocumentProcessor
+from src.indexing.neo4j_graph_indexer import Neo4jGraphIndexer
+
+USAGE = """
+Uso:
+
+python -m src.indexing.graph_admin list              → documentos indexados
+python -m src.indexing.graph_admin delete <doc_id>   → borra un documento (en lotes)
+python -m src.indexing.graph_admin clear             → borra todo el grafo (en lotes)
+"""
+
+
+def main(args):
+    """
+    Operaciones administrativas sobre el grafo persistente en Neo4j.
+    El grafo ya NO se limpia al salir de main.py; se administra aquí.
+    """
+    config = RAGConfig()
+    indexer = Neo4jGraphIndexer(config, DocumentProcessor(config).get_embeddings())
+
+    command = args[0] if args else "list"
+
+    if command == "list":
+        docs = indexer.list_documents()
+        if not docs:
+            print("No hay documentos indexados en el grafo.")
+        for doc in docs:
+            print(f"{doc['doc_id']}  chunks={doc['chunk_count']}  indexado={doc['indexed_at']}")
+
+    elif command == "delete" and len(args) > 1:
+        for doc_id in args[1:]:
+            indexer.delete_document(doc_id)
+
+    elif command == "clear":
+        indexer.clear_graph()
+
+    else:
+        print(USAGE)
+        return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
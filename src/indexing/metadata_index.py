@@ -0,0 +1,111 @@
+from typing import Any, Dict, Iterable, List
+from langchain_core.documents import Document
+
+# Campos de metadata a nivel documento que se pueden consultar directamente
+# (autor, año, DOI, etc.). También es la lista blanca de propiedades que se
+# aceptan en consultas a Neo4j.
+METADATA_FIELDS = (
+    "title",
+    "author_real",
+    "year",
+    "doi",
+    "issn",
+    "journal",
+    "volume",
+    "issue",
+    "keywords",
+    "tags",
+    "emails",
+    "orcids",
+    "source",
+)
+
+# Campos con índice de propiedad en los nodos :Document de Neo4j
+INDEXED_FIELDS = ("author_real", "year", "doi", "title")
+
+
+class DocumentMetadataIndex:
+    """
+    Tabla en memoria de metadata por documento.
+
+    Se construye una sola vez al indexar (a partir de los chunks o de los
+    nodos :Document de Neo4j) y precalcula, por campo, los valores distintos
+    y el índice inverso valor → documentos. Así las preguntas de metadata
+    (autor, año, DOI...) se responden con una consulta a diccionario, sin
+    recorrer los chunks, sin importar cuántos documentos haya.
+    """
+
+    def __init__(self):
+        self.documents: Dict[str, Dict[str, Any]] = {}
+        # campo -> {clave normalizada: primer valor visto}; misma clave que el índice inverso
+        self._values: Dict[str, Dict[str, Any]] = {}
+        self._inverted: Dict[str, Dict[str, List[str]]] = {}
+
+    @classmethod
+    def from_documents(cls, chunk_docs: Iterable[Document]) -> "DocumentMetadataIndex":
+        index = cls()
+        for doc in chunk_docs:
+            doc_id = doc.metadata.get("doc_id", "")
+            if doc_id not in index.documents:
+                index.add(doc_id, doc.metadata)
+        return index
+
+    @classmethod
+    def from_records(cls, records: Iterable[Dict[str, Any]]) -> "DocumentMetadataIndex":
+        """Construye la tabla a partir de registros {doc_id, ...campos}."""
+        index = cls()
+        for rec in records:
+            rec = dict(rec)
+            index.add(rec.pop("doc_id", ""), rec)
+        return index
+
+    def add(self, doc_id: str, metadata: Dict[str, Any]):
+        """Registra (o reemplaza) la metadata de un documento."""
+        if doc_id in self.documents:
+            self.remove(doc_id)
+
+        entry = document_metadata(metadata)
+        self.documents[doc_id] = entry
+
+        for field, value in entry.items():
+            key = _value_key(value)
+            self._values.setdefault(field, {}).setdefault(key, value)
+            self._inverted.setdefault(field, {}).setdefault(key, []).append(doc_id)
+
+    def remove(self, doc_id: str):
+        entry = self.documents.pop(doc_id, None)
+        if entry is None:
+            return
+
+        for field, value in entry.items():
+            key = _value_key(value)
+            doc_ids = self._inverted[field][key]
+            doc_ids.remove(doc_id)
+            if not doc_ids:
+                del self._inverted[field][key]
+                del self._values[field][key]
+
+    def values(self, field: str) -> List[Any]:
+        """Valores distintos de un campo en todos los documentos."""
+        return list(self._values.get(field, {}).values())
+
+    def lookup(self, field: str, value: Any) -> List[str]:
+        """doc_ids cuyo campo tiene exactamente ese valor."""
+        return list(self._inverted.get(field, {}).get(_value_key(value), []))
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+
+def _value_key(value: Any) -> str:
+    """Forma única de un valor para indexarlo: 2020 y "2020" son el mismo año."""
+    return str(value)
+
+
+def document_metadata(metadata: Dict[str, Any]) -> Dict[str, Any]:
+    """Filtra la metadata de un chunk a los campos de nivel documento."""
+    return {
+        field: metadata[field]
+        for field in METADATA_FIELDS
+        if metadata.get(field) not in (None, "", [])
+    }
@@ -0,0 +1,296 @@
+import atexit
+import os
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from neo4j import (
+    AsyncDriver, AsyncGraphDatabase, Driver, GraphDatabase,
+    READ_ACCESS, WRITE_ACCESS, unit_of_work
+)
+
+from src.config import RAGConfig
+from src.deadline import DeadlineExceeded
+from src.metrics import REGISTRY, collect_stats
+
+# Nota: Neo4j Python Driver debe estar instalado (pip install neo4j)
+
+
+class Neo4jDriverManager:
+    """
+    Administrador de conexión a Neo4j compartido por todo el proceso.
+
+    - Un solo Driver (y un solo pool de conexiones) por URI/usuario/base de datos
+    - Sesiones de lectura y escritura con el modo de acceso correcto (routing)
+    - Transacciones administradas (execute_read / execute_write) con reintentos
+    - Driver asíncrono (aexecute_read) para el servicio RAG, creado al primer uso
+    - Métricas de uso del pool (sesiones activas, pico, transacciones, reintentos)
+
+    Indexador, retriever y clases RAG deben obtener la instancia con
+    `Neo4jDriverManager.get_instance(config)` en lugar de crear su propio driver.
+    """
+
+    _instances: Dict[Tuple[str, str, Optional[str]], "Neo4jDriverManager"] = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, config: RAGConfig):
+        self.config = config
+        self.database = config.neo4j_database or None
+
+        self.driver: Driver = self._create_driver()
+        # Driver async: se crea dentro del event loop que lo usa (aexecute_read)
+        self.async_driver: Optional[AsyncDriver] = None
+        self.closed = False
+        # Sube cada vez que este proceso indexa o borra documentos (ver corpus_changed)
+        self.corpus_generation = 0
+
+        # Métricas de uso del pool
+        self._metrics_lock = threading.Lock()
+        self._sessions_active = 0
+        self._sessions_peak = 0
+        self._sessions_total = 0
+        self._transactions_total = 0
+        self._retries_total = 0
+        self._failures_total = 0
+
+    def _create_driver(self) -> Driver:
+        return GraphDatabase.driver(self.config.neo4j_uri, **self._driver_options())
+
+    def _create_async_driver(self) -> AsyncDriver:
+        return AsyncGraphDatabase.driver(self.config.neo4j_uri, **self._driver_options())
+
+    def _driver_options(self) -> Dict[str, Any]:
+        config = self.config
+        return dict(
+            auth=(config.neo4j_user, config.neo4j_password),
+            max_connection_pool_size=config.neo4j_max_pool_size,
+            connection_acquisition_timeout=config.neo4j_acquisition_timeout,
+            max_transaction_retry_time=config.neo4j_max_retry_time,
+        )
+
+    # ------------------------------------------------------------------
+    # Instancia compartida
+    # ------------------------------------------------------------------
+    @classmethod
+    def get_instance(cls, config: RAGConfig) -> "Neo4jDriverManager":
+        """Devuelve (o crea) el administrador compartido para esta configuración."""
+        key = (config.neo4j_uri, config.neo4j_user, config.neo4j_database or None)
+        with cls._instances_lock:
+            manager = cls._instances.get(key)
+            if manager is None or manager.closed:
+                manager = cls(config)
+                cls._instances[key] = manager
+            return manager
+
+    @classmethod
+    def close_all(cls):
+        """Cierra todos los drivers compartidos (se llama al salir del proceso)."""
+        with cls._instances_lock:
+            managers = list(cls._instances.values())
+            cls._instances.clear()
+        for manager in managers:
+            manager.close()
+
+    # ------------------------------------------------------------------
+    # Sesiones y transacciones
+    # ------------------------------------------------------------------
+    @contextmanager
+    def session(self, access_mode: str = WRITE_ACCESS):
+        """Abre una sesión del pool compartido con el modo de acceso indicado."""
+        self._session_opened()
+        try:
+            with self.driver.session(
+                database=self.database,
+                default_access_mode=access_mode
+            ) as session:
+                yield session
+        finally:
+            with self._metrics_lock:
+                self._sessions_active -= 1
+
+    def corpus_changed(self):
+        """Lo llaman los escritores del grafo: las tablas en memoria derivadas se recargan."""
+        with self._metrics_lock:
+            self.corpus_generation += 1
+
+    def _session_opened(self):
+        with self._metrics_lock:
+            self._sessions_active += 1
+            self._sessions_total += 1
+            self._sessions_peak = max(self._sessions_peak, self._sessions_active)
+
+    def execute_read(self, query: str, timeout: Optional[float] = None, **params) -> List[Dict[str, Any]]:
+        """
+        Ejecuta una consulta de lectura en una transacción administrada.
+        `timeout` (segundos) lo aplica el servidor a la transacción.
+        """
+        def work(tx):
+            return tx.run(query, **params).data()
+
+        return self._execute(READ_ACCESS, work, timeout)
+
+    async def aexecute_read(self, query: str, timeout: Optional[float] = None, **params) -> List[Dict[str, Any]]:
+        """
+        Igual que execute_read pero con el driver asíncrono: la espera al
+        servidor no ocupa un hilo. Debe llamarse siempre desde el mismo event loop.
+        """
+        if self.async_driver is None:
+            self.async_driver = self._create_async_driver()
+
+        attempts = 0
+
+        async def work(tx):
+            nonlocal attempts
+            attempts += 1
+            result = await tx.run(query, **params)
+            return await result.data()
+
+        work = _with_timeout(work, timeout)
+
+        self._session_opened()
+        try:
+            async with self.async_driver.session(
+                database=self.database,
+                default_access_mode=READ_ACCESS
+            ) as session:
+                return await session.execute_read(work)
+        except Exception:
+            with self._metrics_lock:
+                self._failures_total += 1
+            raise
+        finally:
+            with self._metrics_lock:
+                self._sessions_active -= 1
+                self._transactions_total += 1
+                self._retries_total += max(attempts - 1, 0)
+
+    def execute_write(self, query: str, timeout: Optional[float] = None, **params):
+        """Ejecuta una consulta de escritura en una transacción administrada."""
+        def work(tx):
+            return tx.run(query, **params).consume()
+
+        return self._execute(WRITE_ACCESS, work, timeout)
+
+    def run_autocommit(self, query: str, **params):
+        """
+        Ejecuta una consulta en una transacción implícita (auto-commit).
+        Necesario para cambios de esquema y `CALL {} IN TRANSACTIONS`.
+        """
+        with self._metrics_lock:
+            self._transactions_total += 1
+        try:
+            with self.session(WRITE_ACCESS) as session:
+                return session.run(query, **params).consume()
+        except Exception:
+            with self._metrics_lock:
+                self._failures_total += 1
+            raise
+
+    def _execute(self, access_mode: str, work: Callable, timeout: Optional[float] = None):
+        # El driver vuelve a invocar la función si la transacción falla con un
+        # error transitorio; contamos los intentos para reportar reintentos.
+        attempts = 0
+
+        def counted(tx):
+            nonlocal attempts
+            attempts += 1
+            return work(tx)
+
+        counted = _with_timeout(counted, timeout)
+
+        try:
+            with self.session(access_mode) as session:
+                if access_mode == READ_ACCESS:
+                    return session.execute_read(counted)
+                return session.execute_write(counted)
+        except Exception:
+            with self._metrics_lock:
+                self._failures_total += 1
+            raise
+        finally:
+            with self._metrics_lock:
+                self._transactions_total += 1
+                self._retries_total += max(attempts - 1, 0)
+
+    # ------------------------------------------------------------------
+    # Utilidades
+    # ------------------------------------------------------------------
+    def verify_connectivity(self):
+        self.driver.verify_connectivity()
+
+    def metrics(self) -> Dict[str, int]:
+        """Métricas de uso del pool compartido."""
+        with self._metrics_lock:
+            return {
+                "max_pool_size": self.config.neo4j_max_pool_size,
+                "sessions_active": self._sessions_active,
+                "sessions_peak": self._sessions_peak,
+                "sessions_total": self._sessions_total,
+                "transactions_total": self._transactions_total,
+                "retries_total": self._retries_total,
+                "failures_total": self._failures_total,
+            }
+
+    @classmethod
+    def _after_fork(cls):
+        """
+        En un proceso hijo (workers del servicio RAG) los sockets del pool
+        heredado pertenecen al padre: cada administrador abre un driver nuevo
+        sin cerrar el heredado.
+        """
+        cls._instances_lock = threading.Lock()
+        for manager in cls._instances.values():
+            manager._metrics_lock = threading.Lock()
+            manager.async_driver = None
+            if not manager.closed:
+                manager.driver = manager._create_driver()
+
+    @classmethod
+    def collect_metrics(cls):
+        """Métricas de todos los pools abiertos, para el registro Prometheus."""
+        with cls._instances_lock:
+            managers = list(cls._instances.values())
+        samples = []
+        for manager in managers:
+            samples.extend(collect_stats(
+                "neo4j_pool", manager.metrics(),
+                counters=("sessions_total", "transactions_total", "retries_total", "failures_total"),
+                gauges=("sessions_active", "sessions_peak", "max_pool_size"),
+                help="Pool de conexiones Neo4j",
+                labels={"uri": manager.config.neo4j_uri}
+            ))
+        return samples
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.driver.close()
+
+    @classmethod
+    async def aclose_all(cls):
+        """Cierra los drivers async; se llama al detener el event loop que los usa."""
+        with cls._instances_lock:
+            managers = list(cls._instances.values())
+        for manager in managers:
+            driver, manager.async_driver = manager.async_driver, None
+            if driver is not None:
+                await driver.close()
+
+
+def _with_timeout(work: Callable, timeout: Optional[float]) -> Callable:
+    """
+    Aplica el timeout (segundos) a la transacción en el servidor. Para el
+    driver timeout=0 significa "sin límite": con el presupuesto ya agotado
+    la transacción no se abre.
+    """
+    if timeout is None:
+        return work
+    if timeout <= 0:
+        raise DeadlineExceeded("Tiempo agotado antes de abrir la transacción en Neo4j")
+    return unit_of_work(timeout=timeout)(work)
+
+
+atexit.register(Neo4jDriverManager.close_all)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=Neo4jDriverManager._after_fork)
+REGISTRY.register_collector(Neo4jDriverManager.collect_metrics)
@@ -1,10 +1,12 @@
 import os
-import numpy as np
-from neo4j import GraphDatabase, Driver
-from typing import List, Dict
-from sklearn.metrics.pairwise import cosine_similarity
+from typing import List, Dict, Tuple
 
 from src.config import RAGConfig
+from src.indexing.chunk_embeddings import unpack_chunks
+from src.indexing.document_processor import document_fingerprint, group_by_document
+from src.indexing.metadata_index import INDEXED_FIELDS, document_metadata
+from src.indexing.neo4j_connection import Neo4jDriverManager
+from src.indexing.similarity_edges import similarity_edges
 
 # Nota: Neo4j Python Driver debe estar instalado (pip install neo4j)
 
@@ -13,25 +15,26 @@ class Neo4jGraphIndexer:
     Indexador que guarda los chunks de texto y sus embeddings en Neo4j.
     - Crea nodos (:Chunk)
     - Crea aristas (:SIMILAR_TO) basado en la similitud de los embeddings.
+    - Registra cada documento (:Document) con su huella de contenido para no
+      re-indexar en cada ejecución lo que ya está en el grafo.
     """
 
+    # Un solo grafo persistente para todas las versiones: sin recarga en caliente (ver IndexVersions)
+    supports_hot_swap = False
+
     def __init__(self, config: RAGConfig, embedder):
         self.config = config
         self.embedder = embedder
         
-        # Conexión a Neo4j (usa las variables de entorno de tu archivo .env)
-        uri = os.environ.get("NEO4J_URI", "bolt://localhost:7687")
-        user = os.environ.get("NEO4J_USER", "neo4j")
-        password = os.environ.get("NEO4J_PASSWORD", "neo4jpassword")
-        
-        self.driver: Driver = GraphDatabase.driver(uri, auth=(user, password))
+        # Conexión a Neo4j mediante el pool compartido del proceso
+        self.neo4j = Neo4jDriverManager.get_instance(config)
         self._check_connection()
         self._setup_constraints()
         self._setup_vector_index()
 
     def _check_connection(self):
         try:
-            self.driver.verify_connectivity()
+            self.neo4j.verify_connectivity()
             print(" Conexión a Neo4j exitosa.")
         except Exception as e:
             print(f" Error de conexión a Neo4j: {e}")
@@ -45,8 +48,26 @@ class Neo4jGraphIndexer:
         FOR (c:Chunk)
         REQUIRE c.chunk_id IS UNIQUE
         """
-        with self.driver.session() as session:
-            session.run(query)
+        self.neo4j.run_autocommit(query)
+
+        self.neo4j.run_autocommit("""
+        CREATE CONSTRAINT document_id_constraint IF NOT EXISTS
+        FOR (d:Document)
+        REQUIRE d.doc_id IS UNIQUE
+        """)
+
+        # Índice para borrar/consultar chunks por documento sin escanear todo
+        self.neo4j.run_autocommit("""
+        CREATE INDEX chunk_doc_id IF NOT EXISTS
+        FOR (c:Chunk) ON (c.doc_id)
+        """)
+
+        # Índices de propiedad para consultas de metadata (autor, año, DOI...)
+        for field in INDEXED_FIELDS:
+            self.neo4j.run_autocommit(f"""
+            CREATE INDEX document_{field} IF NOT EXISTS
+            FOR (d:Document) ON (d.{field})
+            """)
 
     def _setup_vector_index(self):
         """Crea el índice vectorial para búsquedas por embedding."""
@@ -60,44 +81,117 @@ class Neo4jGraphIndexer:
           }}
         }}
         """
-        with self.driver.session() as session:
-            session.run(query)
+        self.neo4j.run_autocommit(query)
 
-    def index_documents(self, chunk_docs: List[dict]):
+    def index_documents(self, chunk_docs):
         """
-        Procesa e indexa una lista de chunks.
+        Procesa e indexa una lista de chunks (o el ChunkEmbeddings de la
+        ingesta, cuyos embeddings se reutilizan en vez de recalcularse).
+        Los documentos cuya huella ya está registrada en el grafo se omiten;
+        los que cambiaron se borran y se vuelven a indexar.
         """
+        chunk_docs, chunks = unpack_chunks(chunk_docs)
         if not chunk_docs:
             print(" No hay chunks para indexar.")
             return
 
+        pending = self._pending_documents(chunk_docs)
+        if not pending:
+            print(" Todos los documentos ya están indexados en Neo4j; se reutiliza el grafo.")
+            return
+
+        chunk_docs = [doc for _, docs in pending.values() for doc in docs]
         print(f" Indexando {len(chunk_docs)} chunks en Neo4j...")
         
         # 1. Crear nodos y obtener embeddings
         chunks_to_add = []
-        texts = [d.page_content for d in chunk_docs]
-        embeddings = self.embedder.embed_documents(texts) # batch embedding
+        if chunks is not None:
+            embeddings = chunks.vectors_for(chunk_docs).tolist()
+        else:
+            texts = [d.page_content for d in chunk_docs]
+            embeddings = self.embedder.embed_documents(texts) # batch embedding
         
-        for i, doc in enumerate(chunk_docs):
-            # Crear un ID único para el chunk (Source + Página + Índice del chunk)
-            chunk_id = f"{os.path.basename(doc.metadata.get('doc_id',''))}::p{doc.metadata.get('page_number',0)}::c{i}"
-            
-            chunks_to_add.append({
-                "chunk_id": chunk_id,
-                "text": doc.page_content,
-                "embedding": embeddings[i],
-                # Copiar metadata como propiedades separadas en el nodo
-                **doc.metadata
-            })
+        for _, docs in pending.values():
+            for i, doc in enumerate(docs):
+                # Crear un ID único para el chunk (Source + Página + Índice del chunk)
+                chunk_id = f"{os.path.basename(doc.metadata.get('doc_id',''))}::p{doc.metadata.get('page_number',0)}::c{i}"
+
+                chunks_to_add.append({
+                    "chunk_id": chunk_id,
+                    "text": doc.page_content,
+                    "embedding": embeddings[len(chunks_to_add)],
+                    # Copiar metadata como propiedades separadas en el nodo
+                    **doc.metadata
+                })
         
         # Transacción para crear NODOS (:Chunk)
         self._create_chunk_nodes(chunks_to_add)
         
         # 2. Crear relaciones de Similitud (:SIMILAR_TO)
         self._create_similarity_relationships(chunks_to_add, embeddings)
+
+        # 3. Registrar los documentos indexados con su huella
+        self._register_documents(pending)
+        self.neo4j.corpus_changed()
         
         print(f" Indexación en Neo4j completada. Nodos: {len(chunks_to_add)}.")
 
+    def _pending_documents(self, chunk_docs: List[dict]) -> Dict[str, Tuple[str, List]]:
+        """
+        Devuelve {doc_id: (huella, chunks)} de los documentos que faltan en el
+        grafo o cuya huella cambió (estos últimos se borran antes).
+        """
+        groups = group_by_document(chunk_docs)
+        fingerprints = {
+            doc_id: document_fingerprint(self.config, docs)
+            for doc_id, docs in groups.items()
+        }
+
+        records = self.neo4j.execute_read(
+            """
+            MATCH (d:Document)
+            WHERE d.doc_id IN $doc_ids
+            RETURN d.doc_id AS doc_id, d.fingerprint AS fingerprint
+            """,
+            doc_ids=list(groups)
+        )
+        indexed = {rec["doc_id"]: rec["fingerprint"] for rec in records}
+
+        pending = {}
+        for doc_id, docs in groups.items():
+            if indexed.get(doc_id) == fingerprints[doc_id]:
+                print(f" Documento ya indexado, se omite: {doc_id}")
+                continue
+            if doc_id in indexed:
+                print(f" Documento modificado, se re-indexa: {doc_id}")
+                self.delete_document(doc_id)
+            pending[doc_id] = (fingerprints[doc_id], docs)
+
+        return pending
+
+    def _register_documents(self, pending: Dict[str, Tuple[str, List]]):
+        """
+        Crea/actualiza los nodos :Document con su huella de contenido y la
+        metadata del documento (autor, año, DOI...) para consultas indexadas.
+        """
+        query = """
+        UNWIND $docs AS doc
+        MERGE (d:Document {doc_id: doc.doc_id})
+        SET d += doc.metadata,
+            d.fingerprint = doc.fingerprint,
+            d.chunk_count = doc.chunk_count,
+            d.indexed_at = datetime()
+        """
+        docs = [
+            {
+                "doc_id": doc_id,
+                "fingerprint": fingerprint,
+                "chunk_count": len(chunks),
+                "metadata": document_metadata(chunks[0].metadata),
+            }
+            for doc_id, (fingerprint, chunks) in pending.items()
+        ]
+        self.neo4j.execute_write(query, docs=docs)
 
     def _create_chunk_nodes(self, chunks: List[Dict]):
         """Crea los nodos :Chunk en Neo4j."""
@@ -106,43 +200,22 @@ class Neo4jGraphIndexer:
         MERGE (c:Chunk {chunk_id: chunk.chunk_id})
         SET c += chunk
         """
-        with self.driver.session() as session:
-            session.run(query, chunks=chunks)
+        self.neo4j.execute_write(query, chunks=chunks)
 
     def _create_similarity_relationships(self, chunks: List[Dict], embeddings: List[List[float]]):
         """Crea aristas de similitud entre los nuevos chunks."""
-        
-        # Convertir embeddings a numpy array para cálculo rápido
-        vecs = np.array(embeddings, dtype="float32")
-        norms = np.linalg.norm(vecs, axis=1, keepdims=True)
-        norms[norms == 0] = 1.0
-        vecs = vecs / norms
-        
-        # Calcular similitud coseno entre todos los chunks añadidos
-        sim = cosine_similarity(vecs)
-        n = sim.shape[0]
-        
-        relationships = []
-        
-        for i in range(n):
-            # Obtener índices de los chunks más similares (incluye a sí mismo)
-            idxs = np.argsort(-sim[i])
-            
-            # Recorrer los top-K o sobre el umbral
-            # Empezamos desde el índice 1 para saltar la similitud con sigo mismo
-            for j in idxs[1:]: 
-                score = float(sim[i, j])
-                
-                # Aplicar las restricciones de configuración
-                if score >= self.config.edge_similarity_threshold or (j < self.config.edge_top_k + 1):
-                    rel = {
-                        "chunk_id_1": chunks[i]["chunk_id"],
-                        "chunk_id_2": chunks[j]["chunk_id"],
-                        "score": score
-                    }
-                    relationships.append(rel)
-                else:
-                    break # Optimización: si ya no pasa el umbral, el resto tampoco
+        relationships = [
+            {
+                "chunk_id_1": chunks[i]["chunk_id"],
+                "chunk_id_2": chunks[j]["chunk_id"],
+                "score": score
+            }
+            for i, j, score in similarity_edges(
+                embeddings,
+                self.config.edge_similarity_threshold,
+                self.config.edge_top_k
+            )
+        ]
 
         # Transacción para crear RELACIONES (:SIMILAR_TO)
         rel_query = """
@@ -152,19 +225,60 @@ class Neo4jGraphIndexer:
         MERGE (c1)-[s:SIMILAR_TO]-(c2)
         SET s.weight = rel.score
         """
-        with self.driver.session() as session:
-            session.run(rel_query, rels=relationships)
+        self.neo4j.execute_write(rel_query, rels=relationships)
+
+    def delete_document(self, doc_id: str):
+        """Borra los chunks de un documento en lotes (CALL {} IN TRANSACTIONS)."""
+        batch_size = int(self.config.graph_delete_batch_size)
+        query = f"""
+        MATCH (c:Chunk {{doc_id: $doc_id}})
+        CALL {{ WITH c DETACH DELETE c }} IN TRANSACTIONS OF {batch_size} ROWS
+        """
+        self.neo4j.run_autocommit(query, doc_id=doc_id)
+        self.neo4j.execute_write(
+            "MATCH (d:Document {doc_id: $doc_id}) DETACH DELETE d",
+            doc_id=doc_id
+        )
+        self.neo4j.corpus_changed()
+        print(f"Documento eliminado del grafo: {doc_id}")
+
+    def list_documents(self) -> List[Dict]:
+        """Documentos registrados en el grafo."""
+        return self.neo4j.execute_read("""
+        MATCH (d:Document)
+        RETURN d.doc_id AS doc_id, d.chunk_count AS chunk_count,
+               toString(d.indexed_at) AS indexed_at
+        ORDER BY d.doc_id
+        """)
+
     def clear_graph(self):
-        """Remove all chunks and similarity relationships."""
-        query = """
-        MATCH (c:Chunk)
-        DETACH DELETE c
         """
-        with self.driver.session() as session:
-            session.run(query)
+        Remove all chunks, documents and similarity relationships.
+        Operación administrativa explícita (ver src.indexing.graph_admin);
+        el borrado se hace en lotes para no crear una transacción gigante.
+        """
+        for doc in self.list_documents():
+            self.delete_document(doc["doc_id"])
+
+        # Chunks huérfanos (p. ej. indexados antes de registrar :Document)
+        batch_size = int(self.config.graph_delete_batch_size)
+        self.neo4j.run_autocommit(f"""
+        MATCH (c:Chunk)
+        CALL {{ WITH c DETACH DELETE c }} IN TRANSACTIONS OF {batch_size} ROWS
+        """)
         print("Neo4j graph cleaned.")
 
 
+    def release(self):
+        """
+        El grafo de Neo4j es persistente y compartido por el proceso: no hay
+        datos propios de una versión que liberar.
+        """
+        pass
+
     def close(self):
-        """Cierra la conexión al driver de Neo4j."""
-        self.driver.close()
+        """
+        El driver es compartido por todo el proceso (ver Neo4jDriverManager),
+        así que aquí no se cierra; se libera al salir del proceso.
+        """
+        pass
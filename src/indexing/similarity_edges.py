@@ -0,0 +1,48 @@
+import numpy as np
+from typing import List, Tuple
+from sklearn.metrics.pairwise import cosine_similarity
+
+
+def similarity_edges(
+    embeddings,
+    threshold: float,
+    top_k: int
+) -> List[Tuple[int, int, float]]:
+    """
+    Calcula las aristas (:SIMILAR_TO) entre chunks a partir de sus embeddings.
+    Devuelve tuplas (i, j, score) con los índices de los chunks.
+
+    Compartido por el indexador de Neo4j y el grafo embebido para que ambos
+    backends construyan exactamente el mismo grafo.
+    """
+    # Convertir embeddings a numpy array para cálculo rápido
+    vecs = np.array(embeddings, dtype="float32")
+    if vecs.size == 0:
+        return []
+
+    norms = np.linalg.norm(vecs, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    vecs = vecs / norms
+
+    # Calcular similitud coseno entre todos los chunks añadidos
+    sim = cosine_similarity(vecs)
+    n = sim.shape[0]
+
+    edges = []
+
+    for i in range(n):
+        # Obtener índices de los chunks más similares (incluye a sí mismo)
+        idxs = np.argsort(-sim[i])
+
+        # Recorrer los top-K o sobre el umbral
+        # Empezamos desde el índice 1 para saltar la similitud con sigo mismo
+        for j in idxs[1:]:
+            score = float(sim[i, j])
+
+            # Aplicar las restricciones de configuración
+            if score >= threshold or (j < top_k + 1):
+                edges.append((i, int(j), score))
+            else:
+                break # Optimización: si ya no pasa el umbral, el resto tampoco
+
+    return edges
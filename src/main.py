@@ -1,10 +1,14 @@
 import sys
+import time
 from dotenv import load_dotenv
 
 load_dotenv()
 
 from src.config import RAGConfig
+from src.deadline import Deadline
 from src.indexing.document_processor import DocumentProcessor
+from src.metrics import serve_metrics
+from src.retrieval.index_versions import IndexVersions
 
 # Intentaremos importar el indexador de Neo4j.
 # Si no está instalado o hay error de import, marcamos bandera.
@@ -18,8 +22,8 @@ except Exception as e:
     NEO4J_IMPORT_ERROR = e
 
 
-def build_naive_rag(config, documents, model_name: str):
-    """Construye el RAG-Naive (FAISS + GPT o LOCAL)."""
+def build_naive_rag(config, chunks, model_name: str):
+    """Construye el RAG-Naive (FAISS + GPT o LOCAL) sobre los chunks ya embebidos."""
     from src.generation.gpt_rag import GPTRAG as NaiveGPTRAG
     from src.generation.local_rag import LocalRAG
     from src.generation.remote_rag import RemoteRAG
@@ -28,49 +32,72 @@ def build_naive_rag(config, documents, model_name: str):
 
     if model_name == "LOCAL":
         print("Usando modelo LOCAL con RAG-Naive")
-        rag = LocalRAG(config, documents)
+        rag = LocalRAG(config, chunks)
         used_model = "LOCAL"
     elif model_name == "REMOTE":
         print("Usando modelo REMOTE con RAG-Naive")
-        rag = RemoteRAG(config, documents)
+        rag = RemoteRAG(config, chunks)
         used_model = "REMOTE"
     else:
         print("Usando modelo GPT con RAG-Naive")
-        rag = NaiveGPTRAG(config, documents)
+        rag = NaiveGPTRAG(config, chunks)
         used_model = "GPT"
 
     return rag, used_model
 
 
-def build_graph_rag(config, doc_processor, documents):
-    """Construye el Graph-RAG (Neo4j). Puede lanzar excepción si falla."""
+def build_graph_rag(config, chunks, graph_store: str = "default"):
+    """
+    Construye el Graph-RAG (Neo4j o grafo embebido según config.graph_backend).
+    El indexador y el retriever local (FAISS) comparten los mismos embeddings
+    (`chunks`, un ChunkEmbeddings): cada chunk se embebe una sola vez.
+    `graph_store` nombra el grafo embebido (uno por versión del índice).
+    Puede lanzar excepción si falla.
+    """
+    from src.generation.gpt_rag_graph import GPTRAG as GraphGPTRAG
+
+    if config.graph_backend == "embedded":
+        from src.indexing.embedded_graph_store import EmbeddedGraphIndexer, EmbeddedGraphStore
+        from src.retrieval.embedded_graph_retriever import EmbeddedGraphRetriever
+
+        print("Indexando chunks en el grafo embebido...")
+        store = EmbeddedGraphStore.get_instance(graph_store)
+        indexer = EmbeddedGraphIndexer(config, chunks.embedder, store=store)
+        indexer.index_documents(chunks)
+        print("Indexación en grafo embebido completada.")
+
+        graph_retriever = EmbeddedGraphRetriever(config, chunks.embedder, store=store)
+        rag = GraphGPTRAG(config, chunks, graph_retriever=graph_retriever)
+        return rag, indexer
+
     if not NEO4J_IMPORT_OK:
         raise RuntimeError(
             f"No se pudo importar Neo4jGraphIndexer: {NEO4J_IMPORT_ERROR}"
         )
 
-    from src.generation.gpt_rag_graph import GPTRAG as GraphGPTRAG
-
     print("Indexando chunks en Neo4j...")
-    indexer = Neo4jGraphIndexer(config, doc_processor.get_embeddings())
-    indexer.index_documents(documents)
+    indexer = Neo4jGraphIndexer(config, chunks.embedder)
+    indexer.index_documents(chunks)
     print("Indexación en Neo4j completada.")
 
-    rag = GraphGPTRAG(config, documents)
+    rag = GraphGPTRAG(config, chunks)
     return rag, indexer
 
 
-def main(architecture: str = "naive", model: str = "gpt"):
+def build_pipeline(config, architecture: str = "naive", model: str = "gpt",
+                   previous=None, graph_store: str = "default"):
     """
-    architecture: 'naive' o 'graph'
-    model: 'gpt' o 'local' (para naive). En graph sólo usamos GPT.
+    Carga el corpus, lo indexa y construye el RAG (Graph con fallback a Naive).
+    Devuelve (rag, indexer, arquitectura efectiva, modelo efectivo).
+    Lo usan el CLI y el servicio HTTP (src/api/rag_service.py), a través de
+    IndexVersions. Al recargar, `previous` es el ChunkEmbeddings de la versión
+    vigente: se reutilizan su embedder y los embeddings sin cambios.
     """
-
-    config = RAGConfig()
-
     print("Cargando y chunking del PDF...")
     doc_processor = DocumentProcessor(config)
-    documents = doc_processor.load_documents("./data/raw/Article_1.pdf")
+    documents = doc_processor.load_documents(config.corpus_path)
+    # Un solo cálculo de embeddings para el índice de grafo y el retriever local
+    chunks = doc_processor.embed_chunks(documents, previous=previous)
 
     architecture = architecture.lower()
     model = model.lower()
@@ -84,7 +111,7 @@ def main(architecture: str = "naive", model: str = "gpt"):
     if architecture == "graph":
         try:
             print("\n Modo solicitado: GRAPH-RAG")
-            rag, indexer = build_graph_rag(config, doc_processor, documents)
+            rag, indexer = build_graph_rag(config, chunks, graph_store)
             effective_arch = "graph"
             effective_model = "gpt"  # por ahora sólo GPT en graph
         except Exception as e:
@@ -96,13 +123,50 @@ def main(architecture: str = "naive", model: str = "gpt"):
     # 2) Si no se pudo Graph o se pidió Naive directamente
     if architecture == "naive":
         print("\n Modo: RAG-Naive")
-        rag, effective_model = build_naive_rag(config, documents, model)
+        rag, effective_model = build_naive_rag(config, chunks, model)
         effective_arch = "naive"
 
+    return rag, indexer, effective_arch, effective_model
+
+
+def index_versions(config, architecture: str = "naive", model: str = "gpt") -> IndexVersions:
+    """
+    Versiones del pipeline con recarga en caliente: cada versión nueva se
+    construye con build_pipeline reutilizando los embeddings de la vigente.
+    """
+    def build(number: int, previous):
+        chunks = previous.rag.chunk_embeddings if previous is not None else None
+        # Cada versión indexa en su propio grafo embebido; la primera usa el de siempre
+        graph_store = "default" if number == 1 else f"v{number}"
+        return build_pipeline(config, architecture, model, previous=chunks, graph_store=graph_store)
+
+    return IndexVersions(build)
+
+
+def main(architecture: str = "naive", model: str = "gpt"):
+    """
+    architecture: 'naive' o 'graph'
+    model: 'gpt' o 'local' (para naive). En graph sólo usamos GPT.
+    """
+
+    config = RAGConfig()
+
+    if config.metrics_port:
+        serve_metrics(config.metrics_port)
+        print(f"Métricas en http://localhost:{config.metrics_port}/metrics")
+
+    versions = index_versions(config, architecture, model)
+    current = versions.load()
+    # Recarga el índice en segundo plano si cambia el corpus (INDEX_WATCH_INTERVAL)
+    versions.watch(config.corpus_path, config.index_watch_interval)
+
+    # La conversación no depende de la versión del índice: sobrevive a las recargas
+    memory = current.rag.new_memory()
+
     print("\n" + "=" * 60)
-    print(f"Arquitectura en uso : {effective_arch.upper()}")
-    print(f"Modelo de lenguaje  : {effective_model.upper()}")
-    print("Escribe tu pregunta o 'quit' para salir.")
+    print(f"Arquitectura en uso : {current.architecture.upper()}")
+    print(f"Modelo de lenguaje  : {current.model.upper()}")
+    print("Escribe tu pregunta o 'quit' para salir ('reload' recarga el corpus).")
     print("=" * 60 + "\n")
 
     # Bucle de conversación
@@ -117,23 +181,43 @@ def main(architecture: str = "naive", model: str = "gpt"):
                 print("\n ¡Hasta pronto!")
                 break
 
+            if query.lower() == "reload":
+                reason = versions.reload_unsupported()
+                if reason is not None:
+                    print(f" {reason}")
+                elif versions.reload():
+                    print(" Construyendo nueva versión del índice en segundo plano...")
+                else:
+                    print(" Ya hay una recarga en curso.")
+                continue
+
             print("Pensando...")
+            start = time.perf_counter()
+            first_token = None
             try:
-                response = rag.generate_response(query)
+                print("\nAsistente: ", end="", flush=True)
+                # Presupuesto de tiempo de extremo a extremo para esta consulta
+                deadline = Deadline.after(config.request_timeout)
+                with versions.acquire() as version:
+                    for token in version.rag.generate_response_stream(query, deadline=deadline, memory=memory):
+                        if first_token is None:
+                            first_token = time.perf_counter() - start
+                        print(token, end="", flush=True)
             except Exception as e:
                 print(f"\n Error al procesar la consulta: {e}")
                 continue
 
-            print(f"\nAsistente: {response}")
+            # Tiempo al primer token (lo que percibe el usuario) vs. latencia total
+            total = time.perf_counter() - start
+            ttft = f"{first_token:.2f}s" if first_token is not None else "-"
+            print(f"\n\n[primer token: {ttft} | total: {total:.2f}s]")
 
     finally:
-        # Limpieza del grafo sólo si se usó Graph-RAG
-        if indexer is not None:
-            try:
-                print("\n Limpiando grafo Neo4j...")
-                indexer.clear_graph()
-            except Exception as e:
-                print(f" Error durante la limpieza de Neo4j: {e}")
+        # El grafo es persistente entre sesiones: no se limpia al salir.
+        # Para borrarlo: python -m src.indexing.graph_admin clear
+        current = versions.current
+        if current is not None and current.indexer is not None:
+            current.indexer.close()
 
 
 if __name__ == "__main__":
@@ -145,6 +229,8 @@ if __name__ == "__main__":
     python main.py naive local  → naive + LOCAL
     python main.py naive remote → naive + REMOTE
     python main.py graph        → graph + GPT (con fallback a naive)
+
+    GRAPH_BACKEND=embedded python main.py graph → graph sin servidor Neo4j
     """
     args = sys.argv[1:]
 
@@ -0,0 +1,239 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# Buckets de latencia (segundos): desde búsquedas en memoria hasta generaciones largas
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+# Muestra producida por un colector: (nombre, tipo, ayuda, labels, valor)
+Sample = Tuple[str, str, str, Dict[str, str], float]
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _key(labels: Dict[str, object]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(labels: Iterable[Tuple[str, str]]) -> str:
+    parts = []
+    for name, value in labels:
+        value = value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        parts.append(f'{name}="{value}"')
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, lock: threading.Lock):
+        self.name = name
+        self.help = help
+        self._lock = lock
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Contador monotónico (solicitudes, tokens, errores)."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, lock: threading.Lock):
+        super().__init__(name, help, lock)
+        self._values: Dict[LabelKey, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = _key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        return [f"{self.name}{_format_labels(k)} {_format_value(v)}" for k, v in self._values.items()]
+
+
+class Gauge(_Metric):
+    """Valor que sube y baja (solicitudes en curso, tamaño de cola)."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, lock: threading.Lock):
+        super().__init__(name, help, lock)
+        self._values: Dict[LabelKey, float] = {}
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[_key(labels)] = value
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = _key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def render(self) -> List[str]:
+        return [f"{self.name}{_format_labels(k)} {_format_value(v)}" for k, v in self._values.items()]
+
+
+class Histogram(_Metric):
+    """Histograma acumulado por buckets (latencias)."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, lock: threading.Lock, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, lock)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> (conteo por bucket, suma, total)
+        self._values: Dict[LabelKey, Tuple[List[int], float, int]] = {}
+
+    def observe(self, value: float, **labels):
+        key = _key(labels)
+        with self._lock:
+            counts, total, count = self._values.get(key) or ([0] * len(self.buckets), 0.0, 0)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value, count + 1)
+
+    @contextmanager
+    def time(self, **labels):
+        """Mide la duración del bloque `with` (también si lanza excepción)."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self) -> List[str]:
+        lines = []
+        for key, (counts, total, count) in self._values.items():
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append(f"{self.name}_bucket{_format_labels(key + (('le', _format_value(bound)),))} {bucket_count}")
+            lines.append(f"{self.name}_bucket{_format_labels(key + (('le', '+Inf'),))} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Registro de métricas del proceso en formato de texto Prometheus.
+
+    - Contadores, gauges e histogramas con labels
+    - Colectores: funciones que se evalúan al hacer scrape, para exponer
+      estadísticas que ya llevan otras clases (pools, cachés) sin duplicarlas
+    - Thread-safe: lo usan tanto el event loop del proxy como los hilos RAG
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], Iterable[Sample]]] = []
+
+    def counter(self, name: str, help: str) -> Counter:
+        return self._get_or_create(Counter, name, help)
+
+    def gauge(self, name: str, help: str) -> Gauge:
+        return self._get_or_create(Gauge, name, help)
+
+    def histogram(self, name: str, help: str, buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, help, buckets=buckets)
+
+    def register_collector(self, collector: Callable[[], Iterable[Sample]]):
+        with self._lock:
+            self._collectors.append(collector)
+
+    def _get_or_create(self, cls, name: str, help: str, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = cls(name, help, threading.Lock(), **kwargs)
+                self._metrics[name] = metric
+            elif not isinstance(metric, cls):
+                raise ValueError(f"La métrica {name} ya existe con otro tipo ({metric.kind}).")
+            return metric
+
+    def render(self) -> str:
+        """Texto de exposición Prometheus (text/plain; version=0.0.4)."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+
+        lines: List[str] = []
+        for metric in metrics:
+            with metric._lock:
+                samples = metric.render()
+            if samples:
+                lines.append(f"# HELP {metric.name} {metric.help}")
+                lines.append(f"# TYPE {metric.name} {metric.kind}")
+                lines.extend(samples)
+
+        # Muestras de colectores agrupadas por nombre de métrica
+        groups: Dict[str, Tuple[str, str, List[str]]] = {}
+        for collector in collectors:
+            for name, kind, help, labels, value in collector():
+                group = groups.setdefault(name, (kind, help, []))
+                group[2].append(f"{name}{_format_labels(_key(labels))} {_format_value(value)}")
+        for name, (kind, help, samples) in groups.items():
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(samples)
+
+        return "\n".join(lines) + "\n"
+
+
+# Registro compartido por todo el proceso (proxy, servicio RAG, CLI)
+REGISTRY = MetricsRegistry()
+
+
+def collect_stats(prefix: str, stats: Dict, counters: Iterable[str], gauges: Iterable[str],
+                  help: str, labels: Optional[Dict[str, str]] = None) -> List[Sample]:
+    """Convierte un dict de `stats()` en muestras (campos numéricos indicados)."""
+    labels = labels or {}
+    samples: List[Sample] = []
+    for field in counters:
+        if stats.get(field) is not None:
+            name = f"{prefix}_{field}" if field.endswith("_total") else f"{prefix}_{field}_total"
+            samples.append((name, "counter", f"{help}: {field}", labels, stats[field]))
+    for field in gauges:
+        if stats.get(field) is not None:
+            samples.append((f"{prefix}_{field}", "gauge", f"{help}: {field}", labels, stats[field]))
+    return samples
+
+
+def serve_metrics(port: int, registry: MetricsRegistry = REGISTRY) -> ThreadingHTTPServer:
+    """
+    Expone GET /metrics en un hilo aparte, para procesos sin servidor web
+    propio (p. ej. el CLI de main.py).
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("0.0.0.0", port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
@@ -0,0 +1,143 @@
+import time
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from src.metrics import REGISTRY, collect_stats
+from src.retrieval.embedding_cache import normalize_query
+
+# Versiones del corpus con entradas vivas por espacio de nombres: durante un
+# reemplazo en caliente del índice conviven la vigente y la anterior
+MAX_VERSIONS_PER_NAMESPACE = 2
+
+
+class SemanticAnswerCache:
+    """
+    Caché de respuestas por similitud semántica de la consulta.
+
+    - Una consulta nueva reutiliza la respuesta de otra reciente si la
+      similitud coseno de sus embeddings supera `threshold`
+      ("¿quién es el autor?" ≈ "¿quiénes escribieron el artículo?")
+    - Entradas separadas por (espacio de nombres, versión del corpus); se
+      conservan las `MAX_VERSIONS_PER_NAMESPACE` versiones usadas más
+      recientemente y las anteriores se descartan
+    - LRU acotada, TTL y thread-safe
+    """
+
+    _shared: Optional["SemanticAnswerCache"] = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, max_size: int = 256, threshold: float = 0.92, ttl: float = 3600.0):
+        self.max_size = max_size
+        self.threshold = threshold
+        self.ttl = ttl
+
+        # (namespace, versión del corpus) -> {consulta normalizada: entrada}, en orden de uso
+        self._scopes: "OrderedDict[Tuple[str, str], OrderedDict[str, Tuple[np.ndarray, str, float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @classmethod
+    def get_shared(cls, max_size: int = 256, threshold: float = 0.92, ttl: float = 3600.0) -> "SemanticAnswerCache":
+        """Caché compartida por todas las instancias RAG del proceso."""
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls(max_size, threshold, ttl)
+                shared = cls._shared
+                REGISTRY.register_collector(lambda: collect_stats(
+                    "rag_answer_cache", shared.stats(),
+                    counters=("hits", "misses", "invalidations"), gauges=("size", "max_size", "hit_rate"),
+                    help="Caché semántica de respuestas"
+                ))
+            return cls._shared
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    def lookup(self, namespace: str, version: str, vector: List[float]) -> Optional[Tuple[str, float]]:
+        """Devuelve (respuesta, similitud) de la consulta más parecida, o None."""
+        query = _unit(vector)
+        with self._lock:
+            entries = self._entries(namespace, version, create=False)
+            if entries is not None:
+                self._expire(entries)
+            if not entries:
+                self.misses += 1
+                return None
+
+            keys = list(entries.keys())
+            matrix = np.stack([entries[k][0] for k in keys])
+            scores = matrix @ query
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                self.misses += 1
+                return None
+
+            entries.move_to_end(keys[best])
+            self.hits += 1
+            return entries[keys[best]][1], float(scores[best])
+
+    def put(self, namespace: str, version: str, query: str, vector: List[float], answer: str):
+        if not self.enabled:
+            return
+        with self._lock:
+            entries = self._entries(namespace, version)
+            key = normalize_query(query)
+            entries[key] = (_unit(vector), answer, time.monotonic())
+            entries.move_to_end(key)
+            while len(entries) > self.max_size:
+                entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._scopes.clear()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": sum(len(entries) for entries in self._scopes.values()),
+                "max_size": self.max_size,
+                "threshold": self.threshold,
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+    def _entries(self, namespace: str, version: str,
+                 create: bool = True) -> Optional["OrderedDict[str, Tuple[np.ndarray, str, float]]"]:
+        # Llamar con el lock tomado. Alternar entre dos versiones vivas no descarta nada;
+        # una versión más allá del tope invalida la usada hace más tiempo. Solo `put`
+        # crea versiones: una consulta fallida no desplaza a las que tienen entradas.
+        key = (namespace, version)
+        entries = self._scopes.get(key)
+        if entries is None:
+            if not create:
+                return None
+            entries = OrderedDict()
+            self._scopes[key] = entries
+            same_namespace = [k for k in self._scopes if k[0] == namespace]
+            for old in same_namespace[:-MAX_VERSIONS_PER_NAMESPACE]:
+                self.invalidations += len(self._scopes.pop(old))
+        self._scopes.move_to_end(key)
+        return entries
+
+    def _expire(self, entries: "OrderedDict[str, Tuple[np.ndarray, str, float]]"):
+        if self.ttl <= 0:
+            return
+        now = time.monotonic()
+        for key in [k for k, (_, _, stored_at) in entries.items() if now - stored_at > self.ttl]:
+            del entries[key]
+
+
+def _unit(vector: List[float]) -> np.ndarray:
+    array = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(array)
+    return array / norm if norm else array
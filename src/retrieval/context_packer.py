@@ -0,0 +1,247 @@
+import math
+import re
+from typing import Dict, List, Optional, Set, Tuple
+
+from langchain_core.documents import Document
+
+from src.metrics import REGISTRY
+
+CONTEXT_TOKENS = REGISTRY.histogram(
+    "rag_context_tokens",
+    "Tokens estimados del contexto que se envía al LLM",
+    buckets=(128, 256, 512, 1024, 2048, 4096, 8192)
+)
+CONTEXT_CHUNKS = REGISTRY.counter(
+    "rag_context_chunks_total",
+    "Chunks recuperados según su destino en el empaquetado del contexto"
+)
+
+# Aproximación sin tokenizer: ~4 caracteres por token (español / inglés)
+CHARS_PER_TOKEN = 4.0
+# Traslape mínimo (caracteres) para unir dos chunks sin start_index
+MIN_TEXT_OVERLAP = 16
+# Fragmento mínimo (tokens) que vale la pena agregar recortado si el tramo no cabe entero
+MIN_FRAGMENT_TOKENS = 32
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def estimate_tokens(text: str) -> int:
+    """Tokens estimados de un texto (sin depender del tokenizer de cada backend)."""
+    return math.ceil(len(text) / CHARS_PER_TOKEN) if text else 0
+
+
+def relevance_score(doc: Document) -> float:
+    """Puntaje del retriever: fusion_score (híbrido), similarity_score (FAISS) o rerank_score (grafo)."""
+    metadata = doc.metadata
+    score = metadata.get("fusion_score", metadata.get("similarity_score", metadata.get("rerank_score")))
+    return float(score) if score is not None else 0.0
+
+
+class _Span:
+    """Tramo contiguo de una página: uno o varios chunks unidos."""
+
+    __slots__ = ("text", "start", "score", "metadata", "chunks", "best_offset")
+
+    def __init__(self, doc: Document):
+        self.text = doc.page_content
+        self.start = doc.metadata.get("start_index")
+        self.score = relevance_score(doc)
+        self.metadata = doc.metadata
+        self.chunks = 1
+        # Dónde empieza, dentro de `text`, el chunk más relevante del tramo
+        self.best_offset = 0
+
+    @property
+    def end(self) -> Optional[int]:
+        return None if self.start is None else self.start + len(self.text)
+
+    def absorb(self, other: "_Span", text: str, offset: int):
+        """Une `other` (que empieza en `offset` dentro del nuevo `text`)."""
+        self.text = text
+        self.chunks += other.chunks
+        if other.score > self.score:
+            self.score = other.score
+            self.metadata = other.metadata
+            self.best_offset = max(offset, 0) + other.best_offset
+
+
+class ContextPacker:
+    """
+    Arma el contexto del prompt a partir de los chunks recuperados:
+
+    1. Une chunks adyacentes o traslapados de la misma página (el splitter
+       repite `chunk_overlap` caracteres entre vecinos)
+    2. Descarta casi-duplicados (contención de trigramas de palabras)
+    3. Llena el presupuesto de tokens en orden de relevancia
+
+    Con `token_budget <= 0` no hay tope (solo se une y deduplica).
+    """
+
+    def __init__(self, token_budget: int = 1024, dedup_threshold: float = 0.8,
+                 max_overlap: int = 100):
+        self.token_budget = token_budget
+        self.dedup_threshold = dedup_threshold
+        self.max_overlap = max_overlap
+
+    @classmethod
+    def from_config(cls, config) -> "ContextPacker":
+        return cls(
+            token_budget=config.context_token_budget,
+            dedup_threshold=config.context_dedup_threshold,
+            max_overlap=config.chunk_overlap * 2
+        )
+
+    def pack(self, docs: List[Document]) -> List[Document]:
+        """Chunks recuperados -> tramos que caben en el presupuesto, del más relevante al menos."""
+        spans = self._merge(docs)
+        merged = len(docs) - len(spans)
+
+        spans.sort(key=lambda s: s.score, reverse=True)
+        unique = self._dedupe(spans)
+        duplicates = len(spans) - len(unique)
+
+        packed, used, truncated = [], 0, 0
+        for span in unique:
+            cost = estimate_tokens(span.text)
+            if self.token_budget > 0 and used + cost > self.token_budget:
+                remaining = self.token_budget - used
+                # El tramo más relevante siempre entra; los demás solo si queda un fragmento útil
+                if packed and remaining < MIN_FRAGMENT_TOKENS:
+                    continue
+                self._truncate(span, remaining)
+                truncated += 1
+                cost = estimate_tokens(span.text)
+            packed.append(span)
+            used += cost
+
+        CONTEXT_TOKENS.observe(used)
+        CONTEXT_CHUNKS.inc(sum(s.chunks for s in packed), outcome="packed")
+        CONTEXT_CHUNKS.inc(merged, outcome="merged")
+        CONTEXT_CHUNKS.inc(duplicates, outcome="duplicate")
+        CONTEXT_CHUNKS.inc(len(unique) - len(packed), outcome="over_budget")
+        CONTEXT_CHUNKS.inc(truncated, outcome="truncated")
+
+        return [self._to_document(span) for span in packed]
+
+    # ------------------------------------------------------------------
+    # Unión por página
+    # ------------------------------------------------------------------
+    def _merge(self, docs: List[Document]) -> List["_Span"]:
+        pages: Dict[Tuple, List[_Span]] = {}
+        for doc in docs:
+            key = (doc.metadata.get("doc_id"), doc.metadata.get("page_number"))
+            pages.setdefault(key, []).append(_Span(doc))
+
+        spans: List[_Span] = []
+        for page_spans in pages.values():
+            if all(s.start is not None for s in page_spans):
+                spans.extend(self._merge_by_position(page_spans))
+            else:
+                # Chunks indexados sin start_index: unir por texto traslapado
+                spans.extend(self._merge_by_text(page_spans))
+        return spans
+
+    @staticmethod
+    def _merge_by_position(spans: List["_Span"]) -> List["_Span"]:
+        spans = sorted(spans, key=lambda s: s.start)
+        merged = [spans[0]]
+        for span in spans[1:]:
+            current = merged[-1]
+            offset = span.start - current.start
+            if span.end <= current.end:
+                # Contenido por completo en el tramo actual
+                current.absorb(span, current.text, offset)
+            elif span.start <= current.end + 1:
+                # Traslapado (o contiguo, separado solo por el espacio que quitó el splitter)
+                overlap = current.end - span.start
+                text = current.text + span.text[overlap:] if overlap >= 0 else current.text + " " + span.text
+                current.absorb(span, text, offset if overlap >= 0 else len(current.text) + 1)
+            else:
+                merged.append(span)
+        return merged
+
+    def _merge_by_text(self, spans: List["_Span"]) -> List["_Span"]:
+        spans = list(spans)
+        changed = True
+        while changed:
+            changed = False
+            for i, a in enumerate(spans):
+                for j, b in enumerate(spans):
+                    if i == j:
+                        continue
+                    if b.text in a.text:
+                        a.absorb(b, a.text, a.text.find(b.text))
+                    else:
+                        overlap = self._text_overlap(a.text, b.text)
+                        if not overlap:
+                            continue
+                        a.absorb(b, a.text + b.text[overlap:], len(a.text) - overlap)
+                    del spans[j]
+                    changed = True
+                    break
+                if changed:
+                    break
+        return spans
+
+    def _text_overlap(self, left: str, right: str) -> int:
+        """Largo del sufijo de `left` que es prefijo de `right` (0 si no hay)."""
+        for size in range(min(len(left), len(right), self.max_overlap), MIN_TEXT_OVERLAP - 1, -1):
+            if left.endswith(right[:size]):
+                return size
+        return 0
+
+    @staticmethod
+    def _truncate(span: "_Span", max_tokens: int):
+        """Recorta el tramo a `max_tokens`, empezando por su chunk más relevante."""
+        max_chars = int(max(max_tokens, 1) * CHARS_PER_TOKEN)
+        text = span.text
+        if len(text) <= max_chars:
+            return
+        start = max(min(span.best_offset, len(text) - max_chars), 0)
+        end = start + max_chars
+        fragment = text[start:end]
+
+        # Sin palabras cortadas en los bordes (si queda algo)
+        if start > 0 and " " in fragment:
+            fragment = fragment[fragment.index(" ") + 1:]
+        if end < len(text) and " " in fragment:
+            fragment = fragment[:fragment.rindex(" ")]
+
+        span.text = fragment.strip()
+        span.best_offset = 0
+        span.metadata = {**span.metadata, "truncated": True}
+
+    # ------------------------------------------------------------------
+    # Casi-duplicados
+    # ------------------------------------------------------------------
+    def _dedupe(self, spans: List["_Span"]) -> List["_Span"]:
+        """Conserva el más relevante de cada grupo de tramos casi iguales (ya ordenados)."""
+        kept: List[Tuple[_Span, Set[Tuple[str, ...]]]] = []
+        for span in spans:
+            shingles = self._shingles(span.text)
+            if any(self._containment(shingles, other) >= self.dedup_threshold for _, other in kept):
+                continue
+            kept.append((span, shingles))
+        return [span for span, _ in kept]
+
+    @staticmethod
+    def _shingles(text: str) -> Set[Tuple[str, ...]]:
+        words = _WORD_RE.findall(text.lower())
+        if len(words) < 3:
+            return {tuple(words)} if words else set()
+        return {tuple(words[i:i + 3]) for i in range(len(words) - 2)}
+
+    @staticmethod
+    def _containment(a: Set, b: Set) -> float:
+        # Fracción del tramo más corto que aparece en el otro
+        if not a or not b:
+            return 0.0
+        return len(a & b) / min(len(a), len(b))
+
+    @staticmethod
+    def _to_document(span: "_Span") -> Document:
+        metadata = dict(span.metadata)
+        metadata["relevance_score"] = span.score
+        metadata["merged_chunks"] = span.chunks
+        return Document(page_content=span.text, metadata=metadata)
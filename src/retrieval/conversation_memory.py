@@ -0,0 +1,171 @@
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from src.metrics import REGISTRY
+from src.retrieval.context_packer import CHARS_PER_TOKEN, estimate_tokens
+
+MEMORY_SUMMARIES = REGISTRY.counter("rag_memory_summaries_total", "Resúmenes de turnos antiguos por resultado")
+MEMORY_SUMMARY_SECONDS = REGISTRY.histogram("rag_memory_summary_seconds", "Duración de cada resumen de historial")
+HISTORY_TOKENS = REGISTRY.histogram(
+    "rag_history_tokens",
+    "Tokens estimados del historial que se antepone al prompt",
+    buckets=(0, 64, 128, 256, 512, 1024, 2048, 4096)
+)
+
+# (resumen previo, turnos a incorporar) -> resumen nuevo
+Summarizer = Callable[[str, List[Dict]], str]
+
+# Pool compartido para resumir fuera del camino de la respuesta
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _summary_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="memory-summary")
+        return _executor
+
+
+def _after_fork():
+    # Los hilos del pool no sobreviven al fork: el hijo crea el suyo al primer uso
+    global _executor, _executor_lock
+    _executor, _executor_lock = None, threading.Lock()
+
+
+class ConversationMemory:
+    """
+    Historial acotado de una conversación.
+
+    - Ventana deslizante: a lo más `window_turns` turnos (pregunta + respuesta) literales
+    - Presupuesto de tokens para ventana + resumen (`token_budget`, 0 = sin tope)
+    - Los turnos que salen de la ventana se resumen en segundo plano con
+      `summarizer`; la respuesta en curso no espera al resumen
+    - Sin summarizer, los turnos antiguos simplemente se descartan
+
+    Es thread-safe: la usan el event loop / hilo de la consulta y el pool de resúmenes.
+    """
+
+    def __init__(self, token_budget: int = 1024, window_turns: int = 6,
+                 summarizer: Optional[Summarizer] = None):
+        self.token_budget = token_budget
+        self.window_turns = max(window_turns, 1)
+        self.summarizer = summarizer
+
+        self.summary = ""
+        self._turns: List[List[Dict]] = []
+        self._evicted: List[Dict] = []
+        self._summarizing = False
+        self._lock = threading.Lock()
+
+    # ------------------------------------------------------------------
+    # Interfaz usada por RAGModel
+    # ------------------------------------------------------------------
+    def messages(self) -> List[Dict]:
+        """Historial a anteponer al prompt: resumen (si hay) + turnos recientes."""
+        with self._lock:
+            history = []
+            if self.summary:
+                history.append({
+                    "role": "system",
+                    "content": f"Resumen de la conversación previa:\n{self.summary}"
+                })
+            for turn in self._turns:
+                history.extend(turn)
+        HISTORY_TOKENS.observe(sum(estimate_tokens(m["content"]) for m in history))
+        return history
+
+    def add_turn(self, query: str, response: str):
+        """Agrega un turno y desplaza los antiguos fuera de la ventana."""
+        with self._lock:
+            self._turns.append([
+                {"role": "user", "content": query},
+                {"role": "assistant", "content": response},
+            ])
+            self._evict()
+            if not self._evicted:
+                return
+            if self.summarizer is None:
+                self._evicted = []
+                return
+            start = not self._summarizing
+            self._summarizing = True
+
+        if start:
+            _summary_executor().submit(self._summarize_pending)
+
+    def clear(self):
+        with self._lock:
+            self.summary = ""
+            self._turns = []
+            self._evicted = []
+
+    def __len__(self) -> int:
+        with self._lock:
+            return sum(len(turn) for turn in self._turns)
+
+    # ------------------------------------------------------------------
+    # Resumen en segundo plano
+    # ------------------------------------------------------------------
+    def _summarize_pending(self):
+        """Incorpora al resumen los turnos desplazados; uno a la vez por conversación."""
+        while True:
+            with self._lock:
+                turns, self._evicted = self._evicted, []
+                summary = self.summary
+                if not turns:
+                    self._summarizing = False
+                    return
+
+            start = time.perf_counter()
+            try:
+                new_summary = self.summarizer(summary, turns).strip()
+            except Exception:
+                # Sin resumen nuevo: esos turnos se pierden, la conversación sigue
+                MEMORY_SUMMARIES.inc(outcome="error")
+                continue
+            finally:
+                MEMORY_SUMMARY_SECONDS.observe(time.perf_counter() - start)
+
+            MEMORY_SUMMARIES.inc(outcome="ok")
+            with self._lock:
+                self.summary = self._fit_summary(new_summary)
+                # El resumen creció: puede desplazar más turnos (se resumen en la siguiente vuelta)
+                self._evict()
+
+    def _evict(self):
+        # Siempre se conserva al menos el último turno
+        while len(self._turns) > 1 and (
+            len(self._turns) > self.window_turns
+            or (self.token_budget > 0 and self._tokens() > self.token_budget)
+        ):
+            self._evicted.extend(self._turns.pop(0))
+
+    def _fit_summary(self, summary: str) -> str:
+        # El resumen no puede ocupar más de la mitad del presupuesto
+        max_chars = int(self.token_budget / 2 * CHARS_PER_TOKEN) if self.token_budget > 0 else 0
+        return summary[-max_chars:] if max_chars and len(summary) > max_chars else summary
+
+    def _tokens(self) -> int:
+        total = estimate_tokens(self.summary)
+        for turn in self._turns:
+            total += sum(estimate_tokens(m["content"]) for m in turn)
+        return total
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "turns": len(self._turns),
+                "tokens": self._tokens(),
+                "token_budget": self.token_budget,
+                "summary_tokens": estimate_tokens(self.summary),
+                "pending_messages": len(self._evicted),
+            }
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork)
@@ -0,0 +1,91 @@
+import asyncio
+import numpy as np
+from typing import List, Optional
+from langchain_core.documents import Document
+
+from src.config import RAGConfig
+from src.deadline import Deadline
+from src.metrics import REGISTRY
+from src.indexing.embedded_graph_store import EmbeddedGraphStore
+
+
+RETRIEVAL_SECONDS = REGISTRY.histogram("rag_retrieval_seconds", "Latencia de recuperación de contexto")
+
+
+class EmbeddedGraphRetriever:
+    """
+    Retriever con la misma interfaz que Neo4jGraphRetriever sobre el grafo
+    embebido: búsqueda vectorial + expansión por grafo (k-hop) a través de
+    la adyacencia CSR de :SIMILAR_TO, todo dentro del proceso.
+    """
+
+    def __init__(self, config: RAGConfig, embedder, store: Optional[EmbeddedGraphStore] = None):
+        self.config = config
+        self.embedder = embedder
+        self.store = store if store is not None else EmbeddedGraphStore.get_instance()
+
+    def retrieve(self, query: str, k: int = None, hops: int = 1, deadline: Deadline = None) -> List[Document]:
+        with RETRIEVAL_SECONDS.time(retriever="embedded"):
+            return self._retrieve(query, k, hops, deadline)
+
+    async def aretrieve(self, query: str, k: int = None, hops: int = 1, deadline: Deadline = None) -> List[Document]:
+        """Versión async: solo el embedding de la consulta se espera; la búsqueda es en memoria."""
+        with RETRIEVAL_SECONDS.time(retriever="embedded"):
+            if deadline is not None:
+                deadline.check("recuperación por grafo")
+            qvec = await self.embedder.aembed_query(query)
+            # Búsqueda vectorial + expansión (CPU) en el executor, fuera del event loop
+            return await asyncio.to_thread(self._search, qvec, k or self.config.num_retrieved_docs, hops)
+
+    def _retrieve(self, query: str, k: int, hops: int, deadline: Deadline) -> List[Document]:
+        if deadline is not None:
+            deadline.check("recuperación por grafo")
+        qvec = self.embedder.embed_query(query)
+        return self._search(qvec, k or self.config.num_retrieved_docs, hops)
+
+    def _search(self, qvec, k: int, hops: int) -> List[Document]:
+        graph = self.store.snapshot()
+        qvec = np.array(qvec, dtype="float32")
+
+        # Buscar muchos nodos en el grafo (Top-20 inicial)
+        initial_k = max(k * 5, 20)
+        seeds, _ = graph.vector_search(qvec, initial_k)
+
+        # Expansión k-hop por las aristas :SIMILAR_TO
+        candidates = set(int(p) for p in seeds)
+        frontier = candidates
+        for _ in range(hops):
+            reached = set()
+            for pos in frontier:
+                neighbors, _ = graph.neighbors(pos)
+                reached.update(int(n) for n in neighbors)
+            frontier = reached - candidates
+            candidates |= frontier
+
+        if not candidates:
+            return []
+
+        # Reranking semántico local (cosine similarity)
+        positions = np.fromiter(candidates, dtype=np.int64)
+        qnorm = np.linalg.norm(qvec) or 1.0
+        scores = graph.embeddings[positions] @ (qvec / qnorm)
+
+        order = np.argsort(-scores)[:k]
+
+        # Convertir a documentos LangChain
+        results = []
+        for idx in order:
+            pos = positions[idx]
+            metadata = dict(graph.metadata[pos])
+            metadata["chunk_id"] = graph.chunk_ids[pos]
+            metadata["rerank_score"] = float(scores[idx])
+            results.append(Document(page_content=graph.texts[pos], metadata=metadata))
+
+        return results
+
+    def retrieve_metadata(self, field: str):
+        """Valores distintos de un campo de metadata en todos los documentos."""
+        return self.store.metadata_values(field)
+
+    def close(self):
+        pass
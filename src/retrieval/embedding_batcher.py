@@ -0,0 +1,146 @@
+import os
+import time
+import queue
+import asyncio
+import weakref
+import threading
+from concurrent.futures import Future
+from typing import List, Optional, Tuple
+
+from src.metrics import REGISTRY
+
+BATCH_SIZE = REGISTRY.histogram(
+    "rag_embedding_batch_size",
+    "Consultas por forward pass del modelo de embeddings",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128)
+)
+BATCH_WAIT_SECONDS = REGISTRY.histogram(
+    "rag_embedding_batch_wait_seconds",
+    "Espera de una consulta hasta entrar en un batch",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1)
+)
+
+# Instancias vivas del proceso (para reiniciar su hilo tras un fork)
+_batchers: "weakref.WeakSet[MicroBatchingEmbedder]" = weakref.WeakSet()
+
+
+class MicroBatchingEmbedder:
+    """
+    Agrupa en un solo forward pass los embed_query que llegan casi a la vez.
+
+    - Un hilo de fondo toma la primera consulta en espera y junta las que
+      lleguen en los siguientes `max_wait_ms` (o hasta `max_batch_size`)
+    - El batch se calcula con embed_documents (el modelo configurado es
+      simétrico: consulta y documento se codifican igual)
+    - Cada solicitud recibe su vector en su propio Future; textos repetidos
+      dentro del batch se calculan una vez
+
+    Con un solo usuario el costo es como máximo `max_wait_ms` extra; con
+    muchos, el modelo procesa matrices en lugar de vectores sueltos.
+    """
+
+    def __init__(self, embedder, max_batch_size: int = 32, max_wait_ms: float = 5.0):
+        self.embedder = embedder
+        self.max_batch_size = max(max_batch_size, 1)
+        self.max_wait = max(max_wait_ms, 0.0) / 1000.0
+
+        self._queue: "queue.Queue[Tuple[str, Future, float]]" = queue.Queue()
+        self._worker: Optional[threading.Thread] = None
+        self._worker_lock = threading.Lock()
+
+        self.batches_total = 0
+        self.queries_total = 0
+        _batchers.add(self)
+
+    # ------------------------------------------------------------------
+    # Interfaz LangChain
+    # ------------------------------------------------------------------
+    def embed_query(self, text: str) -> List[float]:
+        return self.submit(text).result()
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await asyncio.wrap_future(self.submit(text))
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        # La indexación ya llega en lotes grandes: directo al modelo
+        return self.embedder.embed_documents(texts)
+
+    def __getattr__(self, name):
+        return getattr(self.embedder, name)
+
+    # ------------------------------------------------------------------
+    # Planificador
+    # ------------------------------------------------------------------
+    def submit(self, text: str) -> Future:
+        """Encola una consulta; el Future se resuelve con su vector."""
+        future: Future = Future()
+        self._ensure_worker()
+        self._queue.put((text, future, time.perf_counter()))
+        return future
+
+    def _ensure_worker(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._worker_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            closes_at = time.perf_counter() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = closes_at - time.perf_counter()
+                try:
+                    if remaining > 0:
+                        batch.append(self._queue.get(timeout=remaining))
+                    else:
+                        # Ventana cerrada: solo lo que ya está en cola
+                        batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._execute(batch)
+
+    def _execute(self, batch: List[Tuple[str, Future, float]]):
+        started = time.perf_counter()
+        texts = list(dict.fromkeys(text for text, _, _ in batch))
+        try:
+            vectors = self.embedder.embed_documents(texts)
+        except Exception as e:
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+
+        self.batches_total += 1
+        self.queries_total += len(batch)
+        BATCH_SIZE.observe(len(texts))
+
+        by_text = dict(zip(texts, vectors))
+        for text, future, queued_at in batch:
+            BATCH_WAIT_SECONDS.observe(started - queued_at)
+            future.set_result(list(by_text[text]))
+
+    def stats(self):
+        return {
+            "batches_total": self.batches_total,
+            "queries_total": self.queries_total,
+            "avg_batch_size": self.queries_total / self.batches_total if self.batches_total else 0.0,
+            "queued": self._queue.qsize(),
+        }
+
+    def _after_fork(self):
+        # El hilo del padre no existe en el hijo; la cola y el lock pueden
+        # haber quedado a medio usar: todo se recrea al primer embed_query
+        self._queue = queue.Queue()
+        self._worker = None
+        self._worker_lock = threading.Lock()
+
+
+def _after_fork():
+    for batcher in list(_batchers):
+        batcher._after_fork()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork)
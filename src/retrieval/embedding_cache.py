@@ -0,0 +1,123 @@
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from src.metrics import REGISTRY, collect_stats
+
+EMBEDDING_SECONDS = REGISTRY.histogram("rag_embedding_seconds", "Tiempo de cálculo de embeddings (sin caché)")
+
+
+def normalize_query(text: str) -> str:
+    """Clave normalizada: Unicode NFKC, minúsculas y espacios colapsados."""
+    text = unicodedata.normalize("NFKC", text)
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+class QueryEmbeddingCache:
+    """
+    Caché LRU acotada y thread-safe de embeddings de consultas.
+
+    - Claves: (modelo, texto normalizado)
+    - Desalojo LRU al superar max_size
+    - Contadores de aciertos y fallos
+    """
+
+    _shared: Optional["QueryEmbeddingCache"] = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, max_size: int = 1024):
+        self.max_size = max_size
+        self._entries: "OrderedDict[Tuple[str, str], List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def get_shared(cls, max_size: int = 1024) -> "QueryEmbeddingCache":
+        """Caché compartida por todos los retrievers del proceso."""
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls(max_size)
+                shared = cls._shared
+                REGISTRY.register_collector(lambda: collect_stats(
+                    "rag_embedding_cache", shared.stats(),
+                    counters=("hits", "misses"), gauges=("size", "max_size", "hit_rate"),
+                    help="Caché de embeddings de consultas"
+                ))
+            return cls._shared
+
+    def get(self, key: Tuple[str, str]) -> Optional[List[float]]:
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return vector
+
+    def put(self, key: Tuple[str, str], vector: List[float]):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = vector
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+
+class CachedEmbeddings:
+    """
+    Envoltorio de un modelo de embeddings (interfaz LangChain) que consulta
+    QueryEmbeddingCache antes de ejecutar el modelo en embed_query /
+    aembed_query. embed_documents pasa directo al modelo.
+    """
+
+    def __init__(self, embedder, cache: QueryEmbeddingCache, namespace: str):
+        self.embedder = embedder
+        self.cache = cache
+        self.namespace = namespace
+
+    def embed_query(self, text: str) -> List[float]:
+        key = (self.namespace, normalize_query(text))
+        vector = self.cache.get(key)
+        if vector is None:
+            with EMBEDDING_SECONDS.time(kind="query"):
+                vector = self.embedder.embed_query(text)
+            self.cache.put(key, vector)
+        # Copia: quien llama puede modificar el vector sin tocar la caché
+        return list(vector)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        """Versión async: en un fallo de caché espera al modelo sin bloquear el event loop."""
+        key = (self.namespace, normalize_query(text))
+        vector = self.cache.get(key)
+        if vector is None:
+            with EMBEDDING_SECONDS.time(kind="query"):
+                vector = await self.embedder.aembed_query(text)
+            self.cache.put(key, vector)
+        return list(vector)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        with EMBEDDING_SECONDS.time(kind="documents"):
+            return self.embedder.embed_documents(texts)
+
+    def __getattr__(self, name):
+        return getattr(self.embedder, name)
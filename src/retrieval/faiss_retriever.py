@@ -1,8 +1,13 @@
+import asyncio
 import numpy as np
-from typing import List
+from typing import List, Optional
 from langchain_core.documents import Document
 from sklearn.metrics.pairwise import cosine_similarity
 
+from src.metrics import REGISTRY
+
+RETRIEVAL_SECONDS = REGISTRY.histogram("rag_retrieval_seconds", "Latencia de recuperación de contexto")
+
 
 class LocalFAISSRetriever:
     """
@@ -10,28 +15,48 @@ class LocalFAISSRetriever:
     Designed for Naive RAG without using Neo4j.
     """
 
-    def __init__(self, embedder, documents: List[Document], top_k: int = 12):
+    def __init__(self, embedder, documents: List[Document], top_k: int = 12,
+                 embeddings: Optional[np.ndarray] = None):
         self.embedder = embedder
         self.documents = documents
         self.top_k = top_k
 
-        # Pre-calculate embeddings for faster retrieval
-        texts = [d.page_content for d in documents]
-        self.embeddings = embedder.embed_documents(texts)
-        self.embeddings = np.array(self.embeddings, dtype=np.float32)
+        # Embeddings de la ingesta (ChunkEmbeddings) o, si no vienen, se calculan aquí
+        if embeddings is None:
+            texts = [d.page_content for d in documents]
+            embeddings = embedder.embed_documents(texts)
+        # asarray: sin copia si ya es float32 (la matriz del artefacto se comparte)
+        self.embeddings = np.asarray(embeddings, dtype=np.float32)
 
     def retrieve(self, query: str) -> List[Document]:
         """Return top-k most similar chunks."""
-        qvec = self.embedder.embed_query(query)
+        with RETRIEVAL_SECONDS.time(retriever="faiss"):
+            return self._retrieve(query)
+
+    async def aretrieve(self, query: str) -> List[Document]:
+        """
+        Versión async: el embedding de la consulta se espera sin bloquear el
+        event loop y el ranking (CPU) corre en el executor del servicio.
+        """
+        with RETRIEVAL_SECONDS.time(retriever="faiss"):
+            qvec = await self.embedder.aembed_query(query)
+            return await asyncio.to_thread(self._rank, qvec)
+
+    def _retrieve(self, query: str) -> List[Document]:
+        return self._rank(self.embedder.embed_query(query))
+
+    def _rank(self, qvec) -> List[Document]:
         qvec = np.array(qvec, dtype=np.float32).reshape(1, -1)
 
         sims = cosine_similarity(qvec, self.embeddings).flatten()
         top_indices = sims.argsort()[::-1][:self.top_k]
 
+        # Copias: los Document originales se comparten entre solicitudes concurrentes
         results = []
         for idx in top_indices:
             doc = self.documents[idx]
-            doc.metadata["similarity_score"] = float(sims[idx])
-            results.append(doc)
+            metadata = dict(doc.metadata)
+            metadata["similarity_score"] = float(sims[idx])
+            results.append(Document(page_content=doc.page_content, metadata=metadata))
 
         return results
@@ -0,0 +1,248 @@
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Optional, Tuple
+
+from src.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+INDEX_SWAPS = REGISTRY.counter("rag_index_swaps_total", "Reconstrucciones del índice por resultado")
+INDEX_BUILD_SECONDS = REGISTRY.histogram(
+    "rag_index_build_seconds",
+    "Duración de la construcción de una versión del índice",
+    buckets=(1, 5, 15, 30, 60, 120, 300, 600)
+)
+
+# (número de versión, versión vigente o None) -> (rag, indexer, arquitectura, modelo)
+Builder = Callable[[int, Optional["IndexVersion"]], Tuple]
+
+
+class IndexVersion:
+    """Una versión inmutable del pipeline (RAG + indexador) y sus lectores activos."""
+
+    def __init__(self, number: int, rag, indexer, architecture: str, model: str):
+        self.number = number
+        self.rag = rag
+        self.indexer = indexer
+        self.architecture = architecture
+        self.model = model
+        self.loaded_at = time.time()
+        self.readers = 0
+        self.retired = False
+        self.released = False
+
+    @property
+    def corpus_version(self) -> Optional[str]:
+        return getattr(self.rag, "corpus_version", None)
+
+    def release(self):
+        """Libera el índice de la versión (solo cuando ya no tiene lectores)."""
+        self.released = True
+        try:
+            self.rag.release()
+            if self.indexer is not None:
+                self.indexer.release()
+        except Exception as e:
+            logger.warning(f"Error al liberar la versión {self.number} del índice: {e}")
+        logger.info(f"Versión {self.number} del índice liberada")
+
+
+class IndexVersions:
+    """
+    Versiones del índice con reemplazo en caliente.
+
+    - `acquire()` entrega la versión vigente y la marca en uso; una consulta
+      trabaja de principio a fin sobre la misma versión
+    - `reload()` construye una versión nueva en un hilo en segundo plano
+      (el corpus se vuelve a leer; solo se embeben los chunks nuevos) y la
+      publica con un cambio de referencia: las consultas nuevas ya la usan
+    - La versión reemplazada se libera cuando termina su último lector
+    - Si la construcción falla, la versión vigente sigue atendiendo
+    - `watch()` recarga cuando cambia el archivo del corpus
+
+    Solo se recarga si el indexador de la versión vigente guarda cada versión
+    por separado (`supports_hot_swap`): FAISS y el grafo embebido sí; Neo4j
+    no, porque re-indexar borra y reescribe los documentos en la misma base
+    mientras la versión vigente la sigue consultando. Con Graph-RAG sobre
+    Neo4j la recarga se rechaza con un aviso y hay que reiniciar.
+    """
+
+    def __init__(self, builder: Builder):
+        self.builder = builder
+        self._current: Optional[IndexVersion] = None
+        self._retired: Dict[int, IndexVersion] = {}
+        self._lock = threading.Lock()
+        self._building = False
+        self._next_number = 1
+        self.swaps_total = 0
+        self.failures_total = 0
+        self.last_error: Optional[str] = None
+
+    @property
+    def current(self) -> Optional[IndexVersion]:
+        return self._current
+
+    # ------------------------------------------------------------------
+    # Lectores
+    # ------------------------------------------------------------------
+    @contextmanager
+    def acquire(self) -> Iterator[IndexVersion]:
+        with self._lock:
+            version = self._current
+            if version is None:
+                raise RuntimeError("Índice no cargado")
+            version.readers += 1
+        try:
+            yield version
+        finally:
+            with self._lock:
+                version.readers -= 1
+                free = version.retired and version.readers == 0 and not version.released
+                if free:
+                    self._retired.pop(version.number, None)
+            if free:
+                version.release()
+
+    # ------------------------------------------------------------------
+    # Construcción y reemplazo
+    # ------------------------------------------------------------------
+    def load(self) -> IndexVersion:
+        """Construye la versión inicial en el hilo actual (arranque)."""
+        with self._lock:
+            self._building = True
+        try:
+            return self._build()
+        finally:
+            with self._lock:
+                self._building = False
+
+    def reload_unsupported(self) -> Optional[str]:
+        """Motivo por el que la versión vigente no admite recarga en caliente (None si la admite)."""
+        current = self._current
+        if current is not None and current.indexer is not None \
+                and not getattr(current.indexer, "supports_hot_swap", False):
+            return (
+                f"La recarga en caliente no está disponible con {type(current.indexer).__name__}: "
+                "el índice es compartido y re-indexarlo cambiaría los datos de las consultas en curso. "
+                "Reinicia el proceso para cargar el corpus nuevo."
+            )
+        return None
+
+    def reload(self) -> bool:
+        """
+        Inicia la construcción de una versión nueva en segundo plano.
+        False si ya hay una en curso o si la versión vigente no la admite
+        (ver reload_unsupported).
+        """
+        reason = self.reload_unsupported()
+        if reason is not None:
+            logger.warning(reason)
+            return False
+        with self._lock:
+            if self._building:
+                return False
+            self._building = True
+        threading.Thread(target=self._build_in_background, name="index-build", daemon=True).start()
+        return True
+
+    def _build_in_background(self):
+        try:
+            self._build()
+        except Exception as e:
+            logger.error(f"No se pudo construir la nueva versión del índice: {e}")
+        finally:
+            with self._lock:
+                self._building = False
+
+    def _build(self) -> IndexVersion:
+        with self._lock:
+            number = self._next_number
+            self._next_number += 1
+            previous = self._current
+
+        start = time.perf_counter()
+        try:
+            rag, indexer, architecture, model = self.builder(number, previous)
+        except Exception as e:
+            INDEX_SWAPS.inc(outcome="error")
+            self.failures_total += 1
+            self.last_error = str(e)
+            raise
+        finally:
+            INDEX_BUILD_SECONDS.observe(time.perf_counter() - start)
+
+        version = IndexVersion(number, rag, indexer, architecture, model)
+        self._swap(version)
+        INDEX_SWAPS.inc(outcome="ok")
+        self.last_error = None
+        logger.info(f"Versión {number} del índice publicada ({architecture.upper()} + {model.upper()})")
+        return version
+
+    def _swap(self, version: IndexVersion):
+        with self._lock:
+            old, self._current = self._current, version
+            if old is None:
+                return
+            self.swaps_total += 1
+            old.retired = True
+            free = old.readers == 0
+            if not free:
+                self._retired[old.number] = old
+        if free:
+            old.release()
+
+    # ------------------------------------------------------------------
+    # Recarga automática
+    # ------------------------------------------------------------------
+    def watch(self, path: str, interval: float):
+        """Revisa `path` cada `interval` segundos y recarga si cambió (0 = desactivado)."""
+        if interval <= 0:
+            return
+        threading.Thread(
+            target=self._watch, args=(path, interval), name="index-watch", daemon=True
+        ).start()
+
+    def _watch(self, path: str, interval: float):
+        signature = _file_signature(path)
+        while True:
+            time.sleep(interval)
+            current = _file_signature(path)
+            if current is None or current == signature:
+                continue
+            if self.reload_unsupported() is not None:
+                # reload() avisa una vez por cambio del archivo
+                self.reload()
+                signature = current
+                continue
+            # Si ya hay una construcción en curso, se reintenta en la siguiente vuelta
+            if self.reload():
+                logger.info(f"Corpus modificado ({path}): construyendo nueva versión del índice")
+                signature = current
+
+    def stats(self) -> Dict:
+        with self._lock:
+            current = self._current
+            return {
+                "version": current.number if current else None,
+                "corpus_version": current.corpus_version if current else None,
+                "loaded_at": current.loaded_at if current else None,
+                "readers": current.readers if current else 0,
+                "building": int(self._building),
+                "hot_reload": int(self.reload_unsupported() is None),
+                "retired_pending": len(self._retired),
+                "retired_readers": sum(v.readers for v in self._retired.values()),
+                "swaps_total": self.swaps_total,
+                "failures_total": self.failures_total,
+                "last_error": self.last_error,
+            }
+
+
+def _file_signature(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
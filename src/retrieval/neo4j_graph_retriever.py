@@ -1,13 +1,21 @@
-import os
+import time
+import asyncio
 import numpy as np
-from neo4j import GraphDatabase, Driver
 from typing import List, Dict
 from langchain_core.documents import Document
 
 from src.config import RAGConfig
+from src.deadline import Deadline
+from src.metrics import REGISTRY
+from src.indexing.document_processor import combine_fingerprints
+from src.indexing.metadata_index import METADATA_FIELDS, DocumentMetadataIndex
+from src.indexing.neo4j_connection import Neo4jDriverManager
 
 # Nota: Neo4j Python Driver debe estar instalado (pip install neo4j)
 
+RETRIEVAL_SECONDS = REGISTRY.histogram("rag_retrieval_seconds", "Latencia de recuperación de contexto")
+
+
 class Neo4jGraphRetriever:
     """
     Retriever que usa el índice vectorial de Neo4j + expansión por grafo
@@ -18,22 +26,60 @@ class Neo4jGraphRetriever:
         self.config = config
         self.embedder = embedder
 
-        # Conexión a Neo4j (usa las variables de entorno)
-        uri = os.environ.get("NEO4J_URI", "bolt://localhost:7687")
-        user = os.environ.get("NEO4J_USER", "neo4j")
-        password = os.environ.get("NEO4J_PASSWORD", "neo4jpassword")
-        self.driver: Driver = GraphDatabase.driver(uri, auth=(user, password))
+        # Conexión a Neo4j mediante el pool compartido del proceso
+        self.neo4j = Neo4jDriverManager.get_instance(config)
+
+        # Tabla de metadata por documento (desde :Document) y con qué versión del corpus se cargó
+        self._metadata_index = None
+        self._metadata_version = None
+        self._metadata_generation = None
+        self._metadata_checked_at = 0.0
 
-    def retrieve(self, query: str, k: int = None, hops: int = 1) -> List[Document]:
+    def retrieve(self, query: str, k: int = None, hops: int = 1, deadline: Deadline = None) -> List[Document]:
+        with RETRIEVAL_SECONDS.time(retriever="neo4j"):
+            return self._retrieve(query, k, hops, deadline)
+
+    async def aretrieve(self, query: str, k: int = None, hops: int = 1, deadline: Deadline = None) -> List[Document]:
+        """
+        Versión async con el driver asíncrono de Neo4j: mientras el servidor
+        resuelve la búsqueda vectorial el event loop atiende otras consultas.
+        """
+        with RETRIEVAL_SECONDS.time(retriever="neo4j"):
+            k = k or self.config.num_retrieved_docs
+            if deadline is not None:
+                deadline.check("recuperación por grafo")
+
+            qvec = await self.embedder.aembed_query(query)
+            records = await self.neo4j.aexecute_read(
+                self._vector_query(k),
+                timeout=deadline.timeout() if deadline is not None else None,
+                embedding=qvec
+            )
+            # El re-ranking por coseno (CPU) corre en el executor, fuera del event loop
+            return await asyncio.to_thread(self._rerank, records, qvec, k)
+
+    def _retrieve(self, query: str, k: int, hops: int, deadline: Deadline) -> List[Document]:
         k = k or self.config.num_retrieved_docs
+        if deadline is not None:
+            deadline.check("recuperación por grafo")
 
         #Embedding de la query
         qvec = self.embedder.embed_query(query)
 
+        # El servidor cancela la transacción si excede el tiempo restante
+        records = self.neo4j.execute_read(
+            self._vector_query(k),
+            timeout=deadline.timeout() if deadline is not None else None,
+            embedding=qvec
+        )
+        return self._rerank(records, qvec, k)
+
+    @staticmethod
+    def _vector_query(k: int) -> str:
         # Buscar muchos nodos en el grafo (Top-20 inicial)
         initial_k = max(k * 5, 20)
 
-        cypher_query = f"""
+        return f"""
         CALL db.index.vector.queryNodes(
             'chunk_embeddings',
             {initial_k},
@@ -44,9 +90,8 @@ class Neo4jGraphRetriever:
         LIMIT {initial_k}
         """
 
-        with self.driver.session() as session:
-            records = session.run(cypher_query, embedding=qvec).data()
-
+    @staticmethod
+    def _rerank(records: List[Dict], qvec, k: int) -> List[Document]:
         # Reranking semántico local (cosine similarity)
         reranked = []
         for rec in records:
@@ -73,14 +118,58 @@ class Neo4jGraphRetriever:
         return results
 
     def retrieve_metadata(self, field: str):
-        query = f"""
-        MATCH (c:Chunk)
-        WHERE c.{field} IS NOT NULL
-        RETURN DISTINCT c.{field} AS value
-        LIMIT 5
+        """Valores distintos de un campo de metadata en todos los documentos."""
+        if field not in METADATA_FIELDS:
+            return []
+        return self.metadata_index().values(field)
+
+    def metadata_index(self) -> DocumentMetadataIndex:
+        """
+        Tabla de metadata vigente, en memoria. Se recarga:
+        - si este proceso indexó o borró documentos (contador del pool
+          compartido, sin ir al servidor)
+        - si otro proceso cambió el grafo: la versión del corpus en Neo4j
+          (doc_id + huella de cada :Document) se revisa como mucho cada
+          `metadata_refresh_interval` segundos, no en cada pregunta
         """
-        with self.driver.session() as session:
-            return [rec["value"] for rec in session.run(query).data()]
+        if self._metadata_index is None or self._metadata_generation != self.neo4j.corpus_generation:
+            self.refresh_metadata()
+            return self._metadata_index
+
+        interval = self.config.metadata_refresh_interval
+        if interval > 0 and time.monotonic() - self._metadata_checked_at >= interval:
+            version = self._graph_version()
+            self._metadata_checked_at = time.monotonic()
+            if version != self._metadata_version:
+                self.refresh_metadata(version)
+        return self._metadata_index
+
+    def refresh_metadata(self, version: str = None):
+        """Recarga la tabla de metadata desde los nodos :Document."""
+        # Se toma antes de leer: una escritura concurrente fuerza otra recarga
+        generation = self.neo4j.corpus_generation
+        records = self.neo4j.execute_read(
+            """
+            MATCH (d:Document)
+            RETURN d.doc_id AS doc_id, d {.*} AS props
+            ORDER BY d.doc_id
+            """
+        )
+        self._metadata_index = DocumentMetadataIndex.from_records(
+            {"doc_id": rec["doc_id"], **rec["props"]} for rec in records
+        )
+        self._metadata_version = version if version is not None else combine_fingerprints(
+            (rec["doc_id"], rec["props"].get("fingerprint")) for rec in records
+        )
+        self._metadata_generation = generation
+        self._metadata_checked_at = time.monotonic()
+
+    def _graph_version(self) -> str:
+        records = self.neo4j.execute_read(
+            "MATCH (d:Document) RETURN d.doc_id AS doc_id, d.fingerprint AS fingerprint"
+        )
+        return combine_fingerprints((rec["doc_id"], rec["fingerprint"]) for rec in records)
 
     def close(self):
-        self.driver.close()
+        # El driver es compartido (Neo4jDriverManager); no se cierra aquí.
+        pass
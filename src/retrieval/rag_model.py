@@ -1,11 +1,23 @@
 import os
-from typing import List
+import time
+import asyncio
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Tuple, Union
 from langchain_core.documents import Document
 
-from src.indexing.document_processor import DocumentProcessor
-from src.indexing.neo4j_graph_indexer import Neo4jGraphIndexer
-from src.retrieval.neo4j_graph_retriever import Neo4jGraphRetriever
+from src.indexing.chunk_embeddings import ChunkEmbeddings, unpack_chunks
+from src.indexing.document_processor import DocumentProcessor, corpus_version
+from src.indexing.metadata_index import DocumentMetadataIndex
+from src.retrieval.answer_cache import SemanticAnswerCache
+from src.retrieval.context_packer import ContextPacker
+from src.retrieval.conversation_memory import ConversationMemory
 from src.config import RAGConfig
+from src.deadline import Deadline
+from src.metrics import REGISTRY
+
+RAG_REQUESTS = REGISTRY.counter("rag_requests_total", "Consultas RAG por origen de la respuesta")
+RAG_REQUEST_SECONDS = REGISTRY.histogram("rag_request_seconds", "Latencia de extremo a extremo de la consulta RAG")
+RAG_TTFT_SECONDS = REGISTRY.histogram("rag_ttft_seconds", "Tiempo al primer token en streaming")
+RAG_STREAM_TOKENS = REGISTRY.counter("rag_stream_tokens_total", "Fragmentos de texto recibidos del LLM en streaming")
 
 
 class RAGModel:
@@ -15,30 +27,349 @@ class RAGModel:
     - Neo4jGraphRetriever for contextual search
     """
 
-    def __init__(self, config: RAGConfig, documents: List[Document]):
+    def __init__(self, config: RAGConfig, documents: Union[ChunkEmbeddings, List[Document]]):
         self.config = config
-        self.chunk_docs = documents or []
+        # Con el artefacto de la ingesta (ChunkEmbeddings) no se vuelve a embeber nada
+        self.chunk_docs, chunks = unpack_chunks(documents)
+        # Se conserva para la siguiente versión del índice (reutiliza embeddings sin cambios)
+        self.chunk_embeddings = chunks
 
         from src.retrieval.faiss_retriever import LocalFAISSRetriever
 
-        # Embedder
+        # Embedder: el mismo que calculó los embeddings de los chunks
         self.doc_processor = DocumentProcessor(self.config)
-        self.embedder = self.doc_processor.get_embeddings()
+        self.embedder = chunks.embedder if chunks else self.doc_processor.get_embeddings()
 
         # Local retriever para NAIVE RAG
         self.retriever = LocalFAISSRetriever(
             self.embedder,
             self.chunk_docs,
-            top_k=self.config.num_retrieved_docs
+            top_k=self.config.num_retrieved_docs,
+            embeddings=chunks.vectors if chunks else None
         )
 
-    def retrieve_context(self, query: str) -> List[Document]:
+        # Contexto del prompt: une vecinos, quita duplicados y respeta el presupuesto de tokens
+        self.context_packer = ContextPacker.from_config(self.config)
+
+        # Tabla de metadata por documento (autor, año, DOI...) construida una vez
+        self.metadata_index = DocumentMetadataIndex.from_documents(self.chunk_docs)
+
+        # Caché semántica de respuestas, válida solo para esta versión del corpus
+        self.corpus_version = corpus_version(self.config, self.chunk_docs)
+        self.answer_cache = SemanticAnswerCache.get_shared(
+            max_size=self.config.answer_cache_size,
+            threshold=self.config.answer_cache_threshold,
+            ttl=self.config.answer_cache_ttl
+        )
+
+    def retrieve_context(self, query: str, deadline: Optional[Deadline] = None) -> List[Document]:
         """Retrieve relevant chunks using Neo4j graph similarity search."""
+        if deadline is not None:
+            deadline.check("recuperación")
         return self.retriever.retrieve(query)
 
-    def generate_response(self, query: str) -> str:
-        """Must be implemented by the child RAG class (e.g., GPTRAG or LocalRAG)."""
-        raise NotImplementedError("generate_response() must be implemented by a subclass.")
+    async def aretrieve_context(self, query: str, deadline: Optional[Deadline] = None) -> List[Document]:
+        """Versión async de retrieve_context."""
+        if deadline is not None:
+            deadline.check("recuperación")
+        return await self.retriever.aretrieve(query)
+
+    def generate_response(self, query: str, deadline: Optional[Deadline] = None,
+                          memory: Optional[Union[ConversationMemory, List[Dict]]] = None) -> str:
+        """
+        Genera la respuesta completa (bloquea hasta que el LLM termina).
+        `deadline` acota toda la solicitud; por defecto config.request_timeout.
+        `memory` es el historial de la sesión (ConversationMemory); por defecto
+        self.memory (CLI).
+        """
+        deadline = deadline or Deadline.after(self.config.request_timeout)
+        memory = self.memory if memory is None else memory
+        start = time.perf_counter()
+        try:
+            history = self._history(memory)
+            cached = self._cached_answer(query, history)
+            if cached is not None:
+                self._remember(query, cached, memory)
+                self._observe("answer_cache", start)
+                return cached
+
+            messages, answer = self._build_messages(query, deadline, history)
+            if messages is None:
+                self._observe("direct", start)
+                return answer
+
+            deadline.check("generación")
+            response = self._complete(messages, deadline)
+        except Exception:
+            self._observe("error", start)
+            raise
+
+        self._remember(query, response, memory)
+        self._cache_answer(query, response, history)
+        self._observe("llm", start)
+        return response
+
+    def generate_response_stream(self, query: str, deadline: Optional[Deadline] = None,
+                                 memory: Optional[Union[ConversationMemory, List[Dict]]] = None) -> Iterator[str]:
+        """Genera la respuesta token a token conforme llega del LLM."""
+        deadline = deadline or Deadline.after(self.config.request_timeout)
+        memory = self.memory if memory is None else memory
+        start = time.perf_counter()
+        try:
+            history = self._history(memory)
+            cached = self._cached_answer(query, history)
+            if cached is not None:
+                self._remember(query, cached, memory)
+                self._observe("answer_cache", start)
+                yield cached
+                return
+
+            messages, answer = self._build_messages(query, deadline, history)
+            if messages is None:
+                self._observe("direct", start)
+                yield answer
+                return
+
+            deadline.check("generación")
+            parts = []
+            for token in self._stream(messages, deadline):
+                if not parts:
+                    RAG_TTFT_SECONDS.observe(time.perf_counter() - start, model=self._metrics_label())
+                parts.append(token)
+                yield token
+        except Exception:
+            self._observe("error", start)
+            raise
+
+        RAG_STREAM_TOKENS.inc(len(parts), model=self._metrics_label())
+        response = "".join(parts)
+        self._remember(query, response, memory)
+        self._cache_answer(query, response, history)
+        self._observe("llm", start)
+
+    async def agenerate_response(self, query: str, deadline: Optional[Deadline] = None,
+                                 memory: Optional[Union[ConversationMemory, List[Dict]]] = None) -> str:
+        """
+        Versión async de generate_response: embedding, recuperación y LLM se
+        esperan sin ocupar un hilo, así que un solo event loop sostiene
+        cientos de consultas en vuelo.
+        """
+        deadline = deadline or Deadline.after(self.config.request_timeout)
+        memory = self.memory if memory is None else memory
+        start = time.perf_counter()
+        try:
+            history = self._history(memory)
+            cached = await self._acached_answer(query, history)
+            if cached is not None:
+                self._remember(query, cached, memory)
+                self._observe("answer_cache", start)
+                return cached
+
+            messages, answer = await self._abuild_messages(query, deadline, history)
+            if messages is None:
+                self._observe("direct", start)
+                return answer
+
+            deadline.check("generación")
+            response = await self._acomplete(messages, deadline)
+        except Exception:
+            self._observe("error", start)
+            raise
+
+        self._remember(query, response, memory)
+        await self._acache_answer(query, response, history)
+        self._observe("llm", start)
+        return response
+
+    async def agenerate_response_stream(self, query: str, deadline: Optional[Deadline] = None,
+                                        memory: Optional[Union[ConversationMemory, List[Dict]]] = None) -> AsyncIterator[str]:
+        """Versión async de generate_response_stream."""
+        deadline = deadline or Deadline.after(self.config.request_timeout)
+        memory = self.memory if memory is None else memory
+        start = time.perf_counter()
+        try:
+            history = self._history(memory)
+            cached = await self._acached_answer(query, history)
+            if cached is not None:
+                self._remember(query, cached, memory)
+                self._observe("answer_cache", start)
+                yield cached
+                return
+
+            messages, answer = await self._abuild_messages(query, deadline, history)
+            if messages is None:
+                self._observe("direct", start)
+                yield answer
+                return
+
+            deadline.check("generación")
+            parts = []
+            async for token in self._astream(messages, deadline):
+                if not parts:
+                    RAG_TTFT_SECONDS.observe(time.perf_counter() - start, model=self._metrics_label())
+                parts.append(token)
+                yield token
+        except Exception:
+            self._observe("error", start)
+            raise
+
+        RAG_STREAM_TOKENS.inc(len(parts), model=self._metrics_label())
+        response = "".join(parts)
+        self._remember(query, response, memory)
+        await self._acache_answer(query, response, history)
+        self._observe("llm", start)
+
+    def _build_messages(self, query: str, deadline: Deadline,
+                        memory: List[Dict]) -> Tuple[Optional[List[Dict]], Optional[str]]:
+        """
+        Recupera el contexto y arma el prompt con `_compose`.
+        `memory` es el historial (lista de mensajes) que se antepone al prompt.
+        Devuelve (messages, None) para llamar al LLM, o (None, respuesta)
+        cuando se responde sin LLM (metadatos o "No encontrado").
+        """
+        return self._compose(query, self.retrieve_context(query, deadline), memory)
+
+    async def _abuild_messages(self, query: str, deadline: Deadline,
+                               memory: List[Dict]) -> Tuple[Optional[List[Dict]], Optional[str]]:
+        """Versión async de _build_messages."""
+        retrieved_docs = await self.aretrieve_context(query, deadline)
+        # Empaquetado del contexto (CPU) en el executor: el event loop solo espera E/S
+        return await asyncio.to_thread(self._compose, query, retrieved_docs, memory)
+
+    def _compose(self, query: str, retrieved_docs: List[Document],
+                 memory: List[Dict]) -> Tuple[Optional[List[Dict]], Optional[str]]:
+        """
+        Must be implemented by the child RAG class (e.g., GPTRAG or LocalRAG).
+        Arma los mensajes a partir de los documentos recuperados (sin E/S).
+        """
+        raise NotImplementedError("_compose() must be implemented by a subclass.")
+
+    def _llm_params(self, deadline: Deadline) -> Dict:
+        """
+        Must be implemented by the child RAG class.
+        Modelo y parámetros de la llamada a `self.llm` (el LLMClient compartido del backend).
+        """
+        raise NotImplementedError("_llm_params() must be implemented by a subclass.")
+
+    def _complete(self, messages: List[Dict], deadline: Deadline) -> str:
+        """Llamada bloqueante al LLM del subclass (timeout = tiempo restante)."""
+        return self.llm.complete(messages, **self._llm_params(deadline))
+
+    def _stream(self, messages: List[Dict], deadline: Deadline) -> Iterator[str]:
+        """Llamada en streaming al LLM del subclass (yield de cada token)."""
+        yield from self.llm.stream(messages, **self._llm_params(deadline))
+
+    async def _acomplete(self, messages: List[Dict], deadline: Deadline) -> str:
+        """Llamada al cliente async del LLM del subclass."""
+        return await self.llm.acomplete(messages, **self._llm_params(deadline))
+
+    async def _astream(self, messages: List[Dict], deadline: Deadline) -> AsyncIterator[str]:
+        """Streaming con el cliente async del LLM del subclass (async generator)."""
+        async for token in self.llm.astream(messages, **self._llm_params(deadline)):
+            yield token
+
+    def _use_answer_cache(self, history: List[Dict]) -> bool:
+        # La clave es solo la consulta: con historial, la misma pregunta
+        # ("¿y en la segunda sección?") depende de la conversación
+        return self.answer_cache.enabled and not history
+
+    def _cached_answer(self, query: str, history: List[Dict]) -> Optional[str]:
+        """
+        Respuesta previa a una consulta equivalente (misma clase RAG y versión
+        del corpus), solo para consultas sin historial. El embedding se
+        reutiliza luego en la recuperación.
+        """
+        if not self._use_answer_cache(history):
+            return None
+        hit = self.answer_cache.lookup(
+            self._answer_namespace(), self.corpus_version, self.embedder.embed_query(query)
+        )
+        return hit[0] if hit is not None else None
+
+    def _cache_answer(self, query: str, response: str, history: List[Dict]):
+        if not self._use_answer_cache(history) or not response:
+            return
+        self.answer_cache.put(
+            self._answer_namespace(), self.corpus_version, query,
+            self.embedder.embed_query(query), response
+        )
+
+    async def _acached_answer(self, query: str, history: List[Dict]) -> Optional[str]:
+        if not self._use_answer_cache(history):
+            return None
+        hit = self.answer_cache.lookup(
+            self._answer_namespace(), self.corpus_version, await self.embedder.aembed_query(query)
+        )
+        return hit[0] if hit is not None else None
+
+    async def _acache_answer(self, query: str, response: str, history: List[Dict]):
+        if not self._use_answer_cache(history) or not response:
+            return
+        self.answer_cache.put(
+            self._answer_namespace(), self.corpus_version, query,
+            await self.embedder.aembed_query(query), response
+        )
+
+    def _observe(self, source: str, start: float):
+        """Registra la consulta en las métricas según de dónde salió la respuesta."""
+        model = self._metrics_label()
+        RAG_REQUESTS.inc(model=model, source=source)
+        RAG_REQUEST_SECONDS.observe(time.perf_counter() - start, model=model, source=source)
+
+    def _metrics_label(self) -> str:
+        cls = type(self)
+        return f"{cls.__module__.rsplit('.', 1)[-1]}.{cls.__name__}"
+
+    def _answer_namespace(self) -> str:
+        cls = type(self)
+        return f"{cls.__module__}.{cls.__qualname__}"
+
+    def new_memory(self) -> ConversationMemory:
+        """Historial acotado para una conversación nueva (CLI o sesión del servicio)."""
+        return ConversationMemory(
+            token_budget=self.config.memory_token_budget,
+            window_turns=self.config.memory_window_turns,
+            summarizer=self._summarize if self.config.memory_summarize else None
+        )
+
+    def _summarize(self, summary: str, turns: List[Dict]) -> str:
+        """Resume turnos antiguos con el mismo LLM del subclass (corre en segundo plano)."""
+        transcript = "\n".join(
+            f"{'Usuario' if m['role'] == 'user' else 'Asistente'}: {m['content']}" for m in turns
+        )
+        prompt = (
+            "Resume la siguiente conversación entre un usuario y un asistente en un "
+            "párrafo breve. Conserva nombres, cifras, páginas citadas y preguntas "
+            "pendientes; no agregues información nueva.\n\n"
+            f"Resumen previo:\n{summary or '(ninguno)'}\n\n"
+            f"Turnos nuevos:\n{transcript}\n"
+        )
+        deadline = Deadline.after(self.config.request_timeout)
+        return self._complete([{"role": "user", "content": prompt}], deadline)
+
+    @staticmethod
+    def _history(memory: Union[ConversationMemory, List[Dict]]) -> List[Dict]:
+        # Una lista simple de mensajes se antepone tal cual (sin tope)
+        return memory.messages() if isinstance(memory, ConversationMemory) else list(memory)
+
+    def _remember(self, query: str, response: str, memory: Union[ConversationMemory, List[Dict]]):
+        """Guardar historial"""
+        if isinstance(memory, ConversationMemory):
+            memory.add_turn(query, response)
+            return
+        memory.append({"role": "user", "content": query})
+        memory.append({"role": "assistant", "content": response})
+
+    def release(self):
+        """
+        Libera el índice de esta instancia (chunks, embeddings, metadata).
+        Lo llama IndexVersions cuando termina el último lector de una versión
+        reemplazada; las memorias de sesión pueden seguir resumiendo con el LLM.
+        """
+        self.retriever = None
+        self.chunk_docs = []
+        self.chunk_embeddings = None
+        self.metadata_index = DocumentMetadataIndex()
 
     def close(self):
         """Safe close of Neo4j connections."""
@@ -0,0 +1,252 @@
+import time
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Dict, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+from src.config import RAGConfig
+from src.deadline import Deadline
+from src.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+RETRIEVAL_ROUTES = REGISTRY.counter(
+    "rag_retrieval_routes_total",
+    "Consultas de Graph-RAG según las fuentes que aportaron resultados"
+)
+BREAKER_TRIPS = REGISTRY.counter("rag_graph_breaker_trips_total", "Aperturas del circuit breaker del grafo")
+
+# Constante de Reciprocal Rank Fusion (valor habitual de la literatura)
+RRF_K = 60
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker para el retriever de grafo.
+
+    - closed    : se consulta normalmente
+    - open      : tras `failure_threshold` fallos seguidos (error o fuera de
+                  presupuesto) no se consulta durante `cooldown` segundos
+    - half_open : pasado el cooldown se deja pasar una sola consulta de prueba;
+                  si responde a tiempo se cierra, si no se vuelve a abrir
+    """
+
+    def __init__(self, failure_threshold: int = 3, cooldown: float = 30.0):
+        self.failure_threshold = max(failure_threshold, 1)
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.cooldown:
+                self.state = "half_open"
+                self._probing = False
+            if self.state == "half_open" and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    BREAKER_TRIPS.inc()
+                self.state = "open"
+                self.opened_at = time.monotonic()
+                self._probing = False
+
+    def release_probe(self):
+        """La consulta permitida no llegó a probar el grafo: no cuenta como éxito ni como fallo."""
+        with self._lock:
+            self._probing = False
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"state": self.state, "open": int(self.state == "open"), "failures": self.failures}
+
+
+class RetrievalOrchestrator:
+    """
+    Recuperación de Graph-RAG: búsqueda densa local (FAISS) y búsqueda en el
+    grafo en paralelo, fusionadas con Reciprocal Rank Fusion.
+
+    - El grafo tiene un presupuesto de latencia por consulta
+      (`graph_latency_budget_ms`, acotado por el deadline); si no responde a
+      tiempo o falla, se usa solo el resultado denso
+    - Un circuit breaker deja de consultar el grafo tras fallos repetidos y
+      lo vuelve a probar pasado el cooldown
+    - Si el grafo responde y la búsqueda densa falla, se usa solo el grafo
+    """
+
+    def __init__(self, config: RAGConfig, dense, graph):
+        self.config = config
+        self.dense = dense
+        self.graph = graph
+        self.graph_budget = config.graph_latency_budget_ms / 1000.0
+        self.breaker = CircuitBreaker(
+            failure_threshold=config.graph_breaker_failures,
+            cooldown=config.graph_breaker_cooldown
+        )
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+
+    # ------------------------------------------------------------------
+    # Síncrono (CLI)
+    # ------------------------------------------------------------------
+    def retrieve(self, query: str, k: int = None, deadline: Deadline = None) -> List[Document]:
+        k = k or self.config.num_retrieved_docs
+        deadline = deadline or Deadline.after(self.config.request_timeout)
+
+        graph_future, graph_deadline, own_budget = None, None, False
+        if not deadline.expired and self.breaker.allow():
+            graph_deadline, own_budget = self._graph_deadline(deadline)
+            graph_future = self._pool().submit(self.graph.retrieve, query, k=k, deadline=graph_deadline)
+
+        dense_docs, dense_error = None, None
+        try:
+            dense_docs = self.dense.retrieve(query)
+        except Exception as e:
+            dense_error = e
+
+        graph_docs = None
+        if graph_future is not None:
+            try:
+                graph_docs = graph_future.result(timeout=graph_deadline.remaining())
+                self.breaker.record_success()
+            except FutureTimeout:
+                # La transacción en Neo4j ya lleva el mismo timeout: el hilo se libera solo
+                graph_future.cancel()
+                self._graph_failed("fuera de presupuesto", counts=own_budget)
+            except Exception as e:
+                self._graph_failed(e, counts=own_budget or not graph_deadline.expired)
+
+        return self._fuse(dense_docs, graph_docs, dense_error, k)
+
+    # ------------------------------------------------------------------
+    # Async (servicio)
+    # ------------------------------------------------------------------
+    async def aretrieve(self, query: str, k: int = None, deadline: Deadline = None) -> List[Document]:
+        k = k or self.config.num_retrieved_docs
+        deadline = deadline or Deadline.after(self.config.request_timeout)
+
+        graph_task, graph_deadline, own_budget = None, None, False
+        if not deadline.expired and self.breaker.allow():
+            graph_deadline, own_budget = self._graph_deadline(deadline)
+            graph_task = asyncio.ensure_future(asyncio.wait_for(
+                self.graph.aretrieve(query, k=k, deadline=graph_deadline),
+                timeout=graph_deadline.remaining()
+            ))
+
+        dense_docs, dense_error = None, None
+        try:
+            dense_docs = await self.dense.aretrieve(query)
+        except Exception as e:
+            dense_error = e
+
+        graph_docs = None
+        if graph_task is not None:
+            try:
+                graph_docs = await graph_task
+                self.breaker.record_success()
+            except asyncio.TimeoutError:
+                self._graph_failed("fuera de presupuesto", counts=own_budget)
+            except Exception as e:
+                self._graph_failed(e, counts=own_budget or not graph_deadline.expired)
+
+        return self._fuse(dense_docs, graph_docs, dense_error, k)
+
+    # ------------------------------------------------------------------
+    # Fusión
+    # ------------------------------------------------------------------
+    def _fuse(self, dense_docs, graph_docs, dense_error, k: int) -> List[Document]:
+        if dense_docs is None and graph_docs is None:
+            # Ninguna fuente respondió: el generador decide (p. ej. "No encontrado")
+            raise dense_error or RuntimeError("Sin resultados de recuperación")
+        if graph_docs is None:
+            RETRIEVAL_ROUTES.inc(route="dense_only")
+            return dense_docs[:k]
+        if dense_docs is None:
+            RETRIEVAL_ROUTES.inc(route="graph_only")
+            return graph_docs[:k]
+
+        RETRIEVAL_ROUTES.inc(route="fused")
+        return reciprocal_rank_fusion([graph_docs, dense_docs], k)
+
+    def _graph_deadline(self, deadline: Deadline) -> Tuple[Deadline, bool]:
+        """
+        Presupuesto del grafo: el menor entre el suyo y lo que le queda a la
+        solicitud. El bool indica si manda el presupuesto propio del grafo.
+        """
+        own = time.monotonic() + self.graph_budget
+        return Deadline(min(deadline.expires_at, own)), own <= deadline.expires_at
+
+    def _graph_failed(self, reason, counts: bool = True):
+        """
+        Solo cuenta para el circuit breaker si el grafo agotó su propio
+        presupuesto o falló; si lo que se agotó fue el deadline de la solicitud
+        (etapas anteriores lentas), el grafo se omite sin culparlo.
+        """
+        if not counts:
+            logger.info(f"Recuperación por grafo omitida por el deadline de la solicitud: {reason}")
+            self.breaker.release_probe()
+            return
+        logger.warning(f"Recuperación por grafo omitida: {reason}")
+        self.breaker.record_failure()
+
+    def _pool(self) -> ThreadPoolExecutor:
+        # Se crea al primer uso (después del fork de los workers del servicio)
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.config.neo4j_max_pool_size,
+                    thread_name_prefix="graph-retrieval"
+                )
+            return self._executor
+
+    def close(self):
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+
+    def stats(self) -> Dict:
+        return {"graph_budget_ms": self.graph_budget * 1000, **self.breaker.stats()}
+
+
+def reciprocal_rank_fusion(rankings: List[List[Document]], k: int) -> List[Document]:
+    """
+    Fusiona listas ordenadas: cada chunk suma 1 / (RRF_K + posición) por lista.
+    Los chunks se identifican por su texto (es el mismo en FAISS y en el grafo).
+    """
+    scores: Dict[str, float] = {}
+    docs: Dict[str, Document] = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking):
+            key = doc.page_content
+            scores[key] = scores.get(key, 0.0) + 1.0 / (RRF_K + rank + 1)
+            # Se conserva la primera copia (el grafo trae chunk_id y rerank_score)
+            docs.setdefault(key, doc)
+
+    fused = []
+    for key in sorted(scores, key=scores.get, reverse=True)[:k]:
+        doc = docs[key]
+        metadata = dict(doc.metadata)
+        metadata["fusion_score"] = scores[key]
+        fused.append(Document(page_content=doc.page_content, metadata=metadata))
+    return fused
@@ -0,0 +1,69 @@
+import numpy as np
+from langchain_core.documents import Document
+
+from src.config import RAGConfig
+from src.indexing.chunk_embeddings import ChunkEmbeddings
+from src.retrieval.answer_cache import SemanticAnswerCache
+from src.retrieval.rag_model import RAGModel
+
+
+class FakeEmbeddings:
+    def embed_query(self, text):
+        return [1.0, float(len(text) % 7), 0.5]
+
+    def embed_documents(self, texts):
+        return [self.embed_query(t) for t in texts]
+
+
+class EchoRAG(RAGModel):
+    def __init__(self, config, documents):
+        super().__init__(config, documents)
+        self.memory = []
+        self.calls = 0
+
+    def _compose(self, query, retrieved_docs, memory):
+        return memory + [{"role": "user", "content": query}], None
+
+    def _complete(self, messages, deadline):
+        self.calls += 1
+        return f"respuesta {self.calls} con {len(messages) - 1} mensajes previos"
+
+
+def _rag():
+    config = RAGConfig()
+    docs = [Document(page_content="texto del artículo", metadata={"doc_id": "a.pdf", "page_number": 1})]
+    rag = EchoRAG(config, ChunkEmbeddings.embed(FakeEmbeddings(), docs))
+    rag.answer_cache = SemanticAnswerCache(max_size=16, threshold=0.99, ttl=60)
+    return rag
+
+
+def test_follow_up_with_history_skips_the_answer_cache():
+    rag = _rag()
+    assert rag.generate_response("¿y en la segunda sección?", memory=[]) == "respuesta 1 con 0 mensajes previos"
+
+    # Otra sesión con historial: la misma pregunta no debe salir de la caché ni guardarse en ella
+    history = [{"role": "user", "content": "¿de qué trata?"}, {"role": "assistant", "content": "De RAG."}]
+    assert rag.generate_response("¿y en la segunda sección?", memory=history) == "respuesta 2 con 2 mensajes previos"
+
+    # Sin historial sí se reutiliza la primera respuesta
+    assert rag.generate_response("¿y en la segunda sección?", memory=[]) == "respuesta 1 con 0 mensajes previos"
+    assert rag.calls == 2
+
+
+def test_coexisting_corpus_versions_keep_their_entries():
+    cache = SemanticAnswerCache(max_size=16, threshold=0.99, ttl=60)
+    vector = [1.0, 0.0]
+    cache.put("rag", "v1", "q", vector, "respuesta v1")
+    cache.put("rag", "v2", "q", vector, "respuesta v2")
+
+    # Alternar entre las dos versiones vivas (reemplazo en caliente) no descarta nada
+    for _ in range(3):
+        assert cache.lookup("rag", "v1", vector)[0] == "respuesta v1"
+        assert cache.lookup("rag", "v2", vector)[0] == "respuesta v2"
+    assert cache.invalidations == 0
+
+    # Una tercera versión desplaza a la usada hace más tiempo
+    cache.put("rag", "v3", "q", vector, "respuesta v3")
+    assert cache.lookup("rag", "v1", vector) is None
+    assert cache.lookup("rag", "v2", vector)[0] == "respuesta v2"
+    assert cache.invalidations == 1
@@ -0,0 +1,48 @@
+from langchain_core.documents import Document
+
+from src.retrieval.context_packer import ContextPacker, estimate_tokens
+
+
+def _chunk(text, start, score, page=1):
+    return Document(
+        page_content=text,
+        metadata={"doc_id": "a.pdf", "page_number": page, "start_index": start, "similarity_score": score},
+    )
+
+
+def _words(prefix, chars):
+    text, i = "", 0
+    while len(text) < chars:
+        text += f"{prefix}{i} "
+        i += 1
+    return text[:chars]
+
+
+def test_merged_span_larger_than_budget_is_truncated_not_dropped():
+    # 12 chunks adyacentes de 500 caracteres se unen en un tramo de ~1500 tokens
+    docs = [_chunk(_words(f"p{i}w", 500), i * 500, score=0.5) for i in range(12)]
+    docs[7] = _chunk(_words("respuesta", 500), 7 * 500, score=0.9)
+
+    packed = ContextPacker(token_budget=1024).pack(docs)
+
+    assert len(packed) == 1
+    assert estimate_tokens(packed[0].page_content) <= 1024
+    assert packed[0].metadata["truncated"] is True
+    # El recorte conserva el chunk más relevante
+    assert "respuesta1 respuesta2" in packed[0].page_content
+
+
+def test_single_chunk_over_budget_is_kept():
+    docs = [_chunk(_words("w", 1000), 0, score=0.9)]
+    packed = ContextPacker(token_budget=100).pack(docs)
+
+    assert len(packed) == 1
+    assert 0 < estimate_tokens(packed[0].page_content) <= 100
+
+
+def test_spans_that_fit_are_not_truncated():
+    docs = [_chunk(_words("a", 200), 0, 0.9, page=1), _chunk(_words("b", 200), 0, 0.8, page=2)]
+    packed = ContextPacker(token_budget=1024).pack(docs)
+
+    assert [d.page_content for d in packed] == [docs[0].page_content, docs[1].page_content]
+    assert not any(d.metadata.get("truncated") for d in packed)
@@ -0,0 +1,31 @@
+import os
+
+import pytest
+
+from src.retrieval.embedding_batcher import MicroBatchingEmbedder
+
+
+class FakeEmbeddings:
+    def embed_documents(self, texts):
+        return [[float(len(t)), 1.0] for t in texts]
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="requiere os.fork")
+def test_embed_query_in_forked_child():
+    batcher = MicroBatchingEmbedder(FakeEmbeddings(), max_wait_ms=1)
+    # El hilo de batching arranca en el padre (como _setup_vector_index en load_pipeline)
+    assert batcher.embed_query("A") == [1.0, 1.0]
+
+    pid = os.fork()
+    if pid == 0:
+        code = 1
+        try:
+            # Sin el reinicio tras el fork esto esperaría para siempre
+            if batcher.submit("hola").result(timeout=5) == [4.0, 1.0]:
+                code = 0
+        finally:
+            os._exit(code)
+
+    _, status = os.waitpid(pid, 0)
+    assert os.WEXITSTATUS(status) == 0
+    assert batcher.embed_query("padre") == [5.0, 1.0]
@@ -0,0 +1,89 @@
+import gc
+import threading
+import weakref
+
+from src.retrieval.index_versions import IndexVersions
+
+
+class FakeRAG:
+    def __init__(self, number):
+        self.number = number
+        self.released = False
+
+    def release(self):
+        self.released = True
+
+
+class SharedIndexer:
+    supports_hot_swap = False
+
+    def release(self):
+        pass
+
+
+def _wait_for_build(versions):
+    while versions.stats()["building"]:
+        threading.Event().wait(0.01)
+
+
+def test_in_flight_reader_keeps_old_version_until_it_finishes():
+    versions = IndexVersions(lambda number, previous: (FakeRAG(number), None, "naive", "gpt"))
+    old = versions.load()
+
+    with versions.acquire() as reading:
+        assert versions.reload()
+        _wait_for_build(versions)
+        assert versions.current.number == 2
+        # La consulta en curso sigue con su versión, que aún no se libera
+        assert reading is old and not old.rag.released
+
+    assert old.rag.released
+    with versions.acquire() as version:
+        assert version.number == 2
+
+
+def test_reload_refused_for_shared_index():
+    versions = IndexVersions(lambda number, previous: (FakeRAG(number), SharedIndexer(), "graph", "gpt"))
+    versions.load()
+
+    assert versions.reload_unsupported() is not None
+    assert not versions.reload()
+    assert versions.current.number == 1
+    assert versions.stats()["hot_reload"] == 0
+
+
+class FakeEmbeddings:
+    def embed_query(self, text):
+        return [1.0, float(len(text) % 7), 0.5]
+
+    def embed_documents(self, texts):
+        return [self.embed_query(t) for t in texts]
+
+
+def test_retired_version_vectors_are_freed_after_last_reader():
+    from langchain_core.documents import Document
+
+    from src.config import RAGConfig
+    from src.generation.local_rag import LocalRAG
+    from src.indexing.chunk_embeddings import ChunkEmbeddings
+
+    def build(number, previous):
+        docs = [Document(page_content=f"chunk {number}-{i}", metadata={"doc_id": "a.pdf", "page_number": 1})
+                for i in range(3)]
+        return LocalRAG(RAGConfig(), ChunkEmbeddings.embed(FakeEmbeddings(), docs)), None, "naive", "local"
+
+    versions = IndexVersions(build)
+    old = versions.load()
+    vectors = weakref.ref(old.rag.chunk_embeddings.vectors)
+    # Una sesión abierta conserva la instancia a través del resumidor de su memoria
+    memory = old.rag.new_memory()
+
+    with versions.acquire():
+        assert versions.reload()
+        _wait_for_build(versions)
+        gc.collect()
+        assert vectors() is not None
+
+    gc.collect()
+    assert memory is not None and old.rag is not None
+    assert vectors() is None
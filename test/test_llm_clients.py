@@ -0,0 +1,40 @@
+import asyncio
+import threading
+
+from src.config import RAGConfig
+from src.generation.llm_clients import LLMClient
+
+
+def test_close_without_a_loop_closes_both_pools():
+    client = LLMClient(RAGConfig(), "local")
+    client.close()
+    assert client.client.is_closed()
+    assert client.async_client.is_closed()
+
+
+def test_close_runs_on_the_loop_that_owns_the_async_pool():
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    try:
+        client = LLMClient(RAGConfig(), "local")
+        # Primera llamada async en el loop del otro hilo: ese loop queda como dueño
+        asyncio.run_coroutine_threadsafe(client._acount_attempt(None), loop).result(timeout=5)
+        assert client._loop is loop
+
+        client.close()
+        assert client.client.is_closed()
+        assert client.async_client.is_closed()
+    finally:
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout=5)
+        loop.close()
+
+
+def test_aclose_all_closes_the_shared_clients():
+    client = LLMClient.get_instance(RAGConfig(), "local")
+    asyncio.run(LLMClient.aclose_all())
+    assert client.client.is_closed()
+    assert client.async_client.is_closed()
+    assert LLMClient.get_instance(RAGConfig(), "local") is not client
+    LLMClient.close_all()
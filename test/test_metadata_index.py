@@ -0,0 +1,71 @@
+import time
+
+from src.config import RAGConfig
+from src.indexing.metadata_index import DocumentMetadataIndex
+from src.indexing.neo4j_connection import Neo4jDriverManager
+from src.retrieval.neo4j_graph_retriever import Neo4jGraphRetriever
+
+
+def test_mixed_value_types_share_one_entry():
+    index = DocumentMetadataIndex()
+    index.add("a.pdf", {"year": 2020, "doi": "10.1/a"})
+    index.add("b.pdf", {"year": "2020", "doi": "10.1/b"})
+
+    assert index.values("year") == [2020]
+    assert index.lookup("year", "2020") == ["a.pdf", "b.pdf"]
+
+    # Quitar los documentos en cualquier orden deja la tabla consistente
+    index.remove("a.pdf")
+    assert index.values("year") == [2020]
+    assert index.lookup("year", 2020) == ["b.pdf"]
+    index.remove("b.pdf")
+    assert index.values("year") == []
+    assert index.lookup("year", 2020) == []
+
+
+class FakeNeo4j:
+    def __init__(self):
+        self.documents = {}
+        self.reads = 0
+        self.corpus_generation = 0
+
+    def execute_read(self, query, **params):
+        self.reads += 1
+        if "d {.*}" in query:
+            return [{"doc_id": doc_id, "props": dict(props)} for doc_id, props in sorted(self.documents.items())]
+        return [{"doc_id": doc_id, "fingerprint": props["fingerprint"]} for doc_id, props in self.documents.items()]
+
+
+def _retriever(monkeypatch, interval):
+    graph = FakeNeo4j()
+    monkeypatch.setattr(Neo4jDriverManager, "get_instance", classmethod(lambda cls, config: graph))
+    config = RAGConfig()
+    config.metadata_refresh_interval = interval
+    return Neo4jGraphRetriever(config, embedder=None), graph
+
+
+def test_neo4j_metadata_questions_are_answered_from_memory(monkeypatch):
+    retriever, graph = _retriever(monkeypatch, interval=3600)
+    graph.documents["a.pdf"] = {"fingerprint": "f1", "author_real": "Ana", "year": 2020}
+
+    assert retriever.retrieve_metadata("author_real") == ["Ana"]
+    reads = graph.reads
+    for _ in range(10):
+        assert retriever.retrieve_metadata("year") == [2020]
+    assert graph.reads == reads
+
+    # Este proceso re-indexa el documento (Neo4jGraphIndexer avisa al pool compartido)
+    graph.documents["a.pdf"] = {"fingerprint": "f2", "author_real": "Ana Pérez"}
+    graph.corpus_generation += 1
+    assert retriever.retrieve_metadata("author_real") == ["Ana Pérez"]
+
+
+def test_neo4j_metadata_picks_up_other_processes_after_the_interval(monkeypatch):
+    retriever, graph = _retriever(monkeypatch, interval=0.05)
+    graph.documents["a.pdf"] = {"fingerprint": "f1", "author_real": "Ana"}
+    assert retriever.retrieve_metadata("author_real") == ["Ana"]
+
+    # Otro proceso re-indexa el documento: se detecta en la siguiente revisión
+    graph.documents["a.pdf"] = {"fingerprint": "f2", "author_real": "Ana Pérez"}
+    time.sleep(0.06)
+    assert retriever.retrieve_metadata("author_real") == ["Ana Pérez"]
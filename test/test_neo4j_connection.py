@@ -0,0 +1,23 @@
+import asyncio
+
+import pytest
+
+from src.config import RAGConfig
+from src.deadline import Deadline, DeadlineExceeded
+from src.indexing.neo4j_connection import Neo4jDriverManager
+
+
+def test_expired_deadline_does_not_open_an_unbounded_transaction():
+    # El driver no se conecta al crearse: si se abriera la transacción fallaría por red, no por tiempo
+    config = RAGConfig()
+    config.neo4j_uri = "bolt://localhost:7687"
+    manager = Neo4jDriverManager(config)
+    expired = Deadline.after(0)
+    try:
+        with pytest.raises(DeadlineExceeded):
+            manager.execute_read("RETURN 1", timeout=expired.timeout())
+        with pytest.raises(DeadlineExceeded):
+            asyncio.run(manager.aexecute_read("RETURN 1", timeout=expired.timeout()))
+        assert manager.metrics()["sessions_total"] == 0
+    finally:
+        manager.close()
@@ -0,0 +1,56 @@
+import asyncio
+
+from langchain_core.documents import Document
+
+from src.config import RAGConfig
+from src.generation.local_rag import LocalRAG
+from src.indexing.chunk_embeddings import ChunkEmbeddings
+
+
+class FakeEmbeddings:
+    def embed_query(self, text):
+        return [1.0, float(len(text) % 7), 0.5]
+
+    async def aembed_query(self, text):
+        return self.embed_query(text)
+
+    def embed_documents(self, texts):
+        return [self.embed_query(t) for t in texts]
+
+
+class FakeLLM:
+    def __init__(self):
+        self.calls = []
+
+    def complete(self, messages, **params):
+        self.calls.append(params)
+        return "completo"
+
+    def stream(self, messages, **params):
+        self.calls.append(params)
+        yield from ("par", "cial")
+
+    async def acomplete(self, messages, **params):
+        return self.complete(messages, **params)
+
+    async def astream(self, messages, **params):
+        for token in self.stream(messages, **params):
+            yield token
+
+
+def test_llm_hooks_use_the_subclass_params():
+    docs = [Document(page_content="texto del artículo", metadata={"doc_id": "a.pdf", "page_number": 1})]
+    rag = LocalRAG(RAGConfig(), ChunkEmbeddings.embed(FakeEmbeddings(), docs))
+    rag.llm = FakeLLM()
+    rag.answer_cache.max_size = 0
+
+    assert rag.generate_response("¿qué dice el texto?", memory=[]) == "completo"
+    assert "".join(rag.generate_response_stream("¿qué dice el texto?", memory=[])) == "parcial"
+    assert asyncio.run(rag.agenerate_response("¿qué dice el texto?", memory=[])) == "completo"
+
+    async def collect():
+        return "".join([t async for t in rag.agenerate_response_stream("¿qué dice el texto?", memory=[])])
+    assert asyncio.run(collect()) == "parcial"
+
+    assert len(rag.llm.calls) == 4
+    assert all(call["model"] == "unsloth/deepseek-r1-distill-qwen-7b" for call in rag.llm.calls)
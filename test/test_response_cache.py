@@ -0,0 +1,37 @@
+import asyncio
+
+from src.api.response_cache import CachedResponse, ResponseCache
+
+
+def test_key_ignores_key_order_and_whitespace():
+    a = b'{"model":"m","messages":[{"role":"user","content":"hola"}],"temperature":0}'
+    b = b'{ "temperature": 0,\n  "messages": [ {"content": "hola", "role": "user"} ],\n  "model": "m" }'
+    assert ResponseCache.key(a) == ResponseCache.key(b)
+
+
+def test_key_distinguishes_payloads():
+    a = b'{"model":"m","messages":[{"role":"user","content":"hola"}]}'
+    b = b'{"model":"m","messages":[{"role":"user","content":"adios"}]}'
+    assert ResponseCache.key(a) != ResponseCache.key(b)
+
+
+def test_differently_serialized_duplicates_are_coalesced_and_cached():
+    cache = ResponseCache(ttl=60, max_entries=8)
+    calls = 0
+
+    async def fetch():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return CachedResponse(200, b'{"ok":true}')
+
+    async def run():
+        bodies = [b'{"model":"m","stream":false}', b'{"stream": false, "model": "m"}']
+        first = await asyncio.gather(*(cache.get_or_fetch(ResponseCache.key(b), fetch) for b in bodies))
+        later = await cache.get_or_fetch(ResponseCache.key(b'{ "model" : "m", "stream" : false }'), fetch)
+        return first, later
+
+    first, later = asyncio.run(run())
+    assert calls == 1
+    assert sorted(status for _, status in first) == ["COALESCED", "MISS"]
+    assert later[1] == "HIT"
@@ -0,0 +1,70 @@
+import asyncio
+import time
+
+from langchain_core.documents import Document
+
+from src.config import RAGConfig
+from src.deadline import Deadline
+from src.retrieval.retrieval_orchestrator import RetrievalOrchestrator
+
+
+class Dense:
+    def retrieve(self, query):
+        return [Document(page_content="denso")]
+
+    async def aretrieve(self, query):
+        return self.retrieve(query)
+
+
+class SlowGraph:
+    def __init__(self, delay):
+        self.delay = delay
+
+    def retrieve(self, query, k, deadline):
+        time.sleep(self.delay)
+        return [Document(page_content="grafo")]
+
+    async def aretrieve(self, query, k, deadline):
+        await asyncio.sleep(self.delay)
+        return [Document(page_content="grafo")]
+
+
+def _orchestrator(budget_ms):
+    config = RAGConfig()
+    config.graph_latency_budget_ms = budget_ms
+    return RetrievalOrchestrator(config, dense=Dense(), graph=SlowGraph(0.3))
+
+
+def test_request_deadline_running_out_does_not_count_against_the_graph():
+    orchestrator = _orchestrator(budget_ms=5000)
+    try:
+        docs = orchestrator.retrieve("q", deadline=Deadline.after(0.02))
+        assert [d.page_content for d in docs] == ["denso"]
+        docs = asyncio.run(orchestrator.aretrieve("q", deadline=Deadline.after(0.02)))
+        assert [d.page_content for d in docs] == ["denso"]
+        # Solicitud ya vencida: ni siquiera se consulta el grafo
+        orchestrator.retrieve("q", deadline=Deadline.after(0))
+        assert orchestrator.breaker.failures == 0
+    finally:
+        orchestrator.close()
+
+
+def test_graph_over_its_own_budget_counts_as_failure():
+    orchestrator = _orchestrator(budget_ms=20)
+    try:
+        orchestrator.retrieve("q", deadline=Deadline.after(5))
+        asyncio.run(orchestrator.aretrieve("q", deadline=Deadline.after(5)))
+        assert orchestrator.breaker.failures == 2
+    finally:
+        orchestrator.close()
+
+
+def test_half_open_probe_is_released_when_the_request_runs_out():
+    orchestrator = _orchestrator(budget_ms=5000)
+    try:
+        orchestrator.breaker.state = "half_open"
+        orchestrator.retrieve("q", deadline=Deadline.after(0.02))
+        # La prueba no llegó a medir el grafo: la siguiente consulta puede hacerla
+        assert orchestrator.breaker.allow()
+    finally:
+        orchestrator.close()